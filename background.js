@@ -7,8 +7,140 @@ const CONFIG = {
   wsUrl: "ws://90a34275710b.ngrok-free.app ",
   reconnectDelay: 3000,
   audioChunkSize: 500,
+  // "webm": MediaRecorder (Opus) decodificado pelo ffmpeg no servidor
+  // "pcm": AudioWorklet com Int16 mono 16 kHz, sem encode/decode (mais banda, menos CPU)
+  captureMode: "webm",
+  // Idioma pedido para a tradução dos segmentos confirmados (null: desligada)
+  translationTarget: "en",
 };
 
+// Protocolo binário de áudio (negociado com o servidor via protocol_config)
+// Cabeçalho de 16 bytes: versão (u8) | codec (u8) | flags (u16) | seq (u32) | timestamp ms (u64)
+const AUDIO_FRAME_VERSION = 1;
+const AUDIO_FRAME_HEADER_SIZE = 16;
+const AUDIO_FRAME_CODECS = { webm: 0, "webm-stream": 1, "pcm-s16le": 2 };
+let binaryFrames = false;
+let audioSeq = 0;
+// Horário de envio de cada chunk (seq -> ms), para a latência ponta a ponta real
+const chunkSentAt = new Map();
+const MAX_PENDING_CHUNKS = 200;
+
+// Protocolo de transcrição em deltas: o servidor manda cada segmento confirmado
+// uma vez (com id) e só o trecho mutável a cada chunk. Epoch e último id vistos
+// servem para pedir o que faltou depois de uma reconexão (transcript_resync).
+let deltaTranscript = false;
+let transcriptEpoch = null;
+let lastSegmentId = 0;
+
+// Retomada de sessão: o id vai na URL e o servidor guarda buffer, contexto e
+// idioma por um tempo depois de uma queda. Chunks ficam aqui até o servidor
+// confirmar (seq nas respostas ou last_seq no protocol_ack da reconexão) para
+// serem reenviados. Fragmentos de WebM contínuo não são reenviados: a conexão
+// nova começa outro stream.
+let sessionId = null;
+let sessionReady = false;
+const pendingChunks = new Map(); // seq -> { audio, codec, timestamp, sent }
+const MAX_REPLAY_CHUNKS = 40;
+const PROTOCOL_ACK_TIMEOUT = 1000;
+
+function sessionUrl() {
+  const url = new URL(CONFIG.wsUrl.trim());
+  if (sessionId) url.searchParams.set("session", sessionId);
+  return url.toString();
+}
+
+function sendAudioChunk(seq, chunk) {
+  const chunkTimestamp = Date.now();
+  if (binaryFrames) {
+    // Bytes crus com cabeçalho, sem o overhead de ~33% do base64
+    const frame = buildAudioFrame(
+      seq,
+      chunk.timestamp,
+      chunk.codec,
+      dataUrlToBytes(chunk.audio)
+    );
+    websocket.send(frame);
+    debugStats.audioBytesSent += frame.byteLength;
+  } else {
+    const message = JSON.stringify({
+      type: "audio_chunk",
+      audio: chunk.audio,
+      codec: chunk.codec,
+      seq: seq,
+      duration: debugStats.chunkSize || CONFIG.audioChunkSize,
+      timestamp: chunk.timestamp,
+    });
+    websocket.send(message);
+    debugStats.audioBytesSent += message.length;
+  }
+  chunk.sent = true;
+
+  chunkSentAt.set(seq, chunkTimestamp);
+  if (chunkSentAt.size > MAX_PENDING_CHUNKS) {
+    // Servidor sem seq nas respostas: não acumular indefinidamente
+    chunkSentAt.delete(chunkSentAt.keys().next().value);
+  }
+  debugStats.audioChunksSent++;
+  debugStats.lastChunkTime = chunkTimestamp;
+  debugStats.lastChunkTimestamp = chunkTimestamp; // Guardar timestamp para cálculo de latência
+}
+
+// Envia em ordem de seq o que ainda não foi enviado nesta conexão
+function flushPendingChunks() {
+  for (const [seq, chunk] of pendingChunks) {
+    if (!chunk.sent) sendAudioChunk(seq, chunk);
+    if (chunk.codec === "webm-stream") pendingChunks.delete(seq);
+  }
+}
+
+function acknowledgeChunks(seq) {
+  if (seq === undefined || seq === null) return;
+  for (const pendingSeq of pendingChunks.keys()) {
+    if (pendingSeq <= seq) pendingChunks.delete(pendingSeq);
+  }
+}
+
+function onProtocolAck(data) {
+  if (sessionReady) return;
+  sessionReady = true;
+  if (data?.resumed) {
+    // Sessão retomada: reenviar só o que o servidor não chegou a receber
+    acknowledgeChunks(data.last_seq);
+    for (const chunk of pendingChunks.values()) chunk.sent = false;
+    console.log(
+      `Session resumed (last seq ${data.last_seq}), replaying ${pendingChunks.size} chunks`
+    );
+  } else {
+    // Sessão nova: o que foi enviado antes se perdeu com a anterior
+    for (const [seq, chunk] of pendingChunks) {
+      if (chunk.sent) pendingChunks.delete(seq);
+    }
+  }
+  flushPendingChunks();
+}
+
+function resetTranscriptState() {
+  transcriptEpoch = null;
+  lastSegmentId = 0;
+}
+
+// Só os segmentos ainda não vistos vão para a aba (a reconexão pode repetir alguns)
+function forwardTranscript(segments, tail, receiveTime) {
+  const fresh = (segments || []).filter((segment) => segment.id > lastSegmentId);
+  if (fresh.length > 0) {
+    lastSegmentId = fresh[fresh.length - 1].id;
+  }
+  debugStats.lastTranscription = tail || fresh.map((s) => s.text).join(" ");
+  debugStats.lastTranscriptionTime = receiveTime;
+  if (!currentTabId) return;
+  chrome.tabs.sendMessage(currentTabId, {
+    type: "transcript_delta",
+    segments: fresh,
+    tail: tail,
+    timestamp: receiveTime,
+  });
+}
+
 const debugStats = {
   wsState: "disconnected",
   connectionStartTime: null,
@@ -28,8 +160,57 @@ const debugStats = {
   lastChunkTime: null,
   lastChunkTimestamp: null, // Timestamp do último chunk enviado
   currentTabId: null,
+  backpressure: false, // Servidor pediu para espaçar os chunks
+  detectedLanguage: null, // Idioma fixado pela detecção automática do servidor
+  languageProbability: null,
+  lastServerTimings: null, // Tempos por etapa da última transcrição (ms)
+  stageSamples: {}, // Últimas 50 amostras de cada etapa do servidor
+  networkSamples: [], // Ponta a ponta menos o tempo no servidor (rede + cliente)
+  chunkSize: null, // Intervalo de chunks em uso (ms)
+  streamProfile: null, // Perfil recomendado pelo servidor (stream_config)
 };
 
+// Intervalo de chunks: o recomendado pelo servidor conforme a carga dele
+// (stream_config), aumentado enquanto houver backpressure nesta sessão
+let serverChunkSize = null;
+let backpressureChunkSize = null;
+
+function applyChunkSize() {
+  const chunkSize = Math.max(
+    serverChunkSize || CONFIG.audioChunkSize,
+    backpressureChunkSize || 0
+  );
+  if (chunkSize === debugStats.chunkSize) return;
+  debugStats.chunkSize = chunkSize;
+  chrome.runtime.sendMessage({
+    type: "set-chunk-size",
+    target: "offscreen",
+    audioChunkSize: chunkSize,
+  });
+}
+
+function dataUrlToBytes(dataUrl) {
+  const base64Data = dataUrl.includes(",") ? dataUrl.split(",")[1] : dataUrl;
+  const binary = atob(base64Data);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes;
+}
+
+function buildAudioFrame(seq, timestamp, codec, payload) {
+  const frame = new Uint8Array(AUDIO_FRAME_HEADER_SIZE + payload.length);
+  const view = new DataView(frame.buffer);
+  view.setUint8(0, AUDIO_FRAME_VERSION);
+  view.setUint8(1, AUDIO_FRAME_CODECS[codec] ?? AUDIO_FRAME_CODECS.webm);
+  view.setUint16(2, 0, true);
+  view.setUint32(4, seq >>> 0, true);
+  view.setBigUint64(8, BigInt(timestamp), true);
+  frame.set(payload, AUDIO_FRAME_HEADER_SIZE);
+  return frame;
+}
+
 function addLatencySample(latencyMs) {
   // Adicionar a TODAS as amostras (sem limite)
   debugStats.allLatencySamples.push(latencyMs);
@@ -45,6 +226,34 @@ function addLatencySample(latencyMs) {
   debugStats.averageLatency = sum / debugStats.latencySamples.length;
 }
 
+function pushSample(samples, value) {
+  samples.push(value);
+  if (samples.length > 50) {
+    samples.shift();
+  }
+}
+
+function addServerTimings(timings, endToEndMs) {
+  debugStats.lastServerTimings = timings;
+  for (const [stage, ms] of Object.entries(timings)) {
+    const name = stage.replace(/_ms$/, "");
+    debugStats.stageSamples[name] = debugStats.stageSamples[name] || [];
+    pushSample(debugStats.stageSamples[name], ms);
+  }
+  if (endToEndMs !== null && timings.server_ms !== undefined) {
+    pushSample(debugStats.networkSamples, Math.max(0, endToEndMs - timings.server_ms));
+  }
+}
+
+function resetLatencyTracking() {
+  chunkSentAt.clear();
+  debugStats.detectedLanguage = null;
+  debugStats.languageProbability = null;
+  debugStats.lastServerTimings = null;
+  debugStats.stageSamples = {};
+  debugStats.networkSamples = [];
+}
+
 const OFFSCREEN_DOCUMENT_PATH = "offscreen.html";
 
 async function setupOffscreenDocument() {
@@ -72,6 +281,40 @@ async function closeOffscreenDocument() {
   debugStats.offscreenDocumentActive = false;
 }
 
+// Latência ponta a ponta e tempos por etapa da resposta (texto inteiro ou delta)
+function trackTranscriptionLatency(data, receiveTime) {
+  let endToEnd = null;
+  if (data.seq !== undefined && data.seq !== null && chunkSentAt.has(data.seq)) {
+    // Latência real: do envio do chunk que gerou esta transcrição até a resposta
+    endToEnd = receiveTime - chunkSentAt.get(data.seq);
+    addLatencySample(endToEnd);
+    // Chunks até este seq já foram atendidos (ou coalescidos pelo servidor)
+    for (const seq of chunkSentAt.keys()) {
+      if (seq <= data.seq) chunkSentAt.delete(seq);
+    }
+    debugStats.lastChunkTimestamp = null;
+  } else if (debugStats.lastChunkTimestamp) {
+    // Servidor sem seq: estimar como tempo desde o último chunk enviado
+    // até receber a transcrição
+    const latency = receiveTime - debugStats.lastChunkTimestamp;
+    // Só adicionar se a latência for razoável (entre 0 e 60 segundos)
+    // Isso evita valores absurdos causados por problemas de sincronização
+    if (latency > 0 && latency < 60000) {
+      addLatencySample(latency);
+    }
+    // Resetar o timestamp para que a próxima transcrição use o timestamp do próximo chunk
+    // Isso evita que múltiplas transcrições usem o mesmo timestamp
+    debugStats.lastChunkTimestamp = null;
+  }
+  if (data.timings) {
+    addServerTimings(data.timings, endToEnd);
+  }
+  if (data.language_probability !== undefined) {
+    debugStats.detectedLanguage = data.language;
+    debugStats.languageProbability = data.language_probability;
+  }
+}
+
 function connectWebSocket() {
   if (websocket?.readyState === WebSocket.OPEN) return;
 
@@ -79,7 +322,10 @@ function connectWebSocket() {
     debugStats.wsState = "connecting";
     debugStats.connectionStartTime = Date.now();
 
-    websocket = new WebSocket(CONFIG.wsUrl);
+    websocket = new WebSocket(sessionUrl());
+    websocket.binaryType = "arraybuffer";
+    binaryFrames = false;
+    sessionReady = false;
 
     websocket.onopen = () => {
       console.log("WebSocket connected");
@@ -98,6 +344,48 @@ function connectWebSocket() {
           })
         );
       }
+
+      // Pedir frames binários; servidores antigos ignoram e seguimos com JSON
+      // e transcrição em deltas; servidores antigos mandam o texto inteiro
+      websocket.send(
+        JSON.stringify({
+          type: "protocol_config",
+          audio_frames: "binary",
+          transcript: "delta",
+          stream_config: true,
+          translation: CONFIG.translationTarget,
+        })
+      );
+      if (transcriptEpoch) {
+        // Reconexão: pedir os segmentos confirmados depois do último recebido.
+        // Vai antes de qualquer áudio, então a resposta chega antes dos deltas novos
+        websocket.send(
+          JSON.stringify({
+            type: "transcript_resync",
+            epoch: transcriptEpoch,
+            last_id: lastSegmentId,
+          })
+        );
+      }
+
+      // Servidores sem protocol_ack: não segurar o áudio esperando por ele
+      const socket = websocket;
+      setTimeout(() => {
+        if (websocket === socket && !sessionReady) onProtocolAck(null);
+      }, PROTOCOL_ACK_TIMEOUT);
+
+      // O stream WebM é contínuo: cada conexão nova precisa começar num stream
+      // novo (com cabeçalho) para o decoder persistente do servidor; os
+      // fragmentos do stream antigo que não foram enviados não servem mais
+      for (const [seq, chunk] of pendingChunks) {
+        if (chunk.codec === "webm-stream") pendingChunks.delete(seq);
+      }
+      if (isCapturing) {
+        chrome.runtime.sendMessage({
+          type: "restart-recorder",
+          target: "offscreen",
+        });
+      }
     };
 
     websocket.onmessage = (event) => {
@@ -105,24 +393,93 @@ function connectWebSocket() {
       const receiveTime = Date.now();
       const data = JSON.parse(event.data);
 
+      if (data.type === "protocol_ack") {
+        binaryFrames = data.audio_frames === "binary";
+        deltaTranscript = data.transcript === "delta";
+        console.log(
+          `Audio frames: ${binaryFrames ? "binary" : "json"}, transcript: ${deltaTranscript ? "delta" : "full"}`
+        );
+        if (deltaTranscript && !transcriptEpoch) {
+          transcriptEpoch = data.epoch;
+          lastSegmentId = 0;
+        }
+        onProtocolAck(data);
+        return;
+      }
+
+      if (data.type === "transcript_sync") {
+        if (data.reset) {
+          // Sessão nova no servidor: o texto na tela continua, a numeração recomeça
+          console.log(`Transcript epoch changed: ${transcriptEpoch} -> ${data.epoch}`);
+          transcriptEpoch = data.epoch;
+          lastSegmentId = 0;
+        } else if (data.truncated) {
+          console.warn("Transcript resync truncated: some segments were lost");
+        }
+        forwardTranscript(data.segments, data.tail, receiveTime);
+        return;
+      }
+
+      if (data.type === "backpressure") {
+        // Servidor atrasado: aumentar o intervalo dos chunks até ele liberar
+        debugStats.backpressure = data.action === "slow_down";
+        backpressureChunkSize = debugStats.backpressure
+          ? data.recommended_chunk_ms || null
+          : null;
+        applyChunkSize();
+        console.warn(
+          `Backpressure ${data.action} (lag ${data.lag_ms} ms), chunk size: ${debugStats.chunkSize} ms`
+        );
+        return;
+      }
+
+      if (data.type === "stream_config") {
+        // Carga do servidor mudou: chunks mais longos (menos inferências) ou de volta ao normal
+        debugStats.streamProfile = data;
+        serverChunkSize = data.chunk_ms;
+        applyChunkSize();
+        console.log(
+          `Stream profile ${data.level}: ${data.chunk_ms} ms chunks, ${data.window_seconds}s window`
+        );
+        return;
+      }
+
+      if (data.type === "language_detected") {
+        // Modo automático: o servidor fixou (ou trocou) o idioma da sessão
+        debugStats.detectedLanguage = data.language;
+        debugStats.languageProbability = data.probability;
+        console.log(
+          `Language detected: ${data.language} (p=${data.probability})`
+        );
+        return;
+      }
+
+      if (data.type === "translation") {
+        // Tradução de um segmento já na tela: chega depois, fora de ordem
+        if (data.epoch !== transcriptEpoch || !currentTabId) return;
+        chrome.tabs.sendMessage(currentTabId, {
+          type: "transcript_translation",
+          id: data.id,
+          text: data.text,
+        });
+        return;
+      }
+
+      if (data.type === "transcript_delta") {
+        if (data.epoch !== transcriptEpoch) return; // Resto de uma sessão anterior
+        debugStats.transcriptionsReceived++;
+        acknowledgeChunks(data.seq);
+        trackTranscriptionLatency(data, receiveTime);
+        forwardTranscript(data.commit, data.tail, receiveTime);
+        return;
+      }
+
       if (data.type === "transcription" && currentTabId) {
         debugStats.transcriptionsReceived++;
         debugStats.lastTranscription = data.text || data.translatedText || "";
         debugStats.lastTranscriptionTime = receiveTime;
-
-        // Calcular latência como tempo desde o último chunk enviado até receber a transcrição
-        // Isso dá uma medida mais precisa do round-trip time
-        if (debugStats.lastChunkTimestamp) {
-          const latency = receiveTime - debugStats.lastChunkTimestamp;
-          // Só adicionar se a latência for razoável (entre 0 e 60 segundos)
-          // Isso evita valores absurdos causados por problemas de sincronização
-          if (latency > 0 && latency < 60000) {
-            addLatencySample(latency);
-          }
-          // Resetar o timestamp para que a próxima transcrição use o timestamp do próximo chunk
-          // Isso evita que múltiplas transcrições usem o mesmo timestamp
-          debugStats.lastChunkTimestamp = null;
-        }
+        acknowledgeChunks(data.seq);
+        trackTranscriptionLatency(data, receiveTime);
 
         chrome.tabs.sendMessage(currentTabId, {
           type: "new_translation",
@@ -179,7 +536,17 @@ async function startCapture(tabId, language = "pt") {
     debugStats.allLatencySamples = []; // TODAS as amostras da sessão (para exportação)
     debugStats.averageLatency = 0;
     debugStats.lastChunkTime = null;
+    resetLatencyTracking();
     debugStats.currentTabId = tabId;
+    // Captura nova, sessão nova: reconexões desta captura retomam esta sessão
+    sessionId = crypto.randomUUID();
+    pendingChunks.clear();
+    resetTranscriptState();
+    // O servidor manda o intervalo recomendado ao conectar (stream_config)
+    serverChunkSize = null;
+    backpressureChunkSize = null;
+    debugStats.chunkSize = CONFIG.audioChunkSize;
+    debugStats.streamProfile = null;
 
     await setupOffscreenDocument();
 
@@ -203,6 +570,7 @@ async function startCapture(tabId, language = "pt") {
       target: "offscreen",
       streamId: streamId,
       audioChunkSize: CONFIG.audioChunkSize,
+      captureMode: CONFIG.captureMode,
     });
 
     connectWebSocket();
@@ -260,6 +628,8 @@ async function stopCapture() {
 
   isCapturing = false;
   currentTabId = null;
+  sessionId = null;
+  pendingChunks.clear();
   selectedLanguage = "pt"; // Resetar para padrão
   debugStats.captureStartTime = null;
   debugStats.wsState = "disconnected";
@@ -445,6 +815,8 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
         debugStats.latencySamples = [];
         debugStats.allLatencySamples = [];
         debugStats.averageLatency = 0;
+        resetLatencyTracking();
+        resetTranscriptState();
         debugStats.wsState = "disconnected";
         sendResponse({ success: true });
         break;
@@ -476,34 +848,28 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
       case "get_debug_stats":
         sendResponse({ ...debugStats });
         break;
-      case "audio_chunk_from_offscreen":
+      case "audio_chunk_from_offscreen": {
+        const seq = audioSeq++;
+        pendingChunks.set(seq, {
+          audio: request.audio,
+          codec: request.codec,
+          timestamp: Date.now(),
+          sent: false,
+        });
+        if (pendingChunks.size > MAX_REPLAY_CHUNKS) {
+          // Queda longa demais: o áudio mais antigo não será reenviado
+          pendingChunks.delete(pendingChunks.keys().next().value);
+        }
+
         if (websocket?.readyState === WebSocket.OPEN) {
-          console.log("sending new translation");
-          const audioData = request.audio;
-          const base64Data = audioData.includes(",")
-            ? audioData.split(",")[1]
-            : audioData;
-          const audioSize = Math.floor(base64Data.length * 0.75);
-
-          debugStats.audioChunksSent++;
-          debugStats.audioBytesSent += audioSize;
-          const chunkTimestamp = Date.now();
-          debugStats.lastChunkTime = chunkTimestamp;
-          debugStats.lastChunkTimestamp = chunkTimestamp; // Guardar timestamp para cálculo de latência
-
-          websocket.send(
-            JSON.stringify({
-              type: "audio_chunk",
-              audio: audioData,
-              duration: CONFIG.audioChunkSize,
-              timestamp: chunkTimestamp,
-            })
-          );
+          // Antes do protocol_ack o chunk espera, para sair depois dos reenvios
+          if (sessionReady) flushPendingChunks();
         } else {
-          debugStats.lastError = "WebSocket not open, cannot send audio chunk";
+          debugStats.lastError = "WebSocket not open, audio chunk kept for replay";
           debugStats.lastErrorTime = Date.now();
         }
         break;
+      }
       case "capture_error":
         console.error(
           "Capture error received from offscreen:",
@@ -312,6 +312,78 @@ if (!document.getElementById("translation-overlay")) {
     setTimeout(() => statusDot.classList.remove("flash"), 500);
   }
 
+  // Protocolo de deltas: cada segmento confirmado vira um span anexado uma vez só
+  // e o trecho mutável fica num único span no final, atualizado no lugar.
+  // Só os últimos MAX_VISIBLE_SEGMENTS ficam no DOM, então o custo por mensagem
+  // é constante mesmo em sessões de horas.
+  const MAX_VISIBLE_SEGMENTS = 300;
+
+  function addTranscriptDelta(data) {
+    const transcriptEl = overlay.querySelector(".continuous-transcript");
+
+    // Texto de status ("Waiting for audio...") ou conteúdo do modo antigo: recomeçar
+    let tailSpan = transcriptEl.querySelector(".text-tail");
+    if (!tailSpan || transcriptEl.classList.contains("waiting")) {
+      transcriptEl.textContent = "";
+      transcriptEl.classList.remove("waiting");
+      tailSpan = document.createElement("span");
+      tailSpan.className = "text-tail";
+      transcriptEl.appendChild(tailSpan);
+    }
+
+    for (const segment of data.segments || []) {
+      const span = document.createElement("span");
+      span.className = "text-segment text-new";
+      span.dataset.id = segment.id;
+      span.textContent = segment.text + " ";
+      transcriptEl.insertBefore(span, tailSpan);
+      // Resync depois de uma reconexão: o segmento pode já vir traduzido
+      if (segment.translation) {
+        applySegmentTranslation(span, segment.translation);
+      }
+
+      // Remover destaque após 2 segundos
+      setTimeout(() => span.classList.add("fade-out-highlight"), 2000);
+      setTimeout(() => span.classList.remove("text-new", "fade-out-highlight"), 2600);
+    }
+
+    // Segmentos antigos saem do DOM (o span do tail não conta)
+    while (transcriptEl.childElementCount - 1 > MAX_VISIBLE_SEGMENTS) {
+      transcriptEl.firstElementChild.remove();
+    }
+
+    if (tailSpan.textContent !== (data.tail || "")) {
+      tailSpan.textContent = data.tail || "";
+    }
+
+    content.scrollTo({
+      top: content.scrollHeight,
+      behavior: "smooth"
+    });
+
+    const statusDot = overlay.querySelector(".status-dot");
+    statusDot.classList.add("flash");
+    setTimeout(() => statusDot.classList.remove("flash"), 500);
+  }
+
+  // Tradução chega depois do segmento: troca o texto no lugar, o original fica no title
+  function applySegmentTranslation(span, text) {
+    if (!span.classList.contains("text-translated")) {
+      span.title = span.textContent.trim();
+    }
+    span.textContent = text + " ";
+    span.classList.add("text-translated");
+  }
+
+  function addSegmentTranslation(data) {
+    const transcriptEl = overlay.querySelector(".continuous-transcript");
+    // O último com esse id: depois de uma sessão nova no servidor a numeração recomeça
+    const spans = transcriptEl.querySelectorAll(`.text-segment[data-id="${data.id}"]`);
+    if (spans.length > 0) {
+      applySegmentTranslation(spans[spans.length - 1], data.text);
+    }
+  }
+
   chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
     console.log("received in content", request);
     if (request.type === "new_translation") {
@@ -320,6 +392,14 @@ if (!document.getElementById("translation-overlay")) {
         isCapturing = true;
         startStopBtn.textContent = "⏸ Stop";
       }
+    } else if (request.type === "transcript_delta") {
+      addTranscriptDelta(request);
+      if (!isCapturing) {
+        isCapturing = true;
+        startStopBtn.textContent = "⏸ Stop";
+      }
+    } else if (request.type === "transcript_translation") {
+      addSegmentTranslation(request);
     } else if (request.type === "remove_overlay") {
       const overlay = document.getElementById("translation-overlay");
       if (overlay) {
@@ -130,6 +130,14 @@ class DebugPanel {
               <span class="debug-label">Max Latency:</span>
               <span class="debug-value" id="debug-max-latency">-</span>
             </div>
+            <div class="debug-row">
+              <span class="debug-label">Detected Language:</span>
+              <span class="debug-value" id="debug-detected-language">-</span>
+            </div>
+            <div class="debug-row">
+              <span class="debug-label">Chunk Interval:</span>
+              <span class="debug-value" id="debug-chunk-size">-</span>
+            </div>
             <div class="debug-row">
               <span class="debug-label">Last Received:</span>
               <span class="debug-value" id="debug-last-transcription-time">-</span>
@@ -145,6 +153,20 @@ class DebugPanel {
           </div>
         </div>
 
+        <div class="debug-section">
+          <div class="debug-section-header" data-section="stages">
+            <span>Server Stages</span>
+            <span class="debug-toggle">▼</span>
+          </div>
+          <div class="debug-section-body" id="section-stages">
+            <div id="debug-stage-rows">
+              <div class="debug-row">
+                <span class="debug-label">Waiting for data...</span>
+              </div>
+            </div>
+          </div>
+        </div>
+
         <div class="debug-section">
           <div class="debug-section-header" data-section="chart">
             <span>Latency Chart</span>
@@ -485,6 +507,21 @@ class DebugPanel {
     document.getElementById("debug-last-transcription-time").textContent =
       this.formatTimeAgo(s.lastTranscriptionTime);
 
+    document.getElementById("debug-detected-language").textContent =
+      s.detectedLanguage
+        ? `${s.detectedLanguage} (${Math.round(
+            (s.languageProbability || 0) * 100
+          )}%)`
+        : "-";
+
+    // Intervalo em uso e perfil recomendado pelo servidor (janela cresce sob carga)
+    document.getElementById("debug-chunk-size").textContent = s.chunkSize
+      ? `${s.chunkSize}ms` +
+        (s.streamProfile
+          ? ` (profile ${s.streamProfile.level}, ${s.streamProfile.window_seconds}s window)`
+          : "")
+      : "-";
+
     const lastText = s.lastTranscription || "-";
     const displayText =
       lastText.length > 100 ? lastText.substring(0, 100) + "..." : lastText;
@@ -496,6 +533,49 @@ class DebugPanel {
     } else {
       document.getElementById("debug-capture-duration").textContent = "-";
     }
+
+    this.updateStages(s);
+  }
+
+  average(samples) {
+    if (!samples || samples.length === 0) return null;
+    return samples.reduce((a, b) => a + b, 0) / samples.length;
+  }
+
+  // Média das últimas amostras de cada etapa do servidor, mais a parte da
+  // latência ponta a ponta gasta fora dele (rede + cliente)
+  stageAverages(s) {
+    const rows = [];
+    for (const [stage, samples] of Object.entries(s.stageSamples || {})) {
+      const avg = this.average(samples);
+      if (avg !== null) rows.push([stage, avg]);
+    }
+    const network = this.average(s.networkSamples);
+    if (network !== null) rows.push(["network", network]);
+    return rows;
+  }
+
+  updateStages(s) {
+    const container = document.getElementById("debug-stage-rows");
+    if (!container) return;
+
+    const rows = this.stageAverages(s);
+    if (rows.length === 0) return;
+
+    container.replaceChildren(
+      ...rows.map(([stage, avg]) => {
+        const row = document.createElement("div");
+        row.className = "debug-row";
+        const label = document.createElement("span");
+        label.className = "debug-label";
+        label.textContent = `${stage}:`;
+        const value = document.createElement("span");
+        value.className = "debug-value";
+        value.textContent = `${avg.toFixed(1)}ms`;
+        row.append(label, value);
+        return row;
+      })
+    );
   }
 
   startUpdates() {
@@ -692,6 +772,17 @@ class DebugPanel {
       }
       lines.push("");
 
+      // Seção: Server Stages (médias das últimas 50 transcrições)
+      const stageRows = this.stageAverages(s);
+      if (stageRows.length > 0) {
+        lines.push("=== SERVER STAGES ===");
+        lines.push("Stage,Average (ms)");
+        stageRows.forEach(([stage, avg]) => {
+          lines.push(`${this.escapeCSV(stage)},${this.escapeCSV(avg.toFixed(2))}`);
+        });
+        lines.push("");
+      }
+
       // Seção: Latency Statistics
       lines.push("=== LATENCY STATISTICS ===");
       // Usar TODAS as amostras para exportação (não apenas as últimas 50)
@@ -2,6 +2,12 @@ let mediaRecorder;
 let stream;
 let audioChunkSize;
 let captureLoop;
+let captureMode = "webm";
+
+// Modo "pcm": AudioWorklet que entrega Int16 mono 16 kHz (sem WebM)
+let audioContext;
+let pcmSourceNode;
+let pcmWorkletNode;
 
 chrome.runtime.onMessage.addListener(handleMessages);
 
@@ -12,17 +18,31 @@ async function handleMessages(message) {
 
   switch (message.type) {
     case "start-capture":
-      await startCapture(message.streamId, message.audioChunkSize);
+      await startCapture(
+        message.streamId,
+        message.audioChunkSize,
+        message.captureMode
+      );
       break;
     case "stop-capture":
       stopCapture();
       break;
+    case "set-chunk-size":
+      setChunkSize(message.audioChunkSize);
+      break;
+    case "restart-recorder":
+      // Nova conexão: o servidor precisa receber o cabeçalho WebM de um stream novo
+      // (PCM não tem cabeçalho, nada a fazer)
+      if (captureMode !== "pcm") {
+        restartRecorder();
+      }
+      break;
     default:
       console.warn(`Mensagem desconhecida recebida: ${message.type}`);
   }
 }
 
-async function startCapture(streamId, chunkSize) {
+async function startCapture(streamId, chunkSize, mode = "webm") {
   if (stream) {
     console.warn("A captura já está em andamento.");
     return;
@@ -40,6 +60,7 @@ async function startCapture(streamId, chunkSize) {
     });
 
     audioChunkSize = chunkSize;
+    captureMode = mode;
 
     const audioElement = new Audio();
     audioElement.srcObject = stream;
@@ -47,7 +68,11 @@ async function startCapture(streamId, chunkSize) {
     audioElement.muted = false;
     document.body.appendChild(audioElement);
 
-    startRecordingLoop();
+    if (captureMode === "pcm") {
+      await startPcmCapture();
+    } else {
+      startRecordingLoop();
+    }
   } catch (error) {
     console.error("Erro ao iniciar a captura no offscreen:", error);
     chrome.runtime.sendMessage({
@@ -57,6 +82,8 @@ async function startCapture(streamId, chunkSize) {
   }
 }
 
+// Um único MediaRecorder contínuo: cada requestData() entrega um fragmento do
+// mesmo stream WebM, que o servidor decodifica com um ffmpeg persistente.
 function startRecordingLoop() {
   if (!stream) return;
 
@@ -69,41 +96,116 @@ function startRecordingLoop() {
         chrome.runtime.sendMessage({
           type: "audio_chunk_from_offscreen",
           audio: reader.result,
+          codec: "webm-stream",
         });
       };
       reader.readAsDataURL(event.data);
     }
   };
 
-  mediaRecorder.onstop = () => {
-    startRecordingLoop();
-  };
-
   mediaRecorder.start();
+  scheduleNextChunk();
+}
 
+function scheduleNextChunk() {
   captureLoop = setTimeout(() => {
     if (mediaRecorder?.state === "recording") {
-      mediaRecorder.stop();
+      mediaRecorder.requestData();
+      scheduleNextChunk();
     }
   }, audioChunkSize);
 }
 
-function stopCapture() {
-  console.log("[offscreen] trying to stop tab capture");
-
+function discardRecorder() {
   if (captureLoop) {
     clearTimeout(captureLoop);
     captureLoop = null;
   }
 
+  if (mediaRecorder && mediaRecorder.state !== "inactive") {
+    // Descartar o restante do stream antigo
+    mediaRecorder.ondataavailable = null;
+    mediaRecorder.stop();
+  }
+  mediaRecorder = null;
+}
+
+function arrayBufferToBase64(buffer) {
+  const bytes = new Uint8Array(buffer);
+  let binary = "";
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+}
+
+async function startPcmCapture() {
+  audioContext = new AudioContext();
+  await audioContext.audioWorklet.addModule(
+    chrome.runtime.getURL("pcm-worklet.js")
+  );
+
+  pcmSourceNode = audioContext.createMediaStreamSource(stream);
+  // Sem saídas: o nó só consome o áudio (a reprodução continua pelo <audio>)
+  pcmWorkletNode = new AudioWorkletNode(
+    audioContext,
+    "pcm-capture-processor",
+    {
+      numberOfOutputs: 0,
+      processorOptions: { chunkMs: audioChunkSize },
+    }
+  );
+
+  pcmWorkletNode.port.onmessage = (event) => {
+    // runtime.sendMessage só aceita JSON, então o Int16 vai em base64
+    chrome.runtime.sendMessage({
+      type: "audio_chunk_from_offscreen",
+      audio: arrayBufferToBase64(event.data),
+      codec: "pcm-s16le",
+    });
+  };
+
+  pcmSourceNode.connect(pcmWorkletNode);
+}
+
+function stopPcmCapture() {
+  if (pcmSourceNode) {
+    pcmSourceNode.disconnect();
+    pcmSourceNode = null;
+  }
+  if (pcmWorkletNode) {
+    pcmWorkletNode.port.onmessage = null;
+    pcmWorkletNode = null;
+  }
+  if (audioContext) {
+    audioContext.close();
+    audioContext = null;
+  }
+}
+
+function setChunkSize(chunkSize) {
+  if (!chunkSize || chunkSize === audioChunkSize) return;
+  audioChunkSize = chunkSize;
+  // WebM: o próximo requestData() já usa o novo intervalo
+  if (pcmWorkletNode) {
+    pcmWorkletNode.port.postMessage({ type: "set-chunk-ms", chunkMs: chunkSize });
+  }
+}
+
+function restartRecorder() {
+  if (!stream) return;
+  discardRecorder();
+  startRecordingLoop();
+}
+
+function stopCapture() {
+  console.log("[offscreen] trying to stop tab capture");
+
+  discardRecorder();
+  stopPcmCapture();
+
   if (stream) {
     stream.getTracks().forEach((track) => track.stop());
     stream = null;
   }
-
-  if (mediaRecorder && mediaRecorder.state !== "inactive") {
-    mediaRecorder.onstop = null;
-    mediaRecorder.stop();
-    mediaRecorder = null;
-  }
 }
@@ -0,0 +1,84 @@
+// AudioWorklet de captura em PCM: mixa para mono, reamostra para 16 kHz e
+// converte para Int16, entregando um chunk de `chunkMs` por mensagem.
+// O servidor coloca esses bytes direto no buffer, sem WebM nem ffmpeg.
+const TARGET_SAMPLE_RATE = 16000;
+
+class PcmCaptureProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    // `sampleRate` é global no escopo do AudioWorklet (taxa do AudioContext)
+    this.ratio = sampleRate / TARGET_SAMPLE_RATE;
+    this.position = 0;
+    this.accumulator = 0;
+    this.accumulatorCount = 0;
+    this.setChunkMs(options.processorOptions?.chunkMs || 500);
+
+    this.port.onmessage = (event) => {
+      if (event.data?.type === "set-chunk-ms") {
+        this.flush();
+        this.setChunkMs(event.data.chunkMs);
+      }
+    };
+  }
+
+  flush() {
+    if (this.offset > 0) {
+      const partial = this.buffer.slice(0, this.offset);
+      this.port.postMessage(partial.buffer, [partial.buffer]);
+      this.offset = 0;
+    }
+  }
+
+  setChunkMs(chunkMs) {
+    this.chunkSamples = Math.max(
+      1,
+      Math.round((TARGET_SAMPLE_RATE * chunkMs) / 1000)
+    );
+    this.buffer = new Int16Array(this.chunkSamples);
+    this.offset = 0;
+  }
+
+  pushSample(value) {
+    const clamped = Math.max(-1, Math.min(1, value));
+    this.buffer[this.offset++] =
+      clamped < 0 ? clamped * 0x8000 : clamped * 0x7fff;
+
+    if (this.offset === this.chunkSamples) {
+      // Transferir o buffer (sem cópia) e começar outro
+      this.port.postMessage(this.buffer.buffer, [this.buffer.buffer]);
+      this.buffer = new Int16Array(this.chunkSamples);
+      this.offset = 0;
+    }
+  }
+
+  process(inputs) {
+    const input = inputs[0];
+    if (!input || input.length === 0) return true;
+
+    const channels = input.length;
+    const frames = input[0].length;
+
+    for (let i = 0; i < frames; i++) {
+      let sample = 0;
+      for (let c = 0; c < channels; c++) {
+        sample += input[c][i];
+      }
+
+      // Decimação por média (filtro passa-baixa simples antes de reduzir a taxa)
+      this.accumulator += sample / channels;
+      this.accumulatorCount++;
+      this.position += 1;
+
+      if (this.position >= this.ratio) {
+        this.position -= this.ratio;
+        this.pushSample(this.accumulator / this.accumulatorCount);
+        this.accumulator = 0;
+        this.accumulatorCount = 0;
+      }
+    }
+
+    return true;
+  }
+}
+
+registerProcessor("pcm-capture-processor", PcmCaptureProcessor);
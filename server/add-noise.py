@@ -1,101 +1,188 @@
 import os
 import argparse
+import json
+import shutil
+import subprocess
+import wave
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import numpy as np
-from pydub import AudioSegment
-from pydub.generators import WhiteNoise, Sine
-import random
 
-def add_white_noise(audio, noise_level_db=-20):
+# Output sample rate (the server's); inputs are resampled by ffmpeg when decoded
+SAMPLE_RATE = 16000
+
+# Length (ms) and frequency (Hz) ranges of each random sound type
+SOUND_TYPES = {
+    'sine': {'duration_ms': (300, 1500), 'frequencies': (300, 1500)},
+    'beep': {'duration_ms': (400, 800), 'frequencies': [440, 880, 1000]},
+    'click': {'duration_ms': (100, 200), 'frequencies': None},
+}
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg', '.m4a', '.webm', '.opus')
+
+
+def load_audio(path, ffmpeg_path='ffmpeg'):
+    """Decode any audio file to 16 kHz mono float32 PCM in [-1, 1]."""
+    cmd = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-i', str(path),
+           '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 'f32le', '-']
+    pcm = subprocess.run(cmd, capture_output=True, check=True).stdout
+    return np.frombuffer(pcm, dtype=np.float32)
+
+def write_wav(path, audio):
+    """Write float PCM as a 16 kHz mono 16-bit WAV."""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+def rms(audio):
+    return float(np.sqrt(np.mean(np.square(audio, dtype=np.float64)))) if len(audio) else 0.0
+
+def gain_for_snr(signal_rms, noise_rms, snr_db):
+    """Gain that puts noise of RMS `noise_rms` at `snr_db` below the signal."""
+    if noise_rms == 0:
+        return 0.0
+    return signal_rms / (noise_rms * 10 ** (snr_db / 20))
+
+def white_noise(rng, num_samples, signal_rms, snr_db):
     """
-    Add white noise to audio.
-    
+    Gaussian white noise at a target SNR.
+
     Args:
-        audio: AudioSegment object
-        noise_level_db: Noise level in dB (negative value, closer to 0 = louder)
-    
+        rng: numpy Generator
+        num_samples: Length of the noise
+        signal_rms: RMS of the clean signal the noise is mixed into
+        snr_db: Target signal-to-noise ratio in dB (lower = louder noise)
+
     Returns:
-        AudioSegment with added noise
+        float32 array
     """
-    # Generate white noise with same duration as audio
-    noise = WhiteNoise().to_audio_segment(duration=len(audio))
-    
-    # Adjust noise volume
-    noise = noise + noise_level_db
-    
-    # Overlay noise on original audio
-    return audio.overlay(noise)
-
-def add_random_sounds(audio, sound_type='sine', num_sounds=5, volume_db=-10):
+    noise = rng.standard_normal(num_samples).astype(np.float32)
+    return noise * np.float32(gain_for_snr(signal_rms, 1.0, snr_db))
+
+def random_sounds(rng, num_samples, sound_type, num_sounds, signal_rms, snr_db):
     """
-    Add random sound effects to audio.
-    
+    Random sound events (sine tones, beeps or clicks), all rendered in one
+    vectorized pass: one row per event, scaled so each event sits at `snr_db`
+    below the signal, then scattered into a single track.
+
     Args:
-        audio: AudioSegment object
+        rng: numpy Generator
+        num_samples: Length of the track
         sound_type: Type of sound ('sine', 'beep', 'click')
-        num_sounds: Number of random sounds to add
-        volume_db: Volume of sounds in dB (default: -10 for more audible sounds)
-    
+        num_sounds: Number of events
+        signal_rms: RMS of the clean signal the events are mixed into
+        snr_db: Signal-to-event ratio in dB of each event (lower = louder)
+
     Returns:
-        AudioSegment with added random sounds
+        (float32 track, list of event descriptions for the manifest)
     """
-    audio_duration = len(audio)
-    result = audio
-    
-    print(f"  Audio duration: {audio_duration}ms ({audio_duration/1000:.1f}s)")
-    
-    for i in range(num_sounds):
-        # Random position in the audio
-        position = random.randint(0, max(0, audio_duration - 1000))
-        
-        # Generate sound based on type
-        if sound_type == 'sine':
-            # Random frequency between 300Hz and 1500Hz
-            frequency = random.randint(300, 1500)
-            # Longer duration for sine waves (300ms to 1500ms)
-            duration = random.randint(300, 1500)
-            sound = Sine(frequency).to_audio_segment(duration=duration)
-            print(f"  Sound {i+1}/{num_sounds}: Sine {frequency}Hz, {duration}ms at {position/1000:.1f}s")
-        elif sound_type == 'beep':
-            # More audible beep sound (440Hz or 880Hz)
-            frequency = random.choice([440, 880, 1000])
-            # Longer beeps (400ms to 800ms)
-            duration = random.randint(400, 800)
-            sound = Sine(frequency).to_audio_segment(duration=duration)
-            print(f"  Sound {i+1}/{num_sounds}: Beep {frequency}Hz, {duration}ms at {position/1000:.1f}s")
-        else:  # click
-            # Audible click (100ms to 200ms)
-            duration = random.randint(100, 200)
-            sound = WhiteNoise().to_audio_segment(duration=duration)
-            print(f"  Sound {i+1}/{num_sounds}: Click {duration}ms at {position/1000:.1f}s")
-        
-        # Adjust volume (louder for more audible sounds)
-        sound = sound + volume_db
-        
-        # Overlay sound at random position
-        result = result.overlay(sound, position=position)
-    
-    return result
-
-def process_audio_file(input_file, output_file=None, add_noise=True, add_sounds=True, 
-                       noise_level=-20, num_sounds=5, sound_type='sine', sound_volume=-10):
+    track = np.zeros(num_samples, dtype=np.float32)
+    if num_sounds <= 0 or num_samples == 0:
+        return track, []
+
+    spec = SOUND_TYPES[sound_type]
+    low, high = spec['duration_ms']
+    lengths = rng.integers(low, high + 1, num_sounds) * SAMPLE_RATE // 1000
+    # Same placement as before: anywhere up to one second before the end
+    positions = rng.integers(0, max(1, num_samples - SAMPLE_RATE), num_sounds)
+
+    offsets = np.arange(lengths.max())
+    active = offsets[None, :] < lengths[:, None]
+    if spec['frequencies'] is None:
+        frequencies = np.zeros(num_sounds)
+        events = rng.uniform(-1.0, 1.0, (num_sounds, len(offsets)))
+    else:
+        choices = spec['frequencies']
+        if isinstance(choices, tuple):
+            frequencies = rng.integers(choices[0], choices[1] + 1, num_sounds).astype(np.float64)
+        else:
+            frequencies = rng.choice(choices, num_sounds).astype(np.float64)
+        events = np.sin(2 * np.pi * frequencies[:, None] * offsets[None, :] / SAMPLE_RATE)
+    events *= active
+
+    # RMS of each event over its own length, then the gain for the target SNR
+    event_rms = np.sqrt(np.sum(events ** 2, axis=1) / lengths)
+    gains = np.where(event_rms > 0, signal_rms / (np.maximum(event_rms, 1e-12) * 10 ** (snr_db / 20)), 0.0)
+    events *= gains[:, None]
+
+    # Overlapping events add up (bincount sums repeated indices)
+    indices = positions[:, None] + offsets[None, :]
+    inside = active & (indices < num_samples)
+    track += np.bincount(indices[inside], weights=events[inside], minlength=num_samples).astype(np.float32)
+
+    described = [
+        {'type': sound_type, 'start_s': round(int(p) / SAMPLE_RATE, 3), 'duration_s': round(int(n) / SAMPLE_RATE, 3),
+         'frequency_hz': float(f) if spec['frequencies'] is not None else None}
+        for p, n, f in zip(positions, lengths, frequencies)
+    ]
+    return track, described
+
+def augment(audio, rng, noise_snr=10.0, sound_type='sine', num_sounds=5, sound_snr=0.0):
     """
-    Process audio file by adding noise and/or random sounds.
-    
+    Mix white noise and/or random sounds into clean audio.
+
     Args:
-        input_file: Path to input MP3 file
-        output_file: Path to output file (optional, will auto-generate if None)
+        audio: float32 PCM, 16 kHz mono
+        rng: numpy Generator (seed it for reproducible sets)
+        noise_snr: White noise SNR in dB, None for no noise
+        sound_type: Type of random sounds
+        num_sounds: Number of random sounds, 0 for none
+        sound_snr: SNR in dB of each random sound
+
+    Returns:
+        (float32 mix, dict of what was applied). SNRs are relative to the RMS
+        of the whole input; if the mix would clip, all of it is scaled down,
+        which keeps the SNRs.
+    """
+    signal_rms = rms(audio)
+    mix = audio.astype(np.float32, copy=True)
+    applied = {'signal_rms': round(signal_rms, 6), 'noise_snr_db': noise_snr, 'sounds': []}
+
+    if noise_snr is not None:
+        mix += white_noise(rng, len(audio), signal_rms, noise_snr)
+    if num_sounds > 0:
+        track, applied['sounds'] = random_sounds(rng, len(audio), sound_type, num_sounds, signal_rms, sound_snr)
+        applied['sound_snr_db'] = sound_snr
+        mix += track
+
+    peak = float(np.max(np.abs(mix))) if len(mix) else 0.0
+    applied['gain'] = round(1.0 / peak, 6) if peak > 1.0 else 1.0
+    if peak > 1.0:
+        mix /= peak
+    return mix, applied
+
+def make_rng(seed, name):
+    """Generator for one output: depends on the seed and the output name only,
+    so adding files to a batch does not change the others."""
+    return np.random.default_rng([seed, zlib.crc32(name.encode('utf-8'))])
+
+def process_audio_file(input_file, output_file=None, add_noise=True, add_sounds=True,
+                       noise_snr=10.0, num_sounds=5, sound_type='sine', sound_snr=0.0, seed=0,
+                       ffmpeg_path='ffmpeg'):
+    """
+    Process one audio file by adding noise and/or random sounds.
+
+    Args:
+        input_file: Path to input audio file (anything ffmpeg decodes)
+        output_file: Path to output WAV (optional, will auto-generate if None)
         add_noise: Whether to add white noise
         add_sounds: Whether to add random sounds
-        noise_level: Noise level in dB
+        noise_snr: White noise SNR in dB
         num_sounds: Number of random sounds to add
         sound_type: Type of random sounds
-        sound_volume: Volume of random sounds in dB
+        sound_snr: SNR in dB of each random sound
+        seed: RNG seed
     """
     # Check if input file exists
     if not os.path.exists(input_file):
         print(f"ERROR: File '{input_file}' not found!")
         return
-    
+
     # Generate output filename if not provided
     if output_file is None:
         base_name = os.path.splitext(input_file)[0]
@@ -105,80 +192,180 @@ def process_audio_file(input_file, output_file=None, add_noise=True, add_sounds=
         if add_sounds:
             suffix.append('sounds')
         suffix_str = '-' + '-'.join(suffix) if suffix else '-processed'
-        output_file = f"{base_name}{suffix_str}.mp3"
-    
+        output_file = f"{base_name}{suffix_str}.wav"
+
     print(f"Processing: {input_file}")
     print(f"Output: {output_file}")
-    
-    # Load audio file
-    print("Loading audio file...")
-    audio = AudioSegment.from_mp3(input_file)
-    
-    # Add white noise if requested
+
+    audio = load_audio(input_file, ffmpeg_path)
+    print(f"  Audio duration: {len(audio) / SAMPLE_RATE:.1f}s")
+    mix, applied = augment(audio, make_rng(seed, Path(output_file).stem),
+                           noise_snr=noise_snr if add_noise else None,
+                           sound_type=sound_type, num_sounds=num_sounds if add_sounds else 0,
+                           sound_snr=sound_snr)
     if add_noise:
-        print(f"Adding white noise (level: {noise_level} dB)...")
-        audio = add_white_noise(audio, noise_level)
-    
-    # Add random sounds if requested
-    if add_sounds:
-        print(f"Adding {num_sounds} random {sound_type} sounds (volume: {sound_volume} dB)...")
-        audio = add_random_sounds(audio, sound_type, num_sounds, sound_volume)
-    
-    # Export processed audio
-    print("Exporting processed audio...")
-    audio.export(output_file, format="mp3")
-    
+        print(f"  White noise at {noise_snr} dB SNR")
+    for i, sound in enumerate(applied['sounds']):
+        frequency = f" {sound['frequency_hz']:.0f}Hz" if sound['frequency_hz'] else ""
+        print(f"  Sound {i+1}/{len(applied['sounds'])}: {sound['type']}{frequency}, "
+              f"{sound['duration_s'] * 1000:.0f}ms at {sound['start_s']:.1f}s")
+
+    write_wav(output_file, mix)
     print(f"SUCCESS: Saved to {output_file}")
 
+def process_batch_file(input_file, output_dir, conditions, refs_dir, options):
+    """
+    Batch worker: decode one input once and write one WAV per noise condition,
+    plus a copy of its reference for each, so that bench-replay.py and
+    calc-wer.py find <name>_ref.txt next to the audio. Returns manifest rows.
+    """
+    input_file = Path(input_file)
+    audio = load_audio(input_file, options['ffmpeg'])
+    ref_file = Path(refs_dir or input_file.parent) / f"{input_file.stem}_ref.txt"
+    rows = []
+    for condition, snr in conditions:
+        name = f"{condition}_{input_file.stem}"
+        # "clean" is the untouched input: no noise and no sounds
+        mix, applied = augment(audio, make_rng(options['seed'], name), noise_snr=snr,
+                               sound_type=options['sound_type'],
+                               num_sounds=options['num_sounds'] if snr is not None else 0,
+                               sound_snr=options['sound_snr'])
+        audio_path = Path(output_dir) / f"{name}.wav"
+        write_wav(audio_path, mix)
+        reference = None
+        if ref_file.exists():
+            reference = Path(output_dir) / f"{name}_ref.txt"
+            shutil.copyfile(ref_file, reference)
+        rows.append({
+            'name': name,
+            'condition': condition,
+            'audio': str(audio_path),
+            'reference': str(reference) if reference else None,
+            'source': str(input_file),
+            'duration_s': round(len(audio) / SAMPLE_RATE, 3),
+            'seed': options['seed'],
+            **applied,
+        })
+    return rows
+
+def run_batch(input_dir, output_dir, snrs, jobs, refs_dir=None, **options):
+    """
+    Augment every audio file in input_dir under each SNR condition, in a
+    process pool, and write manifest.jsonl (one line per output) to output_dir.
+    """
+    inputs = sorted(p for p in Path(input_dir).iterdir() if p.suffix.lower() in AUDIO_EXTENSIONS)
+    if not inputs:
+        print(f"ERROR: No audio files found in {input_dir}")
+        return None
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    # Condition names match calc-wer.py's default CONDITION_PATTERN, which keeps
+    # the SNR level: snr10_<stem> -> snr10, snr-5_<stem> -> snr-5, clean_<stem> -> clean
+    conditions = [(f"snr{snr:g}" if snr is not None else "clean", snr) for snr in snrs]
+
+    print(f"Augmenting {len(inputs)} file(s) x {len(conditions)} condition(s) "
+          f"({', '.join(c for c, _ in conditions)}) with {jobs} process(es)...")
+    manifest_path = Path(output_dir) / "manifest.jsonl"
+    with open(manifest_path, 'w', encoding='utf-8') as manifest, \
+            ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(process_batch_file, p, output_dir, conditions, refs_dir, options) for p in inputs]
+        for path, future in zip(inputs, futures):
+            try:
+                rows = future.result()
+            except Exception as e:
+                print(f"  ERROR processing {path.name}: {e}")
+                continue
+            for row in rows:
+                manifest.write(json.dumps(row, ensure_ascii=False) + '\n')
+            print(f"  {path.name}: {len(rows)} output(s)")
+    print(f"SUCCESS: Manifest saved to {manifest_path}")
+    return manifest_path
+
 def main():
     parser = argparse.ArgumentParser(
-        description='Add noise and random sounds to MP3 files',
+        description='Add noise and random sounds to audio files (16 kHz WAV output)',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
   # Add both noise and sounds
   python add-noise.py input.mp3
-  
+
   # Add only noise
   python add-noise.py input.mp3 --no-sounds
-  
+
   # Add only sounds
   python add-noise.py input.mp3 --no-noise
-  
-  # Custom output filename
-  python add-noise.py input.mp3 -o output.mp3
-  
-  # Adjust noise level (lower = louder, e.g., -10 is louder than -30)
-  python add-noise.py input.mp3 --noise-level -15
-  
+
+  # Custom output filename and a different (reproducible) draw
+  python add-noise.py input.mp3 -o output.wav --seed 7
+
+  # Louder noise (lower SNR = louder, e.g. 0 dB is as loud as the speech)
+  python add-noise.py input.mp3 --snr 5
+
   # Add more random sounds with different type
   python add-noise.py input.mp3 --num-sounds 10 --sound-type beep
+
+  # Whole directory, four SNR conditions plus clean, in parallel; then replay and score
+  python add-noise.py --batch clips/ --output-dir noisy/ --snrs clean 20 10 5 0
+  python bench-replay.py --manifest noisy/manifest.jsonl --save-hypo noisy/
+  python calc-wer.py --batch --data-dir noisy/ --manifest noisy/manifest.jsonl
         """)
-    
-    parser.add_argument('input', help='Input MP3 file')
-    parser.add_argument('-o', '--output', help='Output file (default: auto-generated)')
+
+    parser.add_argument('input', nargs='?', help='Input audio file')
+    parser.add_argument('-o', '--output', help='Output WAV file (default: auto-generated)')
     parser.add_argument('--no-noise', action='store_true', help='Do not add white noise')
     parser.add_argument('--no-sounds', action='store_true', help='Do not add random sounds')
-    parser.add_argument('--noise-level', type=int, default=-20, 
-                       help='Noise level in dB (default: -20, range: -40 to -5)')
+    parser.add_argument('--snr', type=float, default=10,
+                        help='White noise SNR in dB (default: 10, lower = louder)')
     parser.add_argument('--num-sounds', type=int, default=5,
-                       help='Number of random sounds to add (default: 5)')
-    parser.add_argument('--sound-type', choices=['sine', 'beep', 'click'], default='sine',
-                       help='Type of random sounds (default: sine)')
-    parser.add_argument('--sound-volume', type=int, default=-10,
-                       help='Volume of random sounds in dB (default: -10, range: -30 to 0)')
-    
+                        help='Number of random sounds to add (default: 5)')
+    parser.add_argument('--sound-type', choices=sorted(SOUND_TYPES), default='sine',
+                        help='Type of random sounds (default: sine)')
+    parser.add_argument('--sound-snr', type=float, default=0,
+                        help='SNR in dB of each random sound (default: 0, same level as the speech)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='RNG seed; the same seed gives the same output (default: 0)')
+    parser.add_argument('--batch', metavar='DIR', help='Augment every audio file in DIR')
+    parser.add_argument('--output-dir', help='Batch mode: directory for the WAVs, references and manifest.jsonl')
+    parser.add_argument('--snrs', nargs='+', default=['20', '10', '5', '0'],
+                        help="Batch mode: noise conditions, in dB or 'clean' (default: 20 10 5 0)")
+    parser.add_argument('--refs-dir',
+                        help='Batch mode: where <stem>_ref.txt references are (default: next to the audio)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Batch mode: worker processes (default: all cores)')
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='ffmpeg binary (default: ffmpeg)')
+
     args = parser.parse_args()
-    
+
+    if args.batch:
+        if not args.output_dir:
+            parser.error('--batch needs --output-dir')
+        if args.no_noise:
+            parser.error("--no-noise does not apply to --batch; use --snrs clean for a noise-free condition")
+        snrs = [None if value == 'clean' else float(value) for value in args.snrs]
+        run_batch(
+            args.batch, args.output_dir, snrs, max(1, args.jobs),
+            refs_dir=args.refs_dir,
+            sound_type=args.sound_type,
+            num_sounds=0 if args.no_sounds else args.num_sounds,
+            sound_snr=args.sound_snr,
+            seed=args.seed,
+            ffmpeg=args.ffmpeg
+        )
+        return
+    if not args.input:
+        parser.error('an input file (or --batch DIR) is required')
+
     process_audio_file(
         input_file=args.input,
         output_file=args.output,
         add_noise=not args.no_noise,
         add_sounds=not args.no_sounds,
-        noise_level=args.noise_level,
+        noise_snr=args.snr,
         num_sounds=args.num_sounds,
         sound_type=args.sound_type,
-        sound_volume=args.sound_volume
+        sound_snr=args.sound_snr,
+        seed=args.seed,
+        ffmpeg_path=args.ffmpeg
     )
 
 if __name__ == "__main__":
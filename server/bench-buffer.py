@@ -0,0 +1,93 @@
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server import AudioRingBuffer, SAMPLE_RATE, RING_BUFFER_HEADROOM_SECONDS  # noqa: E402
+
+
+def run_concatenate(chunks, max_samples, overlap_samples):
+    """Previous handler behaviour: np.concatenate on every chunk, slice on rollover."""
+    copied = 0
+    audio_buffer = np.array([], dtype=np.float32)
+    for chunk in chunks:
+        audio_buffer = np.concatenate([audio_buffer, chunk])
+        copied += audio_buffer.nbytes
+        if len(audio_buffer) >= max_samples:
+            audio_buffer = audio_buffer[max_samples - overlap_samples:]
+    return copied
+
+
+def run_ring_buffer(chunks, max_samples, overlap_samples):
+    """AudioRingBuffer: in-place writes (mirrored), zero-copy window views."""
+    copied = 0
+    capacity = max_samples + SAMPLE_RATE * RING_BUFFER_HEADROOM_SECONDS
+    audio_buffer = AudioRingBuffer(capacity)
+    for chunk in chunks:
+        audio_buffer.append(chunk)
+        copied += 2 * chunk.nbytes
+        audio_buffer.view()
+        if len(audio_buffer) >= max_samples:
+            audio_buffer.consume(max_samples - overlap_samples)
+    return copied
+
+
+def measure(fn, chunks, max_samples, overlap_samples, repeats):
+    # Peak memory (tracemalloc tracks numpy buffers)
+    tracemalloc.start()
+    copied = fn(chunks, max_samples, overlap_samples)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Time (without tracemalloc overhead)
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(chunks, max_samples, overlap_samples)
+        best = min(best, time.perf_counter() - start)
+
+    return best / len(chunks) * 1e6, copied / len(chunks), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Per-chunk cost of np.concatenate vs AudioRingBuffer across window sizes',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python bench-buffer.py
+  python bench-buffer.py --windows 8 30 60 --chunk-ms 250
+        """)
+    parser.add_argument('--windows', type=int, nargs='+', default=[4, 8, 16, 30],
+                        help='Window sizes in seconds (default: 4 8 16 30)')
+    parser.add_argument('--overlap', type=float, default=3, help='Overlap in seconds (default: 3)')
+    parser.add_argument('--chunk-ms', type=int, default=500, help='Chunk size in ms (default: 500)')
+    parser.add_argument('--minutes', type=float, default=5, help='Minutes of audio to simulate (default: 5)')
+    parser.add_argument('--repeats', type=int, default=5, help='Timing repeats, best is kept (default: 5)')
+    args = parser.parse_args()
+
+    chunk_samples = SAMPLE_RATE * args.chunk_ms // 1000
+    num_chunks = int(args.minutes * 60 * 1000 / args.chunk_ms)
+    rng = np.random.default_rng(0)
+    chunks = [rng.standard_normal(chunk_samples).astype(np.float32) for _ in range(num_chunks)]
+
+    print("\nBUFFER MICROBENCHMARK\n")
+    print(f"{num_chunks} chunks of {args.chunk_ms} ms ({args.minutes} min of audio)")
+    print("=" * 60)
+    for window in args.windows:
+        max_samples = SAMPLE_RATE * window
+        overlap_samples = int(SAMPLE_RATE * min(args.overlap, window / 2))
+        for name, fn in (('concatenate', run_concatenate), ('ring', run_ring_buffer)):
+            us_per_chunk, copied_per_chunk, peak = measure(fn, chunks, max_samples, overlap_samples, args.repeats)
+            print(f"window {window:3}s | {name:12} | {us_per_chunk:8.2f} us/chunk | "
+                  f"copied: {copied_per_chunk / 1024:8.1f} KiB/chunk | "
+                  f"peak traced: {peak / 1024:8.1f} KiB")
+    print("=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server import AudioProcessor, SAMPLE_RATE, pcm16_to_float32  # noqa: E402
+
+# Modes: 'tempfile' is the original path (temp file + ffmpeg per chunk), 'stdin'
+# is AudioProcessor.decode_chunk (ffmpeg per chunk, no file), 'stream' is the
+# persistent StreamingDecoder
+MODES = ('tempfile', 'stdin', 'stream')
+
+
+def load_or_generate_audio(input_file, duration, ffmpeg_path):
+    """
+    Load an audio file as 16 kHz mono int16 PCM, or generate a synthetic
+    speech-like signal (modulated tones + noise) when no file is given.
+    """
+    if input_file:
+        cmd = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-i', str(input_file),
+               '-t', str(duration), '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 's16le', '-']
+        pcm = subprocess.run(cmd, capture_output=True, check=True).stdout
+        return np.frombuffer(pcm, dtype=np.int16)
+
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    signal = envelope * (np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 440 * t))
+    signal += 0.05 * rng.standard_normal(len(t))
+    signal = signal / np.max(np.abs(signal)) * 0.5
+    return (signal * 32767).astype(np.int16)
+
+
+def encode_webm(pcm, ffmpeg_path):
+    """Encode int16 PCM to a WebM/Opus container, like MediaRecorder does."""
+    cmd = [ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+           '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', '-',
+           '-c:a', 'libopus', '-ar', '48000', '-f', 'webm', '-']
+    return subprocess.run(cmd, input=pcm.tobytes(), capture_output=True, check=True).stdout
+
+
+def build_legacy_chunks(pcm, chunk_ms, ffmpeg_path):
+    """One complete WebM container per chunk (MediaRecorder restarted every chunk)."""
+    samples_per_chunk = SAMPLE_RATE * chunk_ms // 1000
+    return [encode_webm(pcm[i:i + samples_per_chunk], ffmpeg_path)
+            for i in range(0, len(pcm), samples_per_chunk)]
+
+
+def build_stream_chunks(pcm, chunk_ms, ffmpeg_path):
+    """Fragments of one continuous WebM stream (MediaRecorder.requestData)."""
+    stream = encode_webm(pcm, ffmpeg_path)
+    num_chunks = max(1, int(np.ceil(len(pcm) / (SAMPLE_RATE * chunk_ms / 1000))))
+    bytes_per_chunk = int(np.ceil(len(stream) / num_chunks))
+    return [stream[i:i + bytes_per_chunk] for i in range(0, len(stream), bytes_per_chunk)]
+
+
+async def decode_chunk_tempfile(ffmpeg_path, audio_bytes):
+    """Baseline: the decoder before the streaming work, one temp file and one ffmpeg per chunk."""
+    input_path = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as temp_file:
+            temp_file.write(audio_bytes)
+            input_path = temp_file.name
+        cmd = [ffmpeg_path, '-y', '-i', input_path, '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 's16le', '-']
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await proc.communicate()
+        if proc.returncode != 0 or not stdout:
+            return None
+        return pcm16_to_float32(stdout)
+    finally:
+        if input_path and os.path.exists(input_path):
+            os.unlink(input_path)
+
+
+async def run_client(processor, mode, chunks, chunk_ms, realtime):
+    latencies = []
+    decoded_samples = 0
+    decoder = processor.create_stream_decoder() if mode == 'stream' else None
+
+    try:
+        for chunk in chunks:
+            sent_at = time.perf_counter()
+            if decoder is not None:
+                audio = await decoder.decode(chunk)
+            elif mode == 'tempfile':
+                audio = await decode_chunk_tempfile(processor.ffmpeg_path, chunk)
+            else:
+                audio = await processor.decode_chunk(chunk)
+            latencies.append((time.perf_counter() - sent_at) * 1000)
+            if audio is not None:
+                decoded_samples += len(audio)
+
+            if realtime:
+                await asyncio.sleep(max(0, chunk_ms / 1000 - (time.perf_counter() - sent_at)))
+    finally:
+        if decoder is not None:
+            await decoder.close()
+
+    return latencies, decoded_samples
+
+
+def cpu_seconds():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_usage.ru_utime + self_usage.ru_stime
+            + children_usage.ru_utime + children_usage.ru_stime)
+
+
+async def run_benchmark(processor, mode, chunks, num_clients, chunk_ms, realtime):
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+
+    results = await asyncio.gather(*[
+        run_client(processor, mode, chunks, chunk_ms, realtime) for _ in range(num_clients)
+    ])
+
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    latencies = np.array([lat for client_latencies, _ in results for lat in client_latencies])
+    decoded_seconds = sum(samples for _, samples in results) / SAMPLE_RATE
+
+    return {
+        'mode': mode,
+        'clients': num_clients,
+        'chunks': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'max_ms': float(np.max(latencies)),
+        'cpu_s': cpu,
+        'wall_s': wall,
+        'cpu_per_audio_min': cpu / decoded_seconds * 60 if decoded_seconds else float('nan'),
+        'decoded_s': decoded_seconds,
+    }
+
+
+def print_result(r):
+    print(f"{r['mode']:8} | clients: {r['clients']:3} | chunks: {r['chunks']:5} | "
+          f"p50: {r['p50_ms']:7.2f} ms | p95: {r['p95_ms']:7.2f} ms | max: {r['max_ms']:7.2f} ms | "
+          f"cpu: {r['cpu_s']:6.2f} s ({r['cpu_per_audio_min']:5.2f} s/audio-min) | "
+          f"decoded: {r['decoded_s']:.1f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the original temp-file decoding, per-chunk ffmpeg over stdin and '
+                    'the persistent streaming decoder',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Synthetic audio, 1, 4 and 16 concurrent clients, as fast as possible
+  python bench-decode.py --clients 1 4 16
+
+  # Real audio paced in real time
+  python bench-decode.py --input speech.mp3 --clients 8 --realtime
+        """)
+    parser.add_argument('--input', help='Audio file to use (default: synthetic signal)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of audio per client (default: 30)')
+    parser.add_argument('--chunk-ms', type=int, default=500, help='Chunk size in ms (default: 500)')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16],
+                        help='Numbers of concurrent clients to test (default: 1 4 16)')
+    parser.add_argument('--realtime', action='store_true', help='Pace chunks in real time')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES),
+                        help='Decoding paths to compare (default: all)')
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='ffmpeg binary (default: ffmpeg)')
+    args = parser.parse_args()
+
+    print("\nDECODE BENCHMARK\n")
+    pcm = load_or_generate_audio(args.input, args.duration, args.ffmpeg)
+    print(f"Audio: {len(pcm) / SAMPLE_RATE:.1f}s, chunk: {args.chunk_ms} ms")
+
+    # tempfile and stdin decode the same complete containers, so their numbers compare directly
+    legacy_chunks = build_legacy_chunks(pcm, args.chunk_ms, args.ffmpeg)
+    chunks = {
+        'tempfile': legacy_chunks,
+        'stdin': legacy_chunks,
+        'stream': build_stream_chunks(pcm, args.chunk_ms, args.ffmpeg),
+    }
+    processor = AudioProcessor(ffmpeg_path=args.ffmpeg)
+
+    print("=" * 60)
+    for num_clients in args.clients:
+        for mode in args.modes:
+            result = asyncio.run(run_benchmark(processor, mode, chunks[mode], num_clients,
+                                               args.chunk_ms, args.realtime))
+            print_result(result)
+    print("=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import whisper
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server import (  # noqa: E402
+    AudioRingBuffer, MelFeatureCache, MAX_BUFFER_SECONDS, OVERLAP_SECONDS,
+    RING_BUFFER_HEADROOM_SECONDS, SAMPLE_RATE
+)
+
+
+def window_calls(audio, chunk_ms):
+    """
+    Yield the windows the handler transcribes in window mode: one call per chunk,
+    rollover with OVERLAP_SECONDS kept when the window is full.
+    """
+    chunk = SAMPLE_RATE * chunk_ms // 1000
+    max_samples = SAMPLE_RATE * MAX_BUFFER_SECONDS
+    buffer = AudioRingBuffer(SAMPLE_RATE * (MAX_BUFFER_SECONDS + RING_BUFFER_HEADROOM_SECONDS))
+    for i in range(0, len(audio), chunk):
+        buffer.append(audio[i:i + chunk])
+        yield buffer
+        if len(buffer) >= max_samples:
+            buffer.consume(max_samples - SAMPLE_RATE * OVERLAP_SECONDS)
+
+
+def run(mode, audio, chunk_ms, n_mels, model):
+    filters = whisper.audio.mel_filters("cpu", n_mels).numpy()
+    cache = None
+    mel_ms, encoder_ms = [], []
+    for buffer in window_calls(audio, chunk_ms):
+        window = buffer.view()
+        started = time.perf_counter()
+        if mode == 'cached':
+            if cache is None:
+                cache = MelFeatureCache(buffer)
+            mel = torch.from_numpy(cache.log_mel(window, filters))
+        else:
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(window), n_mels=n_mels)
+        mel_ms.append((time.perf_counter() - started) * 1000)
+
+        if model is not None:
+            started = time.perf_counter()
+            with torch.no_grad():
+                model.embed_audio(mel.unsqueeze(0).to(model.device))
+            encoder_ms.append((time.perf_counter() - started) * 1000)
+    return mel_ms, encoder_ms, cache
+
+
+def max_difference(audio, chunk_ms, n_mels):
+    """Largest absolute difference between the cached and the full spectrogram."""
+    filters = whisper.audio.mel_filters("cpu", n_mels).numpy()
+    cache = None
+    worst = 0.0
+    for buffer in window_calls(audio, chunk_ms):
+        if cache is None:
+            cache = MelFeatureCache(buffer)
+        full = whisper.log_mel_spectrogram(whisper.pad_or_trim(buffer.view()), n_mels=n_mels).numpy()
+        worst = max(worst, float(np.abs(cache.log_mel(buffer.view(), filters) - full).max()))
+    return worst
+
+
+def describe(values):
+    arr = np.array(values)
+    return f"avg {arr.mean():7.2f} ms | p50 {np.percentile(arr, 50):7.2f} ms | p95 {np.percentile(arr, 95):7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Per-call log-mel cost of whisper.log_mel_spectrogram vs the incremental MelFeatureCache',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python bench-mel.py
+  python bench-mel.py --model base --threads 4 --minutes 2
+        """)
+    parser.add_argument('--minutes', type=float, default=1, help='Minutes of audio per run (default: 1)')
+    parser.add_argument('--chunk-ms', type=int, default=500, help='Chunk size in ms (default: 500)')
+    parser.add_argument('--n-mels', type=int, default=80, help='Mel bands, 128 for large-v3 (default: 80)')
+    parser.add_argument('--model', help='Also time the encoder of this model, for scale (default: off)')
+    parser.add_argument('--threads', type=int, help='torch threads (default: torch default)')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    rng = np.random.default_rng(0)
+    audio = (0.1 * rng.standard_normal(int(args.minutes * 60 * SAMPLE_RATE))).astype(np.float32)
+
+    model = None
+    n_mels = args.n_mels
+    if args.model:
+        model = whisper.load_model(args.model, device="cpu")
+        n_mels = model.dims.n_mels
+
+    print("\nLOG-MEL BENCHMARK\n")
+    print(f"{args.minutes} min of audio, {args.chunk_ms} ms chunks, {MAX_BUFFER_SECONDS}s window, "
+          f"{OVERLAP_SECONDS}s overlap, {n_mels} mels, {torch.get_num_threads()} threads")
+    print("=" * 60)
+    results = {}
+    for mode in ('full', 'cached'):
+        mel_ms, encoder_ms, cache = run(mode, audio, args.chunk_ms, n_mels, model)
+        results[mode] = np.mean(mel_ms)
+        print(f"{mode:7} | log-mel: {describe(mel_ms)}")
+        if encoder_ms:
+            print(f"{'':7} | encoder: {describe(encoder_ms)}")
+        if cache is not None:
+            print(f"{'':7} | frames: {cache.stats()}")
+    print("-" * 60)
+    print(f"Log-mel speedup:   {results['full'] / results['cached']:.1f}x")
+    print(f"Max difference:    {max_difference(audio[:SAMPLE_RATE * 30], args.chunk_ms, n_mels):.2e}")
+    print("=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server import (  # noqa: E402
+    AUDIO_FRAME_HEADER, AUDIO_FRAME_VERSION, decode_data_url, parse_audio_frame
+)
+
+
+def build_json_message(seq, payload):
+    """Message as sent by the JSON protocol (data URL in base64)."""
+    data_url = "data:audio/webm;codecs=opus;base64," + base64.b64encode(payload).decode('ascii')
+    return json.dumps({
+        "type": "audio_chunk",
+        "audio": data_url,
+        "codec": "webm-stream",
+        "seq": seq,
+        "duration": 500,
+        "timestamp": int(time.time() * 1000),
+    })
+
+
+def build_binary_message(seq, payload):
+    """Message as sent by the binary protocol (16-byte header + raw bytes)."""
+    header = AUDIO_FRAME_HEADER.pack(AUDIO_FRAME_VERSION, 1, 0, seq, int(time.time() * 1000))
+    return header + payload
+
+
+def parse_json(message):
+    data = json.loads(message)
+    return decode_data_url(data.get("audio", ""))
+
+
+def parse_binary(message):
+    return parse_audio_frame(message)["audio"]
+
+
+def cpu_time(parse, messages, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.process_time()
+        for message in messages:
+            parse(message)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Wire bytes and server parsing CPU of JSON/base64 vs binary audio frames',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python bench-protocol.py
+  python bench-protocol.py --bitrate-kbps 128 --chunk-ms 250
+        """)
+    parser.add_argument('--bitrate-kbps', type=float, default=64,
+                        help='Opus bitrate produced by MediaRecorder (default: 64)')
+    parser.add_argument('--chunk-ms', type=int, default=500, help='Chunk size in ms (default: 500)')
+    parser.add_argument('--minutes', type=float, default=1, help='Minutes of audio (default: 1)')
+    parser.add_argument('--repeats', type=int, default=20, help='Timing repeats, best is kept (default: 20)')
+    args = parser.parse_args()
+
+    num_chunks = int(args.minutes * 60 * 1000 / args.chunk_ms)
+    chunk_bytes = int(args.bitrate_kbps * 1000 / 8 * args.chunk_ms / 1000)
+    # Opus output is close to incompressible, random bytes are a fair stand-in
+    payloads = [os.urandom(chunk_bytes) for _ in range(num_chunks)]
+
+    json_messages = [build_json_message(i, p) for i, p in enumerate(payloads)]
+    binary_messages = [build_binary_message(i, p) for i, p in enumerate(payloads)]
+
+    for json_msg, binary_msg, payload in zip(json_messages, binary_messages, payloads):
+        assert parse_json(json_msg) == payload and parse_binary(binary_msg) == payload
+
+    json_bytes = sum(len(m.encode('utf-8')) for m in json_messages)
+    binary_bytes = sum(len(m) for m in binary_messages)
+    json_cpu = cpu_time(parse_json, json_messages, args.repeats)
+    binary_cpu = cpu_time(parse_binary, binary_messages, args.repeats)
+
+    per_minute = 1 / args.minutes
+    print("\nAUDIO PROTOCOL BENCHMARK\n")
+    print(f"{num_chunks} chunks of {chunk_bytes} bytes ({args.bitrate_kbps} kbps, {args.chunk_ms} ms)")
+    print("=" * 60)
+    print(f"{'':8} | {'bytes/min':>12} | {'server CPU ms/min':>18}")
+    print(f"{'json':8} | {json_bytes * per_minute:12,.0f} | {json_cpu * 1000 * per_minute:18.3f}")
+    print(f"{'binary':8} | {binary_bytes * per_minute:12,.0f} | {binary_cpu * 1000 * per_minute:18.3f}")
+    print("-" * 60)
+    print(f"Bytes saved:   {1 - binary_bytes / json_bytes:.1%}")
+    if json_cpu > 0:
+        print(f"CPU saved:     {1 - binary_cpu / json_cpu:.1%}")
+    print("=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
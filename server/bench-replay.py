@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import importlib.util
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import websockets
+
+sys.path.insert(0, str(Path(__file__).parent))
+import server  # noqa: E402
+from server import (  # noqa: E402
+    AUDIO_FRAME_CODECS, AUDIO_FRAME_HEADER, AUDIO_FRAME_VERSION, SAMPLE_RATE, AudioProcessor
+)
+
+TEST_DATA_DIR = Path(__file__).parent / "test-data"
+CODEC_IDS = {name: codec_id for codec_id, name in AUDIO_FRAME_CODECS.items()}
+
+
+def load_calc_wer():
+    """calc-wer.py has a hyphen in its name, so it is loaded by path."""
+    spec = importlib.util.spec_from_file_location("calc_wer", Path(__file__).parent / "calc-wer.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_audio(path, ffmpeg_path):
+    """Decode any audio file to 16 kHz mono int16 PCM."""
+    cmd = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-i', str(path),
+           '-ar', str(SAMPLE_RATE), '-ac', '1', '-f', 's16le', '-']
+    pcm = subprocess.run(cmd, capture_output=True, check=True).stdout
+    return np.frombuffer(pcm, dtype=np.int16)
+
+
+def encode_webm(pcm, ffmpeg_path):
+    """Encode int16 PCM to a WebM/Opus container, like MediaRecorder does."""
+    cmd = [ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+           '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', '-',
+           '-c:a', 'libopus', '-ar', '48000', '-f', 'webm', '-']
+    return subprocess.run(cmd, input=pcm.tobytes(), capture_output=True, check=True).stdout
+
+
+def build_chunks(pcm, codec, chunk_ms, ffmpeg_path):
+    """
+    Cut the audio the way offscreen.js does: Int16 slices of chunk_ms from the
+    AudioWorklet ("pcm-s16le") or fragments of one continuous WebM stream
+    delivered by requestData() ("webm-stream").
+    """
+    samples_per_chunk = SAMPLE_RATE * chunk_ms // 1000
+    if codec == 'pcm-s16le':
+        return [pcm[i:i + samples_per_chunk].tobytes() for i in range(0, len(pcm), samples_per_chunk)]
+
+    stream = encode_webm(pcm, ffmpeg_path)
+    num_chunks = max(1, int(np.ceil(len(pcm) / samples_per_chunk)))
+    bytes_per_chunk = int(np.ceil(len(stream) / num_chunks))
+    return [stream[i:i + bytes_per_chunk] for i in range(0, len(stream), bytes_per_chunk)]
+
+
+def find_reference(audio_path, refs_dir):
+    ref_file = Path(refs_dir) / f"{Path(audio_path).stem}_ref.txt"
+    return ref_file.read_text(encoding='utf-8').strip() if ref_file.exists() else None
+
+
+def load_manifest(path):
+    """(audio, name, reference text) for each line of an add-noise.py manifest.jsonl."""
+    inputs = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            reference = Path(row['reference']).read_text(encoding='utf-8').strip() if row.get('reference') else None
+            inputs.append((row['audio'], row['name'], reference))
+    return inputs
+
+
+async def run_client(url, chunks, codec, chunk_ms, speed, language, drain_timeout):
+    """
+    One simulated extension: negotiates binary frames, sends every chunk with its
+    seq (paced at `speed` times real time, 0 = as fast as possible) and records
+    when each transcription arrives.
+    """
+    sent_at = {}
+    received = []
+
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(json.dumps({"type": "protocol_config", "audio_frames": "binary"}))
+        if language:
+            await ws.send(json.dumps({"type": "language_config", "language": language}))
+
+        async def receive():
+            async for raw in ws:
+                data = json.loads(raw)
+                if data.get("type") == "transcription":
+                    received.append((time.perf_counter(), data))
+
+        receiver = asyncio.create_task(receive())
+        started = time.perf_counter()
+        for seq, payload in enumerate(chunks):
+            if speed > 0:
+                await asyncio.sleep(max(0, started + seq * chunk_ms / 1000 / speed - time.perf_counter()))
+            header = AUDIO_FRAME_HEADER.pack(AUDIO_FRAME_VERSION, CODEC_IDS[codec], 0, seq, int(time.time() * 1000))
+            sent_at[seq] = time.perf_counter()
+            await ws.send(header + payload)
+        last_sent = time.perf_counter()
+
+        # Wait for the last transcriptions: stop once the server goes quiet
+        while True:
+            count = len(received)
+            await asyncio.sleep(drain_timeout)
+            if len(received) == count:
+                break
+        receiver.cancel()
+
+    latencies = [(arrived - sent_at[data["seq"]]) * 1000
+                 for arrived, data in received if data.get("seq") in sent_at]
+    return {
+        "hypothesis": received[-1][1]["text"].strip() if received else "",
+        "messages": len(received),
+        "first_token_ms": (received[0][0] - started) * 1000 if received else None,
+        "finalization_ms": max(0.0, (received[-1][0] - last_sent) * 1000) if received else None,
+        "latencies_ms": latencies,
+        "wall_s": (received[-1][0] if received else last_sent) - started,
+    }
+
+
+def cpu_seconds():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_usage.ru_utime + self_usage.ru_stime
+            + children_usage.ru_utime + children_usage.ru_stime)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 2) if len(values) else None
+
+
+def score(calc_wer, results):
+    """Micro WER over every client/file pair, through calc-wer.py's metrics."""
+    totals = {"hits": 0, "substitutions": 0, "deletions": 0, "insertions": 0}
+    for r in results:
+        if not r["reference"] or not r["hypothesis"]:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = calc_wer.calculate_wer(r["reference"], r["hypothesis"], r["name"])
+        r["wer"] = metrics["wer"]
+        for key in totals:
+            totals[key] += metrics[key]
+    ref_words = totals["hits"] + totals["substitutions"] + totals["deletions"]
+    if not ref_words:
+        return None
+    return (totals["substitutions"] + totals["deletions"] + totals["insertions"]) / ref_words
+
+
+async def run_replay(url, files, num_clients, args):
+    """N clients, each replaying every file in turn (clients start together)."""
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    # In-process server only: audio seconds the server decoded, per tier
+    decoded_start = None if args.url else dict(server.processor.decoded_seconds)
+
+    async def client_session(client_id):
+        results = []
+        for f in files:
+            r = await run_client(url, f["chunks"], args.codec, args.chunk_ms, args.speed,
+                                 args.language, args.drain_timeout)
+            r.update(name=f["name"], client=client_id, reference=f["reference"], audio_s=f["audio_s"])
+            results.append(r)
+        return results
+
+    sessions = await asyncio.gather(*[client_session(i) for i in range(num_clients)])
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    results = [r for session in sessions for r in session]
+    latencies = [lat for r in results for lat in r["latencies_ms"]]
+    first_tokens = [r["first_token_ms"] for r in results if r["first_token_ms"] is not None]
+    finalizations = [r["finalization_ms"] for r in results if r["finalization_ms"] is not None]
+    audio_s = sum(r["audio_s"] for r in results)
+    decoded = None
+    if decoded_start is not None:
+        decoded = {tier: seconds - decoded_start.get(tier, 0.0)
+                   for tier, seconds in server.processor.decoded_seconds.items()}
+
+    return {
+        "clients": num_clients,
+        "wer": score(args.calc_wer, results),
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "first_token_p50_ms": percentile(first_tokens, 50),
+        "finalization_p50_ms": percentile(finalizations, 50),
+        "finalization_p95_ms": percentile(finalizations, 95),
+        # Per-session RTF: time until the last transcription / audio duration
+        "rtf": round(sum(r["wall_s"] for r in results) / audio_s, 3) if audio_s else None,
+        "cpu_per_audio_min": round(cpu / audio_s * 60, 2) if audio_s else None,
+        # Audio seconds decoded by the model per second of input (window re-decodes count again)
+        "decoded_per_audio_s": round(sum(decoded.values()) / audio_s, 2) if decoded and audio_s else None,
+        "decoded_s": {tier: round(seconds, 1) for tier, seconds in decoded.items()} if decoded else None,
+        "wall_s": round(wall, 2),
+        # Audio seconds processed per wall second, all clients together
+        "throughput": round(audio_s / wall, 2) if wall else None,
+        # Whole-process peak (includes the models when the server runs in-process)
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "files": [{"name": r["name"], "client": r["client"], "wer": r.get("wer"),
+                   "first_token_ms": r["first_token_ms"], "finalization_ms": r["finalization_ms"],
+                   "messages": r["messages"], "hypothesis": r["hypothesis"]} for r in results],
+    }
+
+
+@contextlib.asynccontextmanager
+async def local_server(args):
+    """Start the real handler in this process on an ephemeral port."""
+    server.processor = AudioProcessor(model_size=args.model, backend=args.backend, threads=args.threads)
+    if not args.no_batching:
+        server.processor.enable_batching()
+    await server.processor.initialize_models()
+
+    session_handler = functools.partial(
+        server.handler, streaming_mode=args.streaming_mode, use_vad=not args.no_vad
+    )
+    async with websockets.serve(session_handler, "127.0.0.1", 0, max_size=None) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        yield f"ws://127.0.0.1:{port}"
+
+
+# Metrics compared against the baseline (higher is worse for all of them)
+BASELINE_METRICS = ("wer", "latency_p50_ms", "latency_p95_ms", "first_token_p50_ms",
+                    "finalization_p50_ms", "rtf", "cpu_per_audio_min", "decoded_per_audio_s")
+
+
+def compare_with_baseline(reports, baseline, wer_tolerance, relative_tolerance):
+    """Print the deltas against a saved report; returns the regressions found."""
+    regressions = []
+    by_clients = {b["clients"]: b for b in baseline["runs"]}
+    for report in reports:
+        base = by_clients.get(report["clients"])
+        if base is None:
+            continue
+        for key in BASELINE_METRICS:
+            new, old = report.get(key), base.get(key)
+            if new is None or old is None:
+                continue
+            if key == "wer":
+                regressed = new - old > wer_tolerance
+            else:
+                regressed = old > 0 and (new - old) / old > relative_tolerance
+            marker = "REGRESSION" if regressed else ""
+            print(f"clients {report['clients']:3} | {key:20} | baseline: {old:10.3f} | "
+                  f"now: {new:10.3f} | {marker}")
+            if regressed:
+                regressions.append((report["clients"], key, old, new))
+    return regressions
+
+
+def print_report(r):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    print(f"clients: {r['clients']:3} | WER: {fmt(r['wer'], '.2%')} | "
+          f"latency p50/p95: {fmt(r['latency_p50_ms'], '.0f')}/{fmt(r['latency_p95_ms'], '.0f')} ms | "
+          f"first token: {fmt(r['first_token_p50_ms'], '.0f')} ms | "
+          f"finalization p50/p95: {fmt(r['finalization_p50_ms'], '.0f')}/{fmt(r['finalization_p95_ms'], '.0f')} ms | "
+          f"RTF: {fmt(r['rtf'], '.2f')} | decoded: {fmt(r['decoded_per_audio_s'], '.1f')} s/audio-s | throughput: {fmt(r['throughput'], '.1f')}x | CPU: {fmt(r['cpu_per_audio_min'], '.1f')} s/audio-min | "
+          f"peak RSS: {r['peak_rss_mb']:.0f} MB")
+
+
+async def run(args, files):
+    reports = []
+    server_context = local_server(args) if not args.url else contextlib.nullcontext(args.url)
+    async with server_context as url:
+        for num_clients in args.clients:
+            report = await run_replay(url, files, num_clients, args)
+            print_report(report)
+            reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay audio files through the streaming server like the extension does '
+                    'and report WER, latency, RTF and CPU',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # In-process server, real-time pacing, 1 and 4 clients
+  python bench-replay.py test-data/01_limpo.wav test-data/02_ruido.wav --clients 1 4
+
+  # Accelerated replay, save the report as the new baseline
+  python bench-replay.py test-data/*.wav --speed 4 --save-baseline baseline.json
+
+  # Compare against the baseline (exit code 1 on regression)
+  python bench-replay.py test-data/*.wav --speed 4 --baseline baseline.json
+
+  # Audio decoded per second of input, window vs incremental mode
+  python bench-replay.py test-data/*.wav --speed 0
+  python bench-replay.py test-data/*.wav --speed 0 --streaming-mode incremental
+
+  # Float32 vs int8 backend on the same data, 4 threads each
+  python bench-replay.py test-data/*.wav --speed 0 --threads 4 --save-baseline torch.json
+  python bench-replay.py test-data/*.wav --speed 0 --threads 4 --backend int8 --baseline torch.json
+
+  # Against a running server
+  python bench-replay.py speech.mp3 --url ws://localhost:8765
+
+  # Noisy set from add-noise.py --batch (references come from the manifest)
+  python bench-replay.py --manifest noisy/manifest.jsonl --save-hypo noisy/
+        """)
+    parser.add_argument('inputs', nargs='*', help='Audio files (references: <stem>_ref.txt in --refs-dir)')
+    parser.add_argument('--manifest',
+                        help='add-noise.py manifest.jsonl: replay its audio files against their references')
+    parser.add_argument('--refs-dir', default=str(TEST_DATA_DIR),
+                        help='Directory with the <stem>_ref.txt references (default: test-data)')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1],
+                        help='Numbers of concurrent clients to test (default: 1)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Replay speed, 1 = real time, 0 = as fast as possible (default: 1)')
+    parser.add_argument('--codec', choices=['pcm-s16le', 'webm-stream'], default='webm-stream',
+                        help='Capture mode to simulate (default: webm-stream)')
+    parser.add_argument('--chunk-ms', type=int, default=500, help='Chunk size in ms (default: 500)')
+    parser.add_argument('--tail-silence', type=float, default=2.0,
+                        help='Seconds of silence appended so the last sentence is finalized (default: 2)')
+    parser.add_argument('--drain-timeout', type=float, default=3.0,
+                        help='Seconds without messages after the last chunk to end a session (default: 3)')
+    parser.add_argument('--language', help='Language sent to the server (default: auto detection)')
+    parser.add_argument('--url', help='Server to test (default: start the handler in this process)')
+    parser.add_argument('--model', default='base', help='Whisper model for the in-process server (default: base)')
+    parser.add_argument('--streaming-mode', choices=['window', 'incremental'], default='window',
+                        help='Streaming mode of the in-process server (default: window)')
+    parser.add_argument('--backend', choices=sorted(server.INFERENCE_BACKENDS), default='torch',
+                        help='Inference backend of the in-process server (default: torch)')
+    parser.add_argument('--threads', type=int, help='PyTorch threads of the in-process server (default: all cores)')
+    parser.add_argument('--no-vad', action='store_true', help='Disable VAD in the in-process server')
+    parser.add_argument('--no-batching', action='store_true', help='Disable batching in the in-process server')
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='ffmpeg binary (default: ffmpeg)')
+    parser.add_argument('--save-hypo', metavar='DIR',
+                        help='Write <stem>_hypo.txt (client 0) to DIR, for calc-wer.py')
+    parser.add_argument('--output', help='Write the full report as JSON')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the report as the new baseline')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare against a saved baseline')
+    parser.add_argument('--wer-tolerance', type=float, default=0.01,
+                        help='Allowed absolute WER increase over the baseline (default: 0.01)')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative increase of latency/RTF/CPU over the baseline (default: 0.2)')
+    args = parser.parse_args()
+    if not args.inputs and not args.manifest:
+        parser.error('give audio files or --manifest')
+    args.calc_wer = load_calc_wer()
+
+    print("\nSTREAMING REPLAY BENCHMARK\n")
+    files = []
+    tail = np.zeros(int(args.tail_silence * SAMPLE_RATE), dtype=np.int16)
+    inputs = [(path, Path(path).stem, find_reference(path, args.refs_dir)) for path in args.inputs]
+    if args.manifest:
+        inputs += load_manifest(args.manifest)
+    for path, name, reference in inputs:
+        pcm = np.concatenate([load_audio(path, args.ffmpeg), tail])
+        files.append({
+            "name": name,
+            "audio_s": len(pcm) / SAMPLE_RATE,
+            "reference": reference,
+            "chunks": build_chunks(pcm, args.codec, args.chunk_ms, args.ffmpeg),
+        })
+        print(f"  - {name}: {len(pcm) / SAMPLE_RATE:.1f}s, "
+              f"{len(files[-1]['chunks'])} chunks, reference: {'yes' if reference else 'no'}")
+
+    print(f"\ncodec: {args.codec}, chunk: {args.chunk_ms} ms, speed: {args.speed or 'max'}, "
+          f"server: {args.url or f'in-process ({args.model}, {args.backend}, {args.streaming_mode})'}")
+    print("=" * 60)
+    reports = asyncio.run(run(args, files))
+    print("=" * 60 + "\n")
+
+    if args.save_hypo:
+        Path(args.save_hypo).mkdir(parents=True, exist_ok=True)
+        for entry in reports[0]["files"]:
+            if entry["client"] == 0:
+                (Path(args.save_hypo) / f"{entry['name']}_hypo.txt").write_text(entry["hypothesis"] + "\n",
+                                                                               encoding='utf-8')
+
+    document = {
+        "config": {key: getattr(args, key) for key in
+                   ("codec", "chunk_ms", "speed", "model", "backend", "threads", "streaming_mode",
+                    "no_vad", "no_batching", "url")},
+        "inputs": [f["name"] for f in files],
+        "runs": reports,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(document, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        print("BASELINE COMPARISON\n")
+        regressions = compare_with_baseline(reports, baseline, args.wer_tolerance, args.tolerance)
+        print(f"\n{len(regressions)} regression(s)\n")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import importlib.util
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent))
+from server import BACKPRESSURE_LATENCY_MS, SAMPLE_RATE, http_get  # noqa: E402
+
+SERVER_PATH = Path(__file__).parent / "server.py"
+
+
+def load_replay():
+    """bench-replay.py has a hyphen in its name, so it is loaded by path."""
+    spec = importlib.util.spec_from_file_location("bench_replay", Path(__file__).parent / "bench-replay.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def wait_ready(http_port, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            status, _ = await http_get("127.0.0.1", http_port, "/ready")
+            if status == 200:
+                return True
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            pass
+        await asyncio.sleep(1)
+    return False
+
+
+async def run_load(replay, url, chunks, num_clients, args):
+    """num_clients real-time streams at once; per-chunk latencies of all of them."""
+    results = await asyncio.gather(*[
+        replay.run_client(url, chunks, args.codec, args.chunk_ms, 1.0, args.language, args.drain_timeout)
+        for _ in range(num_clients)
+    ], return_exceptions=True)
+    failed = sum(isinstance(r, Exception) for r in results)
+    latencies = [lat for r in results if not isinstance(r, Exception) for lat in r["latencies_ms"]]
+    return {
+        "clients": num_clients,
+        "failed": failed,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else None,
+    }
+
+
+async def measure_workers(replay, workers, chunks, args):
+    """Start the server with `workers` processes and ramp up clients until the latency budget breaks."""
+    command = [sys.executable, str(SERVER_PATH), "--host", "127.0.0.1", "--port", str(args.port),
+               "--http-port", str(args.port + 1), "--workers", str(workers), "--model", args.model,
+               "--backend", args.backend]
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not await wait_ready(args.port + 1, args.startup_timeout):
+            print(f"workers: {workers:2} | server did not become ready in {args.startup_timeout}s")
+            return None
+        # The supervisor's /ready turns green with the first worker: give the others time
+        await asyncio.sleep(args.settle)
+
+        sustained = 0
+        for num_clients in args.clients:
+            r = await run_load(replay, f"ws://127.0.0.1:{args.port}", chunks, num_clients, args)
+            ok = r["failed"] == 0 and r["p95_ms"] is not None and r["p95_ms"] <= args.latency_budget_ms
+            print(f"workers: {workers:2} | clients: {num_clients:3} | "
+                  f"p50: {r['p50_ms'] or float('nan'):8.1f} ms | p95: {r['p95_ms'] or float('nan'):8.1f} ms | "
+                  f"failed: {r['failed']} | {'ok' if ok else 'over budget'}")
+            if not ok:
+                break
+            sustained = num_clients
+        return sustained
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def run(replay, args, chunks):
+    sustained = {}
+    for workers in args.workers:
+        sustained[workers] = await measure_workers(replay, workers, chunks, args)
+    return sustained
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Real-time streams per box as the number of worker processes grows',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python bench-scaling.py test-data/01_limpo.wav --workers 1 2 4 --clients 1 2 4 8 16 32
+  python bench-scaling.py speech.mp3 --duration 20 --backend int8 --latency-budget-ms 1500
+        """)
+    parser.add_argument('input', help='Audio file replayed by every client')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of audio per client (default: 30)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='Worker process counts to test (default: 1 2 4)')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='Concurrent client ramp (default: 1 2 4 8 16 32)')
+    parser.add_argument('--latency-budget-ms', type=float, default=BACKPRESSURE_LATENCY_MS,
+                        help=f'p95 chunk latency a load must stay under (default: {BACKPRESSURE_LATENCY_MS})')
+    parser.add_argument('--model', default='base', help='Whisper model (default: base)')
+    parser.add_argument('--backend', default='torch', help='Inference backend (default: torch)')
+    parser.add_argument('--codec', choices=['pcm-s16le', 'webm-stream'], default='pcm-s16le',
+                        help='Capture mode to simulate (default: pcm-s16le)')
+    parser.add_argument('--chunk-ms', type=int, default=500, help='Chunk size in ms (default: 500)')
+    parser.add_argument('--language', default='en', help='Language sent to the server (default: en)')
+    parser.add_argument('--drain-timeout', type=float, default=3.0,
+                        help='Seconds without messages that end a session (default: 3)')
+    parser.add_argument('--port', type=int, default=8780, help='Port of the server under test (default: 8780)')
+    parser.add_argument('--startup-timeout', type=float, default=300,
+                        help='Seconds to wait for the models to load (default: 300)')
+    parser.add_argument('--settle', type=float, default=10,
+                        help='Extra seconds for the remaining workers after the first is ready (default: 10)')
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='ffmpeg binary (default: ffmpeg)')
+    args = parser.parse_args()
+
+    replay = load_replay()
+    pcm = replay.load_audio(args.input, args.ffmpeg)[:int(args.duration * SAMPLE_RATE)]
+    chunks = replay.build_chunks(pcm, args.codec, args.chunk_ms, args.ffmpeg)
+
+    print("\nSCALING BENCHMARK\n")
+    print(f"{len(pcm) / SAMPLE_RATE:.1f}s per client, {args.codec}, model {args.model} ({args.backend}), "
+          f"p95 budget {args.latency_budget_ms:.0f} ms")
+    print("=" * 60)
+    sustained = asyncio.run(run(replay, args, chunks))
+    print("-" * 60)
+    base = sustained.get(min(sustained)) or 0
+    for workers, streams in sustained.items():
+        if streams is None:
+            continue
+        scaling = f"{streams / base:.2f}x" if base else "-"
+        print(f"workers: {workers:2} | real-time streams: {streams:3} | vs {min(sustained)} worker(s): {scaling}")
+    print("=" * 60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
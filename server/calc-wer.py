@@ -1,112 +1,214 @@
-import jiwer
+import argparse
+import csv
+import json
 import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import jiwer
+
 # Directory where test files are stored
 TEST_DATA_DIR = Path(__file__).parent / "test-data"
 
+# Noise condition of a test: an add-noise.py condition (snr10_x -> snr10,
+# snr-5_x -> snr-5, snr2.5_x -> snr2.5, clean_x -> clean), or else the leading
+# words of its name, after an optional numeric index and up to the first digit
+# or directory separator (01_limpo -> limpo, 03_ruido_sons -> ruido_sons,
+# ruido/0001 -> ruido)
+CONDITION_PATTERN = r'^(?:\d+_)?((?:snr-?\d+(?:\.\d+)?|clean)(?=_|/|$)|[^\W\d]+(?:_[^\W\d]+)*)'
+
+CSV_FIELDS = ['name', 'condition', 'status', 'wer', 'hits', 'substitutions', 'deletions',
+              'insertions', 'total_words', 'error']
+
+
 def load_text_file(filepath):
     """Load the content of a text file."""
     with open(filepath, 'r', encoding='utf-8') as f:
         return f.read().strip()
 
-def get_test_files():
-    """List all test file pairs (ref + hypo)."""
-    files = sorted(os.listdir(TEST_DATA_DIR))
-    
-    # Group files by prefix (01_, 02_, 03_)
+def get_test_files(data_dir=TEST_DATA_DIR):
+    """List all test file pairs (ref + hypo), including subdirectories."""
+    data_dir = Path(data_dir)
     test_pairs = []
-    prefixes = set()
-    
-    for file in files:
-        if file.endswith('_ref.txt'):
-            prefix = file.replace('_ref.txt', '')
-            prefixes.add(prefix)
-    
-    for prefix in sorted(prefixes):
-        ref_file = TEST_DATA_DIR / f"{prefix}_ref.txt"
-        hypo_file = TEST_DATA_DIR / f"{prefix}_hypo.txt"
-        
-        if ref_file.exists() and hypo_file.exists():
+
+    # Group files by prefix (01_, 02_, 03_ or subdir/name_)
+    for ref_file in sorted(data_dir.rglob('*_ref.txt')):
+        hypo_file = ref_file.with_name(ref_file.name.replace('_ref.txt', '_hypo.txt'))
+        if hypo_file.exists():
             test_pairs.append({
-                'name': prefix,
+                'name': ref_file.relative_to(data_dir).as_posix()[:-len('_ref.txt')],
                 'ref_file': ref_file,
                 'hypo_file': hypo_file
             })
-    
+
     return test_pairs
 
+def condition_of(name, pattern=CONDITION_PATTERN):
+    """Noise condition bucket of a test name."""
+    match = re.match(pattern, name)
+    return match.group(1) if match and match.groups() else 'other'
+
+def load_manifest(path):
+    """Test name -> condition, from an add-noise.py manifest.jsonl."""
+    conditions = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                conditions[row['name']] = row['condition']
+    return conditions
+
+def measure(reference, hypothesis):
+    """WER and error counts from a single alignment."""
+    result = jiwer.process_words([reference], [hypothesis])
+    return {
+        'wer': result.wer,
+        'hits': result.hits,
+        'substitutions': result.substitutions,
+        'deletions': result.deletions,
+        'insertions': result.insertions,
+        'total_words': result.hits + result.substitutions + result.deletions
+    }
+
 def calculate_wer(reference, hypothesis, test_name):
     """Calculate WER and display detailed results."""
     print(f"\n{'='*60}")
     print(f"TEST: {test_name}")
     print(f"{'='*60}")
-    
-    # Calculate basic WER
-    error_rate = jiwer.wer(reference, hypothesis)
-    
-    # Get detailed metrics
-    result = jiwer.process_words([reference], [hypothesis])
-    
-    total_words_ref = result.hits + result.substitutions + result.deletions
-    
+
+    metrics = measure(reference, hypothesis)
+
     print(f"\nRESULTS:")
-    print(f"  WER (Error Rate):          {error_rate:.2%}")
-    print(f"  Hits (Correct):            {result.hits}")
-    print(f"  Substitutions:             {result.substitutions}")
-    print(f"  Deletions:                 {result.deletions}")
-    print(f"  Insertions:                {result.insertions}")
-    print(f"  Total reference words:     {total_words_ref}")
+    print(f"  WER (Error Rate):          {metrics['wer']:.2%}")
+    print(f"  Hits (Correct):            {metrics['hits']}")
+    print(f"  Substitutions:             {metrics['substitutions']}")
+    print(f"  Deletions:                 {metrics['deletions']}")
+    print(f"  Insertions:                {metrics['insertions']}")
+    print(f"  Total reference words:     {metrics['total_words']}")
     print(f"\n{'='*60}\n")
-    
+
+    return {'name': test_name, **metrics}
+
+def evaluate_pair(pair, pattern=CONDITION_PATTERN):
+    """Batch worker: score one pair without printing; errors become a status."""
+    row = {'name': pair['name'], 'condition': condition_of(pair['name'], pattern)}
+    try:
+        reference = load_text_file(pair['ref_file'])
+        hypothesis = load_text_file(pair['hypo_file'])
+        if not reference or not hypothesis:
+            return {**row, 'status': 'skipped', 'error': 'empty file(s)'}
+        return {**row, 'status': 'ok', **measure(reference, hypothesis)}
+    except Exception as e:
+        return {**row, 'status': 'error', 'error': str(e)}
+
+def aggregate(rows):
+    """
+    Corpus-level WER: micro (total errors / total reference words, long
+    utterances weigh more) and macro (mean of per-utterance WER).
+    """
+    scored = [r for r in rows if r['status'] == 'ok']
+    totals = {key: sum(r[key] for r in scored)
+              for key in ('hits', 'substitutions', 'deletions', 'insertions', 'total_words')}
+    errors = totals['substitutions'] + totals['deletions'] + totals['insertions']
     return {
-        'name': test_name,
-        'wer': error_rate,
-        'hits': result.hits,
-        'substitutions': result.substitutions,
-        'deletions': result.deletions,
-        'insertions': result.insertions,
-        'total_words': total_words_ref
+        'tests': len(scored),
+        'skipped': sum(r['status'] == 'skipped' for r in rows),
+        'failed': sum(r['status'] == 'error' for r in rows),
+        'micro_wer': errors / totals['total_words'] if totals['total_words'] else None,
+        'macro_wer': sum(r['wer'] for r in scored) / len(scored) if scored else None,
+        **totals
     }
 
-def main():
-    """Main function that processes all tests."""
-    print("\nWER CALCULATOR - MULTIPLE TESTS\n")
-    
-    # Check if directory exists
-    if not TEST_DATA_DIR.exists():
-        print(f"ERROR: Directory {TEST_DATA_DIR} not found!")
-        return
-    
-    # Get test files
-    test_pairs = get_test_files()
-    
-    if not test_pairs:
-        print(f"ERROR: No test file pairs found in {TEST_DATA_DIR}")
-        print("   Make sure you have files in the format: XX_name_ref.txt and XX_name_hypo.txt")
-        return
-    
+def run_batch(test_pairs, jobs, json_path=None, csv_path=None, pattern=CONDITION_PATTERN, conditions=None):
+    """
+    Score every pair in a process pool, writing each row to the JSON Lines and
+    CSV outputs as soon as it is ready (in input order), and return all rows.
+    Conditions listed in `conditions` (name -> condition) win over the pattern.
+    """
+    json_file = open(json_path, 'w', encoding='utf-8') if json_path else None
+    csv_file = open(csv_path, 'w', encoding='utf-8', newline='') if csv_path else None
+    writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS, extrasaction='ignore') if csv_file else None
+    if writer:
+        writer.writeheader()
+
+    rows = []
+    started = time.perf_counter()
+    # Large chunks keep the inter-process overhead small next to the alignment itself
+    chunksize = max(1, len(test_pairs) // (jobs * 8))
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for row in pool.map(evaluate_pair, test_pairs, [pattern] * len(test_pairs), chunksize=chunksize):
+                if conditions and row['name'] in conditions:
+                    row['condition'] = conditions[row['name']]
+                rows.append(row)
+                if json_file:
+                    json_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                if writer:
+                    writer.writerow(row)
+                if row['status'] == 'error':
+                    print(f"ERROR processing {row['name']}: {row['error']}", file=sys.stderr)
+                if len(rows) % 500 == 0:
+                    rate = len(rows) / (time.perf_counter() - started)
+                    print(f"  {len(rows)}/{len(test_pairs)} scored ({rate:.0f} pairs/s)", file=sys.stderr)
+    finally:
+        if json_file:
+            json_file.close()
+        if csv_file:
+            csv_file.close()
+    return rows
+
+def format_wer(value):
+    return f"{value:7.2%}" if value is not None else "      -"
+
+def print_batch_summary(rows, elapsed):
+    """Corpus summary followed by the breakdown per noise condition."""
+    overall = aggregate(rows)
+    print("\n" + "="*72)
+    print("CORPUS SUMMARY")
+    print("="*72)
+    print(f"  Tests scored:              {overall['tests']} "
+          f"(skipped: {overall['skipped']}, failed: {overall['failed']})")
+    print(f"  Reference words:           {overall['total_words']}")
+    print(f"  Micro WER (word-weighted): {format_wer(overall['micro_wer']).strip()}")
+    print(f"  Macro WER (per test mean): {format_wer(overall['macro_wer']).strip()}")
+    print(f"  Time:                      {elapsed:.1f}s ({len(rows) / elapsed:.0f} pairs/s)")
+
+    conditions = sorted({r['condition'] for r in rows})
+    print("-"*72)
+    print(f"{'Condition':20} | {'Tests':>6} | {'Words':>8} | {'Micro WER':>9} | {'Macro WER':>9}")
+    print("-"*72)
+    for condition in conditions:
+        bucket = aggregate([r for r in rows if r['condition'] == condition])
+        print(f"{condition:20} | {bucket['tests']:6} | {bucket['total_words']:8} | "
+              f"{format_wer(bucket['micro_wer']):>9} | {format_wer(bucket['macro_wer']):>9}")
+    print("="*72 + "\n")
+
+def run_detailed(test_pairs):
+    """Serial mode: detailed report for each test (fine for a handful of files)."""
     print(f"Found {len(test_pairs)} test(s):\n")
     for pair in test_pairs:
         print(f"  - {pair['name']}")
-    
+
     # Process each test
     results = []
     for pair in test_pairs:
         try:
             reference = load_text_file(pair['ref_file'])
             hypothesis = load_text_file(pair['hypo_file'])
-            
+
             if not reference or not hypothesis:
                 print(f"\nWARNING: {pair['name']} - empty file(s), skipping...")
                 continue
-            
+
             result = calculate_wer(reference, hypothesis, pair['name'])
             results.append(result)
-            
+
         except Exception as e:
             print(f"\nERROR processing {pair['name']}: {e}")
-    
+
     # Final summary
     if results:
         print("\n" + "="*60)
@@ -116,5 +218,66 @@ def main():
             print(f"{r['name']:20} | WER: {r['wer']:.2%} | Words: {r['total_words']}")
         print("="*60 + "\n")
 
+def main():
+    """Main function that processes all tests."""
+    parser = argparse.ArgumentParser(
+        description='Word error rate of *_hypo.txt against *_ref.txt pairs',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Detailed report for each pair in test-data/
+  python calc-wer.py
+
+  # Regression corpus: all cores, rows streamed to JSON Lines and CSV
+  python calc-wer.py --batch --data-dir corpus/ --json wer.jsonl --csv wer.csv
+
+  # Condition taken from the subdirectory instead of the name prefix
+  python calc-wer.py --batch --data-dir corpus/ --condition-pattern '^([^/]+)/'
+        """)
+    parser.add_argument('--data-dir', type=Path, default=TEST_DATA_DIR,
+                        help='Directory searched recursively for pairs (default: test-data/)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Score pairs in parallel and print corpus and per-condition WER '
+                             'instead of the per-test report')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes in batch mode (default: all cores)')
+    parser.add_argument('--json', help='Batch mode: write one JSON object per pair (JSON Lines) to this file')
+    parser.add_argument('--csv', help='Batch mode: write one CSV row per pair to this file')
+    parser.add_argument('--condition-pattern', default=CONDITION_PATTERN,
+                        help='Regex whose first group is the noise condition of a test name '
+                             '(default: leading words, e.g. 02_ruido -> ruido)')
+    parser.add_argument('--manifest',
+                        help='Batch mode: take conditions from an add-noise.py manifest.jsonl')
+    args = parser.parse_args()
+
+    print("\nWER CALCULATOR - MULTIPLE TESTS\n")
+
+    # Check if directory exists
+    if not args.data_dir.exists():
+        print(f"ERROR: Directory {args.data_dir} not found!")
+        return
+
+    # Get test files
+    test_pairs = get_test_files(args.data_dir)
+
+    if not test_pairs:
+        print(f"ERROR: No test file pairs found in {args.data_dir}")
+        print("   Make sure you have files in the format: XX_name_ref.txt and XX_name_hypo.txt")
+        return
+
+    if not args.batch:
+        run_detailed(test_pairs)
+        return
+
+    jobs = max(1, min(args.jobs, len(test_pairs)))
+    print(f"Scoring {len(test_pairs)} pair(s) with {jobs} process(es)...")
+    started = time.perf_counter()
+    conditions = load_manifest(args.manifest) if args.manifest else None
+    rows = run_batch(test_pairs, jobs, args.json, args.csv, args.condition_pattern, conditions)
+    print_batch_summary(rows, time.perf_counter() - started)
+    for path in (args.json, args.csv):
+        if path:
+            print(f"Results written to {path}")
+
 if __name__ == "__main__":
     main()
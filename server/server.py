@@ -5,11 +5,17 @@ import asyncio
 import websockets
 import json
 import base64
-import tempfile
-import os
+import struct
 import time
-import subprocess
-from typing import Optional, Dict, Any
+import argparse
+import functools
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Union
+from urllib.parse import parse_qs, urlsplit
 
 import whisper
 import numpy as np
@@ -23,31 +29,1733 @@ SAMPLE_RATE = 16000
 MAX_BUFFER_SECONDS = 8
 OVERLAP_SECONDS = 3
 
+# Protocolo binário de áudio: cabeçalho de 16 bytes (little-endian) seguido dos bytes do chunk
+#   versão (u8) | codec (u8) | flags (u16) | sequência (u32) | timestamp do cliente em ms (u64)
+AUDIO_FRAME_VERSION = 1
+AUDIO_FRAME_HEADER = struct.Struct('<BBHIQ')
+AUDIO_FRAME_CODECS = {0: "webm", 1: "webm-stream", 2: "pcm-s16le"}
+
+# Folga do ring buffer acima da janela (chunks podem passar um pouco do limite antes do corte)
+RING_BUFFER_HEADROOM_SECONDS = 2
+
+# Tempo máximo que o decoder persistente espera por PCM depois de receber um chunk
+DECODER_READ_TIMEOUT = 0.25
+
+# Agrupamento de inferência entre clientes (ajustável por linha de comando)
+BATCH_WAIT_MS = 30
+MAX_BATCH_SIZE = 8
+
+# Tradução dos segmentos confirmados (task="translate" do Whisper, que só traduz
+# para inglês): fila própria, lotes entre sessões e cache LRU por (texto, origem, destino)
+TRANSLATION_TARGETS = ("en",)
+TRANSLATION_BATCH_WAIT_MS = 200
+TRANSLATION_MAX_BATCH_SIZE = 8
+TRANSLATION_CACHE_SIZE = 4096
+# Prioridade baixa: um lote de tradução espera a fila de transcrição esvaziar, até este limite
+TRANSLATION_MAX_DEFER_MS = 2000
+
+# Modo incremental: só decodifica depois de acumular este tanto de áudio novo
+INCREMENTAL_MIN_STEP_SECONDS = 1.0
+# Áudio de palavras já confirmadas mantido no início do buffer depois de cada corte,
+# como contexto acústico para a próxima decodificação
+INCREMENTAL_OVERLAP_SECONDS = 0.5
+
+# VAD por energia: quadros de 30ms, limiar absoluto e margem sobre o ruído de fundo
+VAD_FRAME_MS = 30
+VAD_THRESHOLD_DB = -45.0
+VAD_NOISE_MARGIN_DB = 10.0
+VAD_MIN_SPEECH_RATIO = 0.1
+# Pausa mínima depois de fala para considerar fim de frase (ponto de corte da janela)
+VAD_MIN_SILENCE_SECONDS = 0.5
+
+# Pool dedicado de inferência: por padrão uma thread por modelo residente. Mais threads
+# não aumentam a vazão, porque cada modelo roda uma inferência por vez (lock por modelo)
+INFERENCE_WORKERS = None
+
+# Backpressure: atraso entre receber um chunk e ter a transcrição dele pronta.
+# Acima do limite o servidor pede para o cliente espaçar os chunks; abaixo da
+# metade, libera de novo.
+BACKPRESSURE_LATENCY_MS = 2000
+BACKPRESSURE_CHUNK_MS = 1000
+
+# Chunks adaptativos: perfis (intervalo dos chunks em ms, janela em s, sobreposição em s),
+# do mais responsivo ao de maior vazão. O servidor sobe de perfil quando a latência
+# média de um chunk (fila + inferência) passa do intervalo / ADAPTIVE_LATENCY_HEADROOM
+# ou quando a fila de inferência tem mais de um lote esperando, e desce um perfil por
+# vez, no máximo a cada ADAPTIVE_INTERVAL_SECONDS. O primeiro perfil é o padrão
+# (MAX_BUFFER_SECONDS / OVERLAP_SECONDS); janelas maiores quase não custam no encoder
+# (entrada sempre de 30 s) e finalizam com beam search com menos frequência.
+CHUNK_PROFILES = (
+    (500, MAX_BUFFER_SECONDS, OVERLAP_SECONDS),
+    (750, 10, 3),
+    (1000, 12, 3),
+    (1500, 15, 3),
+    (2000, 20, 4),
+)
+ADAPTIVE_LATENCY_HEADROOM = 1.5
+ADAPTIVE_INTERVAL_SECONDS = 5.0
+ADAPTIVE_EWMA_ALPHA = 0.2
+
+# Beam search usado só para o texto finalizado (parciais usam decodificação gulosa)
+FINAL_BEAM_SIZE = 5
+
+# Áudio sintético usado no aquecimento dos modelos carregados na inicialização
+WARMUP_SECONDS = 2
+
+# Mesmos limiares do whisper.transcribe para descartar janelas sem fala
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+
+# Espectrograma log-mel (mesmos valores de whisper.audio): janela de 25 ms, passo de
+# 10 ms e 3000 quadros (30 s) na entrada do encoder
+MEL_N_FFT = 400
+MEL_HOP_LENGTH = 160
+MEL_N_FRAMES = 3000
+
+# Modo supervisor (--workers N): portas locais dos workers a partir desta base
+# (websocket em base + 2i, HTTP em base + 2i + 1) e verificação de saúde
+WORKER_PORT_BASE = 9100
+WORKER_HEALTH_INTERVAL = 2.0
+WORKER_MAX_FAILURES = 3
+
+# Detecção automática de idioma "fixa" por sessão: detectar nas primeiras janelas
+# com fala até a probabilidade média passar do limiar (ou até o prazo acabar),
+# fixar o idioma e só voltar a detectar de tempos em tempos ou se a confiança cair
+LANGUAGE_LOCK_PROBABILITY = 0.8
+LANGUAGE_DETECT_MAX_SECONDS = 10
+LANGUAGE_RECHECK_SECONDS = 60
+LANGUAGE_LOW_CONFIDENCE_WINDOWS = 3
+
+# Contexto máximo do prompt em tokens (o decoder do Whisper usa só n_text_ctx // 2 - 1)
+PROMPT_MAX_TOKENS = 223
+
+# Protocolo de transcrição em deltas: quantos segmentos confirmados ficam guardados
+# para reenviar a um cliente que reconectou (o resto já está na tela dele)
+TRANSCRIPT_HISTORY_SEGMENTS = 200
+
+# Retomada de sessão: o estado de um cliente desconectado (buffer, contexto, idioma)
+# fica guardado por SESSION_TTL_SECONDS esperando a reconexão com o mesmo id; acima
+# de SESSION_MAX_SESSIONS as sessões desconectadas mais antigas saem primeiro (LRU).
+# Desconectada, a sessão guarda só o áudio ainda não confirmado (até algumas centenas
+# de KB); o ring buffer e o cache de log-mel (~4,5 MB) são liberados e refeitos na retomada
+SESSION_TTL_SECONDS = 120
+SESSION_MAX_SESSIONS = 256
+
+# Limites (em ms) dos buckets dos histogramas de latência por etapa expostos em /metrics
+STAGE_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def pcm16_to_float32(pcm_bytes: bytes) -> np.ndarray:
+    return np.frombuffer(pcm_bytes, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def parse_audio_frame(message: bytes) -> Optional[Dict[str, Any]]:
+    """Lê um frame binário de áudio; None se o cabeçalho for inválido."""
+    if len(message) < AUDIO_FRAME_HEADER.size:
+        return None
+    version, codec_id, _flags, seq, client_timestamp = AUDIO_FRAME_HEADER.unpack_from(message)
+    if version != AUDIO_FRAME_VERSION or codec_id not in AUDIO_FRAME_CODECS:
+        return None
+    return {
+        "seq": seq,
+        "timestamp": client_timestamp,
+        "codec": AUDIO_FRAME_CODECS[codec_id],
+        "audio": message[AUDIO_FRAME_HEADER.size:],
+    }
+
+
+def decode_data_url(base64_audio: str) -> bytes:
+    if base64_audio.startswith('data:'):
+        base64_audio = base64_audio.split(',', 1)[1]
+
+    missing_padding = len(base64_audio) % 4
+    if missing_padding: base64_audio += '=' * (4 - missing_padding)
+
+    return base64.b64decode(base64_audio)
+
+
+class AudioRingBuffer:
+    """
+    Buffer circular float32 de capacidade fixa para o áudio de uma conexão.
+
+    Cada amostra é gravada duas vezes (em i e em i + capacity), então qualquer
+    janela do conteúdo é uma fatia contígua do array: view() não copia nada e
+    descartar o início (consume) só avança um índice. Não há alocação depois
+    da criação.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=np.float32)
+        self._start = 0
+        self._length = 0
+        self.dropped_samples = 0
+        # Amostras já recebidas desde a criação: o início do conteúdo está em
+        # total_samples - len(self), uma posição absoluta no stream
+        self.total_samples = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def start_position(self) -> int:
+        """Posição absoluta (em amostras do stream) da primeira amostra guardada."""
+        return self.total_samples - self._length
+
+    def append(self, samples: np.ndarray):
+        n = len(samples)
+        self.total_samples += n
+        if n > self.capacity:
+            self.dropped_samples += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        # Sem espaço: descartar o áudio mais antigo
+        overflow = self._length + n - self.capacity
+        if overflow > 0:
+            self.dropped_samples += overflow
+            self.consume(overflow)
+
+        write_pos = (self._start + self._length) % self.capacity
+        first = min(n, self.capacity - write_pos)
+        rest = n - first
+        self._data[write_pos:write_pos + first] = samples[:first]
+        self._data[write_pos + self.capacity:write_pos + self.capacity + first] = samples[:first]
+        if rest:
+            self._data[:rest] = samples[first:]
+            self._data[self.capacity:self.capacity + rest] = samples[first:]
+        self._length += n
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """Fatia contígua (sem cópia) do conteúdo; válida até o próximo append."""
+        end = self._length if end is None else min(end, self._length)
+        return self._data[self._start + start:self._start + end]
+
+    def consume(self, n: int):
+        """Descarta as n amostras mais antigas."""
+        n = min(n, self._length)
+        self._start = (self._start + n) % self.capacity
+        self._length -= n
+
+    def clear(self):
+        self._start = 0
+        self._length = 0
+
+
+class MelFeatureCache:
+    """
+    Espectrograma log-mel incremental da janela de uma conexão.
+
+    Os quadros do STFT são indexados pela posição absoluta no stream, então
+    cada quadro é calculado uma vez só, quando todo o áudio que ele cobre já
+    chegou; janelas seguintes (e a sobreposição depois de cada corte) reusam
+    esses quadros. Só são recalculados os do fim da janela, que ainda dependem
+    do preenchimento com zeros, e os dois primeiros, que o Whisper calcula
+    refletindo o início da janela. A saída (n_mels x 3000, já normalizada como em
+    whisper.log_mel_spectrogram) é montada num buffer reaproveitado.
+
+    A janela sempre começa no início do AudioRingBuffer associado. Cortes fora
+    de múltiplos de MEL_HOP_LENGTH desalinham os quadros e zeram o cache.
+    """
+
+    def __init__(self, buffer: AudioRingBuffer):
+        self.buffer = buffer
+        self.capacity_frames = buffer.capacity // MEL_HOP_LENGTH + 2
+        self._window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(MEL_N_FFT) / MEL_N_FFT)).astype(np.float32)
+        self.n_mels = None
+        self.frames = None
+        self._padded = None
+        self.hits = 0
+        self.computed = 0
+        self.resets = 0
+
+    def reset(self, origin: int, n_mels: int):
+        # Quadro k (relativo a origin) é centrado na amostra origin + k * MEL_HOP_LENGTH
+        self.origin = origin
+        self.first_frame = 0
+        self.final_frames = 0
+        if self.n_mels != n_mels:
+            self.n_mels = n_mels
+            self.frames = np.empty((n_mels, self.capacity_frames), dtype=np.float32)
+            self._padded = np.empty((n_mels, MEL_N_FRAMES), dtype=np.float32)
+        self.resets += 1
+
+    def _compute(self, audio: np.ndarray, f0: int, start: int, end: int, filters: np.ndarray) -> np.ndarray:
+        """Quadros [start, end) em log10 (sem normalizar), com a janela começando no quadro f0."""
+        half = MEL_N_FFT // 2
+        seg_start = (start - f0) * MEL_HOP_LENGTH - half
+        seg_end = (end - 1 - f0) * MEL_HOP_LENGTH + half
+        n = len(audio)
+
+        parts = []
+        if seg_start < 0:
+            # Início da janela: reflexão, como o STFT centrado do Whisper
+            source = audio[:-seg_start + 1]
+            if len(source) < -seg_start + 1:
+                source = np.pad(source, (0, -seg_start + 1 - len(source)))
+            parts.append(source[-seg_start:0:-1])
+        parts.append(audio[max(seg_start, 0):min(seg_end, n)])
+        if seg_end > n:
+            # Fim da janela: zeros, como o pad_or_trim para 30 s
+            parts.append(np.zeros(seg_end - max(n, seg_start), dtype=np.float32))
+        segment = np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+        windows = np.lib.stride_tricks.sliding_window_view(segment, MEL_N_FFT)[::MEL_HOP_LENGTH]
+        magnitudes = np.abs(np.fft.rfft(windows * self._window, axis=1)) ** 2
+        mel = filters @ magnitudes.T.astype(np.float32)
+        self.computed += end - start
+        return np.log10(np.maximum(mel, 1e-10))
+
+    def log_mel(self, audio: np.ndarray, filters: np.ndarray) -> np.ndarray:
+        """
+        Log-mel da janela `audio` (fatia do buffer a partir do início), completada
+        para 30 s. O array devolvido é reaproveitado na próxima chamada.
+        """
+        n_mels = filters.shape[0]
+        start_position = self.buffer.start_position
+        if (self.frames is None or n_mels != self.n_mels or start_position < self.origin
+                or (start_position - self.origin) % MEL_HOP_LENGTH):
+            self.reset(start_position, n_mels)
+
+        n = len(audio)
+        f0 = (start_position - self.origin) // MEL_HOP_LENGTH
+        # Quadros que enxergam algum áudio da janela, e os que enxergam só áudio da janela
+        needed = min(MEL_N_FRAMES, (n + MEL_N_FFT // 2 - 1) // MEL_HOP_LENGTH + 1)
+        complete = min(needed, (n - MEL_N_FFT // 2) // MEL_HOP_LENGTH + 1) if n >= MEL_N_FFT // 2 else 0
+
+        # Descartar os quadros que ficaram antes do início da janela
+        if f0 > self.first_frame:
+            kept = max(0, self.final_frames - f0)
+            shift = f0 - self.first_frame
+            if kept:
+                self.frames[:, :kept] = self.frames[:, shift:shift + kept]
+            self.first_frame = f0
+            self.final_frames = max(self.final_frames, f0)
+
+        self.hits += max(0, min(complete, self.final_frames - f0))
+
+        # Quadros novos que já têm todo o áudio: calcular uma vez e guardar
+        if f0 + complete > self.final_frames:
+            start = self.final_frames
+            end = f0 + complete
+            self.frames[:, start - f0:end - f0] = self._compute(audio, f0, start, end, filters)
+            self.final_frames = end
+
+        out = self._padded
+        out[:, :complete] = self.frames[:, :complete]
+        # Primeiros quadros: o Whisper reflete o início da janela em vez de usar o
+        # áudio anterior guardado no cache; recalcular para dar o mesmo resultado
+        edge = min(complete, (MEL_N_FFT // 2 - 1) // MEL_HOP_LENGTH + 1)
+        if edge:
+            out[:, :edge] = self._compute(audio, f0, f0, f0 + edge, filters)
+        if needed > complete:
+            # Fim da janela: depende do preenchimento com zeros, não vai para o cache
+            out[:, complete:needed] = self._compute(audio, f0, f0 + complete, f0 + needed, filters)
+        out[:, needed:] = -10.0  # log10 do piso (1e-10) para o silêncio do preenchimento
+
+        np.maximum(out, out.max() - 8.0, out=out)
+        out += 4.0
+        out /= 4.0
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"reused_frames": self.hits, "computed_frames": self.computed, "resets": self.resets}
+
+
+class StreamingDecoder:
+    """
+    Sessão de decodificação persistente (um ffmpeg por conexão).
+
+    Recebe os bytes de um stream WebM contínuo pelo stdin e devolve o PCM
+    decodificado incrementalmente, sem arquivos temporários e sem criar um
+    processo novo a cada chunk.
+    """
+
+    def __init__(self, ffmpeg_path: str = "ffmpeg", input_format: str = "matroska"):
+        self.ffmpeg_path = ffmpeg_path
+        self.input_format = input_format
+        self.proc = None
+        self._pcm = bytearray()
+        self._data_event = asyncio.Event()
+        self._reader_task = None
+        self._stderr_task = None
+        # ffmpeg morreu no meio do stream: só um stream novo (com cabeçalho) recupera
+        self.failed = False
+
+    @property
+    def is_running(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        cmd = [
+            self.ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+            '-fflags', 'nobuffer',
+            '-probesize', '4096',
+            '-analyzeduration', '0',
+            '-f', self.input_format,
+            '-i', 'pipe:0',
+            '-ar', str(SAMPLE_RATE),
+            '-ac', '1',
+            '-f', 's16le',
+            '-flush_packets', '1',
+            'pipe:1'
+        ]
+        self.proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self._reader_task = asyncio.create_task(self._read_stdout())
+        self._stderr_task = asyncio.create_task(self._read_stderr())
+        logger.debug(f"streaming decoder started (pid {self.proc.pid})")
+
+    async def _read_stdout(self):
+        while True:
+            data = await self.proc.stdout.read(65536)
+            if not data:
+                break
+            self._pcm.extend(data)
+            self._data_event.set()
+        # Acordar quem estiver esperando caso o processo tenha terminado
+        self._data_event.set()
+
+    async def _read_stderr(self):
+        async for line in self.proc.stderr:
+            logger.error(f"ffmpeg (stream): {line.decode('utf-8', errors='ignore').strip()[:500]}")
+
+    def _take_pcm(self) -> Optional[np.ndarray]:
+        # Só entregar amostras completas de 16 bits
+        usable = len(self._pcm) - (len(self._pcm) % 2)
+        if usable == 0:
+            return None
+        pcm_bytes = bytes(self._pcm[:usable])
+        del self._pcm[:usable]
+        return pcm16_to_float32(pcm_bytes)
+
+    async def decode(self, audio_bytes: bytes, timeout: float = DECODER_READ_TIMEOUT) -> Optional[np.ndarray]:
+        """
+        Envia um pedaço do stream ao ffmpeg e devolve o PCM que já estiver disponível.
+
+        O decoder tem um pequeno atraso interno, então o áudio de um chunk pode
+        sair junto com o do chunk seguinte; nada é perdido, apenas adiado.
+
+        Se o ffmpeg morrer, o decoder fica em `failed` e não é reiniciado: um
+        processo novo receberia fragmentos sem o cabeçalho WebM e falharia a
+        cada chunk. Quem chama precisa pedir ao cliente um stream novo.
+        """
+        if self.failed:
+            return None
+        if not self.is_running:
+            if self.proc is not None:
+                logger.error(f"streaming decoder exited mid-stream (code {self.proc.returncode}), not restarting")
+                self.failed = True
+                return self._take_pcm()
+            await self.start()
+
+        try:
+            self._data_event.clear()
+            self.proc.stdin.write(audio_bytes)
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            logger.error(f"streaming decoder pipe closed: {e}")
+            self.failed = True
+            return self._take_pcm()
+
+        if not self._pcm:
+            try:
+                await asyncio.wait_for(self._data_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return self._take_pcm()
+
+    async def close(self):
+        if self.proc is None:
+            return
+        try:
+            if self.proc.stdin and not self.proc.stdin.is_closing():
+                self.proc.stdin.close()
+            await asyncio.wait_for(self.proc.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            self.proc.kill()
+            await self.proc.wait()
+        except ProcessLookupError:
+            pass
+        finally:
+            for task in (self._reader_task, self._stderr_task):
+                if task and not task.done():
+                    task.cancel()
+            logger.debug(f"streaming decoder closed (pid {self.proc.pid})")
+            self.proc = None
+
+
+def summarize(values) -> Dict[str, float]:
+    if not values:
+        return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    arr = np.array(values, dtype=np.float64)
+    return {
+        "avg": round(float(arr.mean()), 2),
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+class StageLatencyHistogram:
+    """
+    Histogramas cumulativos (estilo Prometheus) de latência por etapa do
+    pipeline: contagem por bucket, soma e total, com memória constante.
+    """
+
+    def __init__(self, buckets_ms=STAGE_LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts: Dict[str, List[int]] = {}
+        self.sums_ms: Dict[str, float] = {}
+        self.totals: Dict[str, int] = {}
+
+    def observe(self, stage: str, value_ms: float):
+        counts = self.counts.get(stage)
+        if counts is None:
+            counts = self.counts[stage] = [0] * len(self.buckets_ms)
+            self.sums_ms[stage] = 0.0
+            self.totals[stage] = 0
+        for i, bound in enumerate(self.buckets_ms):
+            if value_ms <= bound:
+                counts[i] += 1
+        self.sums_ms[stage] += value_ms
+        self.totals[stage] += 1
+
+    def observe_all(self, timings: Dict[str, float]):
+        for stage, value_ms in timings.items():
+            self.observe(stage.removesuffix("_ms"), value_ms)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {"count": total, "avg_ms": round(self.sums_ms[stage] / total, 2)}
+            for stage, total in self.totals.items() if total
+        }
+
+    def render_prometheus(self, name: str = "transcription_stage_latency_seconds") -> str:
+        lines = [
+            f"# HELP {name} Server-side latency per pipeline stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, counts in self.counts.items():
+            for bound, count in zip(self.buckets_ms, counts):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound / 1000:g}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {self.totals[stage]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {self.sums_ms[stage] / 1000:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {self.totals[stage]}')
+        return "\n".join(lines) + "\n"
+
+
+class InferenceRequest:
+    def __init__(self, audio: np.ndarray, language: Optional[str], prompt: Optional[Union[str, List[int]]], future: asyncio.Future,
+                 model_size: Optional[str] = None, beam_size: Optional[int] = None,
+                 timings: Optional[Dict[str, float]] = None, features: Optional[MelFeatureCache] = None):
+        self.audio = audio
+        self.features = features
+        self.model_size = model_size
+        self.beam_size = beam_size
+        self.language = language
+        self.prompt = prompt
+        self.future = future
+        self.submitted_at = time.perf_counter()
+        # Tempos por etapa (queue_ms, encode_ms, decode_ms), preenchidos pelo scheduler
+        self.timings = timings if timings is not None else {}
+
+
+class InferenceScheduler:
+    """
+    Junta as janelas pendentes de todas as conexões durante um prazo curto e
+    roda o encoder do Whisper uma única vez para o lote inteiro.
+
+    O decoder roda por grupo de (language, prompt), já que cada conexão tem o
+    seu próprio contexto; o resultado volta para cada chamador pelo seu future.
+    """
+
+    def __init__(self, processor: "AudioProcessor", max_wait_ms: float = BATCH_WAIT_MS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.processor = processor
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.queue = asyncio.Queue()
+        self._task = None
+
+        # Métricas
+        self.batches_run = 0
+        self.requests_done = 0
+        self.batch_sizes = deque(maxlen=1000)
+        self.wait_times_ms = deque(maxlen=1000)
+        self.inference_times_ms = deque(maxlen=1000)
+        self.queue_depths = deque(maxlen=1000)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, audio: np.ndarray, language: Optional[str], prompt: Optional[Union[str, List[int]]],
+                     model_size: Optional[str] = None, beam_size: Optional[int] = None,
+                     timings: Optional[Dict[str, float]] = None,
+                     features: Optional[MelFeatureCache] = None) -> Optional[Dict[str, Any]]:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(InferenceRequest(audio, language, prompt, future, model_size, beam_size, timings, features))
+        return await future
+
+    async def _collect_batch(self) -> List[InferenceRequest]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Pegar o que já estiver na fila sem esperar
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # Requisições cujo cliente já desconectou não precisam ser processadas
+            batch = [req for req in batch if not req.future.done()]
+            if not batch:
+                continue
+
+            started_at = time.perf_counter()
+            self.queue_depths.append(self.queue.qsize())
+            self.batch_sizes.append(len(batch))
+            for req in batch:
+                req.timings["queue_ms"] = (started_at - req.submitted_at) * 1000
+                self.wait_times_ms.append(req.timings["queue_ms"])
+
+            # Um passe do encoder por modelo presente no lote
+            by_model: Dict[Optional[str], List[InferenceRequest]] = {}
+            for req in batch:
+                by_model.setdefault(req.model_size, []).append(req)
+
+            # Modelos diferentes rodam em paralelo no pool (cada um com o seu lock);
+            # por isso o pool não ganha nada com mais threads do que modelos residentes
+            async def run_model(model_size, requests):
+                try:
+                    return await loop.run_in_executor(
+                        self.processor.executor, self.processor.transcribe_batch, requests, model_size
+                    )
+                except Exception as e:
+                    logger.error(f"error during batched transcription ({model_size}): {e}")
+                    return [None] * len(requests)
+
+            model_results = await asyncio.gather(*[
+                run_model(model_size, requests) for model_size, requests in by_model.items()
+            ])
+            results = {}
+            for requests, request_results in zip(by_model.values(), model_results):
+                results.update(zip(map(id, requests), request_results))
+            results = [results[id(req)] for req in batch]
+
+            self.inference_times_ms.append((time.perf_counter() - started_at) * 1000)
+            self.batches_run += 1
+            self.requests_done += len(batch)
+
+            for req, result in zip(batch, results):
+                if not req.future.done():
+                    req.future.set_result(result)
+
+            logger.debug(f"batch done: size {len(batch)}, queue depth {self.queue.qsize()}, "
+                         f"inference {self.inference_times_ms[-1]:.1f} ms")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "batches": self.batches_run,
+            "requests": self.requests_done,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batch_size": summarize(self.batch_sizes),
+            "queue_depth_at_batch": summarize(self.queue_depths),
+            "wait_ms": summarize(self.wait_times_ms),
+            "inference_ms": summarize(self.inference_times_ms),
+        }
+
+
+class TranslationStage:
+    """
+    Tradução assíncrona dos segmentos confirmados, fora do caminho da transcrição.
+
+    Cada segmento entra numa fila com o áudio de onde saiu; os pedidos de todas
+    as conexões são agrupados (como no InferenceScheduler) e traduzidos com um
+    passe do encoder por lote, numa thread separada do pool de inferência. O
+    modelo é o mesmo da transcrição, então cada lote pega o lock de inferência
+    dele e, com prioridade baixa, só entra quando a fila do scheduler está vazia.
+    O resultado fica num cache LRU por (texto, idioma de origem, destino): frases
+    repetidas não custam nada, e pedidos iguais simultâneos esperam o mesmo future.
+    """
+
+    def __init__(self, processor: "AudioProcessor", target: str = "en",
+                 max_wait_ms: float = TRANSLATION_BATCH_WAIT_MS,
+                 max_batch_size: int = TRANSLATION_MAX_BATCH_SIZE, cache_size: int = TRANSLATION_CACHE_SIZE):
+        self.processor = processor
+        self.target = target
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self.pending: Dict[tuple, asyncio.Future] = {}
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translation")
+        self._task = None
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.batches_run = 0
+        self.translated = 0
+        self.translation_times_ms = deque(maxlen=1000)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def translate(self, text: str, source: str, audio: np.ndarray):
+        """(tradução ou None, veio do cache?) do segmento `text`, falado em `source`."""
+        key = (text, source, self.target)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key], True
+
+        self.misses += 1
+        future = self.pending.get(key)
+        if future is None:
+            self.start()
+            future = self.pending[key] = asyncio.get_running_loop().create_future()
+            await self.queue.put((key, audio))
+        # shield: a conexão que desistir não cancela o resultado para as outras
+        return await asyncio.shield(future), False
+
+    async def _collect_batch(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _wait_for_idle_scheduler(self):
+        scheduler = self.processor.scheduler
+        if scheduler is None:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + TRANSLATION_MAX_DEFER_MS / 1000
+        while not scheduler.queue.empty() and loop.time() < deadline:
+            await asyncio.sleep(scheduler.max_wait)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            await self._wait_for_idle_scheduler()
+            keys = [key for key, _ in batch]
+            started_at = time.perf_counter()
+            try:
+                texts = await loop.run_in_executor(
+                    self.executor, self.processor.translate_batch,
+                    [audio for _, audio in batch], [source for _, source, _ in keys]
+                )
+            except Exception as e:
+                logger.error(f"error during batched translation: {e}")
+                texts = [None] * len(batch)
+            self.translation_times_ms.append((time.perf_counter() - started_at) * 1000)
+            self.batches_run += 1
+
+            for key, text in zip(keys, texts):
+                if text:
+                    self.translated += 1
+                    self.cache[key] = text
+                    if len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+                future = self.pending.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_result(text)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "target": self.target,
+            "queue_depth": self.queue.qsize(),
+            "batches": self.batches_run,
+            "translated": self.translated,
+            "cache_size": len(self.cache),
+            "cache_hits": self.hits,
+            "cache_hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "translation_ms": summarize(self.translation_times_ms),
+        }
+
+
+def segments_from_tokens(tokens: List[int], tokenizer) -> List[Dict[str, Any]]:
+    """Separa os tokens de um resultado com timestamps em segmentos (start, end, text)."""
+    segments = []
+    start = None
+    text_tokens = []
+
+    for token in tokens:
+        if token < tokenizer.timestamp_begin:
+            text_tokens.append(token)
+            continue
+
+        timestamp = (token - tokenizer.timestamp_begin) * 0.02
+        if start is not None and text_tokens:
+            segments.append({"start": start, "end": timestamp, "text": tokenizer.decode(text_tokens).strip()})
+            text_tokens = []
+            start = None
+        else:
+            start = timestamp
+
+    # Segmento sem timestamp final (fala cortada no fim da janela)
+    if text_tokens:
+        segments.append({"start": start or 0.0, "end": None, "text": tokenizer.decode(text_tokens).strip()})
+
+    return segments
+
+
+def normalize_word(word: str) -> str:
+    return word.lower().strip(".,!?;:\"'…-")
+
+
+class LocalAgreementStreamer:
+    """
+    Estado do modo incremental de uma conexão (política local agreement).
+
+    Uma palavra só é confirmada quando duas hipóteses consecutivas concordam
+    com ela. Depois de cada concordância o buffer é cortado no fim da última
+    palavra confirmada, menos uma sobreposição curta, então cada chamada
+    decodifica só o áudio novo e ainda não confirmado (mais o contexto via
+    prompt), e não a janela inteira.
+
+    Sem timestamps por palavra, o fim de cada palavra é estimado dividindo o
+    segmento igualmente entre as suas palavras. As palavras confirmadas que
+    caem na sobreposição ficam no buffer (confirmadas, ainda não finalizadas)
+    e reaparecem no início da próxima hipótese; o alinhamento tolera uma
+    palavra a mais ou a menos ali, para absorver o erro da estimativa.
+    """
+
+    def __init__(self, max_buffer_seconds: float = MAX_BUFFER_SECONDS,
+                 overlap_seconds: float = INCREMENTAL_OVERLAP_SECONDS):
+        self.max_buffer_samples = int(max_buffer_seconds * SAMPLE_RATE)
+        self.overlap_seconds = overlap_seconds
+        self.reset()
+
+    def reset(self):
+        # Palavras confirmadas cujo áudio ainda está no buffer
+        self.buffer_committed: List[str] = []
+        # Parte não confirmada da última hipótese
+        self.unstable: List[str] = []
+
+    @property
+    def stable_text(self) -> str:
+        return " ".join(self.buffer_committed)
+
+    @property
+    def unstable_text(self) -> str:
+        return " ".join(self.unstable)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.buffer_committed + self.unstable)
+
+    def _skip_committed(self, words: List[str]) -> int:
+        """Posição, na hipótese, da primeira palavra depois das já confirmadas."""
+        expected = len(self.buffer_committed)
+        if expected == 0:
+            return 0
+        last = normalize_word(self.buffer_committed[-1])
+        for offset in (expected, expected - 1, expected + 1):
+            if 0 < offset <= len(words) and normalize_word(words[offset - 1]) == last:
+                return offset
+        return expected
+
+    @staticmethod
+    def _word_end_times(segments: List[Dict[str, Any]]) -> List[Optional[float]]:
+        # Fim estimado de cada palavra: o segmento dividido igualmente entre elas
+        ends = []
+        for seg in segments:
+            seg_words = seg["text"].split()
+            if seg["end"] is None:
+                ends += [None] * len(seg_words)
+                continue
+            start = seg.get("start") or 0.0
+            ends += [start + (seg["end"] - start) * (i + 1) / len(seg_words) for i in range(len(seg_words))]
+        return ends
+
+    def process(self, result: Optional[Dict[str, Any]], buffer_samples: int, end_of_speech: bool = False,
+                max_buffer_samples: Optional[int] = None):
+        """
+        Incorpora uma nova hipótese para o buffer atual.
+
+        Em fim de frase (pausa detectada pelo VAD) tudo é confirmado e o buffer
+        inteiro pode ser descartado. max_buffer_samples (padrão: o do construtor)
+        é o limite do buffer antes de um corte forçado, a janela do perfil da sessão.
+
+        Returns:
+            (texto finalizado, amostras a descartar do início do buffer, confirmado
+            à força?). À força = fim de frase ou buffer cheio, sem duas hipóteses
+            concordando; quem chama pode redecodificar esse trecho com o tier final
+        """
+        segments = (result or {}).get("segments") or []
+        words = [w for seg in segments for w in seg["text"].split()]
+        if not segments and result and result.get("text"):
+            words = result["text"].split()
+            segments = [{"start": 0.0, "end": None, "text": result["text"]}]
+
+        # As primeiras palavras correspondem ao que já foi confirmado neste buffer
+        offset = self._skip_committed(words)
+        # Deslocamento entre as palavras da hipótese e as confirmadas (-1, 0 ou 1)
+        shift = offset - len(self.buffer_committed)
+        new_words = words[offset:]
+
+        agreed = 0
+        for previous, current in zip(self.unstable, new_words):
+            if normalize_word(previous) != normalize_word(current):
+                break
+            agreed += 1
+
+        self.buffer_committed.extend(new_words[:agreed])
+        self.unstable = new_words[agreed:]
+
+        if end_of_speech:
+            finalized = self.buffer_committed + self.unstable
+            self.reset()
+            return " ".join(finalized), buffer_samples, True
+
+        if buffer_samples >= (max_buffer_samples or self.max_buffer_samples):
+            return (*self._force_trim(segments, buffer_samples, shift), True)
+        return (*self._trim_committed(segments, shift), False)
+
+    def _trim_committed(self, segments: List[Dict[str, Any]], shift: int):
+        # Fim estimado de cada palavra confirmada (índice na hipótese = índice + shift)
+        ends = self._word_end_times(segments)
+        committed_ends = [ends[i + shift] if 0 <= i + shift < len(ends) else None
+                          for i in range(len(self.buffer_committed))]
+        if not committed_ends or committed_ends[-1] is None:
+            return "", 0
+
+        # Finalizar as palavras que terminam antes da sobreposição
+        limit = committed_ends[-1] - self.overlap_seconds
+        trim_words = 0
+        for end in committed_ends:
+            if end is None or end > limit:
+                break
+            trim_words += 1
+        if trim_words == 0:
+            return "", 0
+
+        finalized = self.buffer_committed[:trim_words]
+        self.buffer_committed = self.buffer_committed[trim_words:]
+        # Corte alinhado ao passo do STFT: o MelFeatureCache continua válido
+        trim_samples = int(committed_ends[trim_words - 1] * SAMPLE_RATE) // MEL_HOP_LENGTH * MEL_HOP_LENGTH
+        return " ".join(finalized), trim_samples
+
+    def _force_trim(self, segments: List[Dict[str, Any]], buffer_samples: int, shift: int = 0):
+        # Buffer cheio: confirmar tudo até o fim do último segmento completo
+        complete = [seg for seg in segments if seg["end"] is not None]
+        all_words = self.buffer_committed + self.unstable
+
+        if complete and len(complete) < len(segments):
+            kept_words = max(0, sum(len(seg["text"].split()) for seg in complete) - shift)
+            finalized = all_words[:kept_words]
+            self.buffer_committed = []
+            self.unstable = all_words[kept_words:]
+            trim_samples = round(complete[-1]["end"] * SAMPLE_RATE)
+        else:
+            finalized = all_words
+            self.reset()
+            end = complete[-1]["end"] if complete else None
+            trim_samples = round(end * SAMPLE_RATE) if end else buffer_samples
+
+        return " ".join(finalized), min(trim_samples, buffer_samples)
+
+
+class TranscriptContext:
+    """
+    Contexto de prompt de uma conexão: o texto confirmado mais recente, em
+    segmentos já tokenizados, limitado a PROMPT_MAX_TOKENS.
+
+    Cada trecho é tokenizado uma vez quando é confirmado; os tokens do prompt
+    ficam em cache até o próximo append(). Os segmentos mais antigos saem do
+    deque conforme o limite é ultrapassado, então a memória é constante
+    mesmo em sessões de horas.
+    """
+
+    def __init__(self, max_tokens: int = PROMPT_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        # (texto, tokens) do mais antigo para o mais recente
+        self.segments: deque = deque()
+        self.token_count = 0
+        self._tokenizer = None
+        self._prompt_tokens: Optional[List[int]] = None
+        self._prompt_text: Optional[str] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.segments)
+
+    def clear(self):
+        self.segments.clear()
+        self.token_count = 0
+        self._prompt_tokens = None
+        self._prompt_text = None
+
+    def _encode(self, text: str) -> List[int]:
+        return self._tokenizer.encode(" " + text)
+
+    def _use_tokenizer(self, tokenizer):
+        """Troca de tokenizer (modelo .en vs multilíngue): retokenizar o que sobrou."""
+        if tokenizer is self._tokenizer:
+            return
+        self._tokenizer = tokenizer
+        texts = [text for text, _ in self.segments]
+        self.clear()
+        for text in texts:
+            self._append_tokens(text, self._encode(text))
+
+    def _append_tokens(self, text: str, tokens: List[int]):
+        if len(tokens) > self.max_tokens:
+            tokens = tokens[-self.max_tokens:]
+            text = self._tokenizer.decode(tokens).strip()
+        self.segments.append((text, tokens))
+        self.token_count += len(tokens)
+        while self.token_count > self.max_tokens:
+            _, dropped = self.segments.popleft()
+            self.token_count -= len(dropped)
+        self._prompt_tokens = None
+        self._prompt_text = None
+
+    def append(self, text: str, tokenizer):
+        text = text.strip()
+        if not text:
+            return
+        self._use_tokenizer(tokenizer)
+        self._append_tokens(text, self._encode(text))
+
+    def prompt_tokens(self, tokenizer) -> Optional[List[int]]:
+        if not self.segments:
+            return None
+        self._use_tokenizer(tokenizer)
+        if self._prompt_tokens is None:
+            self._prompt_tokens = [token for _, tokens in self.segments for token in tokens]
+        return self._prompt_tokens
+
+    def prompt_text(self, tokenizer) -> Optional[str]:
+        """Mesmo contexto como texto, para o model.transcribe (que só aceita string)."""
+        if not self.segments:
+            return None
+        self._use_tokenizer(tokenizer)
+        if self._prompt_text is None:
+            self._prompt_text = " ".join(text for text, _ in self.segments)
+        return self._prompt_text
+
+
+class TranscriptLog:
+    """
+    Segmentos confirmados de uma conexão, para o protocolo de deltas.
+
+    Cada trecho finalizado recebe um id crescente e é enviado uma única vez
+    (mensagem transcript_delta); a cada chunk só vai o trecho ainda mutável
+    (tail). Os últimos TRANSCRIPT_HISTORY_SEGMENTS ficam guardados para o
+    cliente que reconectou pedir o que perdeu (transcript_resync). O epoch
+    muda a cada clear(): ids de outro epoch não valem mais.
+    """
+
+    def __init__(self, max_segments: int = TRANSCRIPT_HISTORY_SEGMENTS):
+        self.segments: deque = deque(maxlen=max_segments)
+        self.epoch = os.urandom(4).hex()
+        self.last_id = 0
+        self.tail = ""
+
+    def clear(self):
+        self.segments.clear()
+        self.epoch = os.urandom(4).hex()
+        self.last_id = 0
+        self.tail = ""
+
+    def commit(self, text: str) -> Optional[Dict[str, Any]]:
+        text = text.strip()
+        if not text:
+            return None
+        self.last_id += 1
+        segment = {"id": self.last_id, "text": text}
+        self.segments.append(segment)
+        return segment
+
+    def since(self, epoch: Optional[str], last_id: int) -> Dict[str, Any]:
+        """
+        Segmentos depois de last_id. "reset" quando o epoch não é o atual (sessão
+        nova: o cliente recomeça a numeração); "truncated" quando parte do que
+        faltava já saiu do histórico.
+        """
+        if epoch != self.epoch:
+            last_id = 0
+        missing = [segment for segment in self.segments if segment["id"] > last_id]
+        oldest = self.segments[0]["id"] if self.segments else self.last_id + 1
+        return {
+            "epoch": self.epoch,
+            "reset": epoch != self.epoch,
+            "truncated": oldest > last_id + 1,
+            "segments": missing,
+            "last_id": self.last_id,
+            "tail": self.tail,
+        }
+
+
+class LanguageDetector:
+    """
+    Idioma automático de uma conexão, detectado uma vez e mantido.
+
+    Enquanto não há idioma fixado, cada janela roda a detecção do Whisper e as
+    probabilidades se acumulam; o idioma é fixado quando a média do melhor
+    candidato passa de LANGUAGE_LOCK_PROBABILITY (ou no melhor candidato depois
+    de LANGUAGE_DETECT_MAX_SECONDS de áudio). Depois disso as janelas já vão
+    com o idioma definido, sem o passe de detecção, e só uma janela a cada
+    LANGUAGE_RECHECK_SECONDS (ou depois de LANGUAGE_LOW_CONFIDENCE_WINDOWS
+    janelas seguidas com logprob baixo) volta a detectar.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.language: Optional[str] = None
+        self.probability = 0.0
+        self.scores: Dict[str, float] = {}
+        self.detections = 0
+        self.detect_seconds = 0.0
+        self.since_check_seconds = 0.0
+        self.low_confidence_windows = 0
+        self.recheck = False
+        self.switches = 0
+
+    @property
+    def locked(self) -> bool:
+        return self.language is not None
+
+    def add_audio(self, seconds: float):
+        if self.locked:
+            self.since_check_seconds += seconds
+            if self.since_check_seconds >= LANGUAGE_RECHECK_SECONDS:
+                self.recheck = True
+        else:
+            self.detect_seconds += seconds
+
+    def language_for_request(self) -> Optional[str]:
+        """Idioma a passar para a transcrição; None faz o Whisper detectar nesta janela."""
+        return None if self.recheck else self.language
+
+    def update(self, result: Optional[Dict[str, Any]]) -> bool:
+        """Incorpora o resultado de uma janela; True se o idioma foi fixado ou trocado agora."""
+        if not result:
+            return False
+        code = result.get("language_code")
+        probability = result.get("language_probability")
+
+        if probability is None:
+            # Janela com idioma fixado: acompanhar a confiança da decodificação
+            avg_logprob = result.get("avg_logprob")
+            if avg_logprob is not None and avg_logprob < LOGPROB_THRESHOLD:
+                self.low_confidence_windows += 1
+                if self.low_confidence_windows >= LANGUAGE_LOW_CONFIDENCE_WINDOWS:
+                    self.recheck = True
+            else:
+                self.low_confidence_windows = 0
+            return False
+
+        if not self.locked:
+            self.scores[code] = self.scores.get(code, 0.0) + probability
+            self.detections += 1
+            best = max(self.scores, key=self.scores.get)
+            average = self.scores[best] / self.detections
+            if average >= LANGUAGE_LOCK_PROBABILITY or self.detect_seconds >= LANGUAGE_DETECT_MAX_SECONDS:
+                self.language = best
+                self.probability = average
+                return True
+            return False
+
+        # Nova checagem com o idioma fixado
+        self.recheck = False
+        self.since_check_seconds = 0.0
+        self.low_confidence_windows = 0
+        if code == self.language:
+            self.probability = probability
+            return False
+        if probability >= LANGUAGE_LOCK_PROBABILITY:
+            self.language = code
+            self.probability = probability
+            self.switches += 1
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "language": self.language,
+            "probability": round(self.probability, 3),
+            "locked": self.locked,
+            "detections": self.detections,
+            "switches": self.switches,
+        }
+
+
+class EnergyVAD:
+    """
+    Detector de atividade de voz por energia, por conexão, sobre o PCM em NumPy.
+
+    O limiar acompanha o ruído de fundo da aba (média móvel dos quadros sem
+    fala). Além de pular chunks sem fala, indica as pausas que servem de
+    ponto de corte para as janelas.
+    """
+
+    def __init__(self, threshold_db: float = VAD_THRESHOLD_DB, noise_margin_db: float = VAD_NOISE_MARGIN_DB,
+                 min_speech_ratio: float = VAD_MIN_SPEECH_RATIO, min_silence_seconds: float = VAD_MIN_SILENCE_SECONDS):
+        self.frame_samples = SAMPLE_RATE * VAD_FRAME_MS // 1000
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.min_speech_ratio = min_speech_ratio
+        self.min_silence_samples = int(min_silence_seconds * SAMPLE_RATE)
+        self.noise_floor_db = threshold_db - noise_margin_db
+
+        # Estatísticas da sessão
+        self.total_samples = 0
+        self.skipped_samples = 0
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self.silence_samples = 0
+
+    @property
+    def speech_threshold_db(self) -> float:
+        return max(self.threshold_db, self.noise_floor_db + self.noise_margin_db)
+
+    def frame_energies_db(self, audio: np.ndarray) -> np.ndarray:
+        num_frames = len(audio) // self.frame_samples
+        if num_frames == 0:
+            return np.array([], dtype=np.float32)
+        frames = audio[:num_frames * self.frame_samples].reshape(num_frames, self.frame_samples)
+        rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-10)
+        return 20 * np.log10(rms)
+
+    def update(self, audio: np.ndarray) -> str:
+        """
+        Classifica um chunk novo.
+
+        Returns:
+            "speech": chunk com fala
+            "silence": pausa curta depois de fala (vai para o buffer, sem inferência)
+            "end": pausa longa depois de fala (fim de frase, finalizar a janela)
+            "skip": sem fala e nada pendente no buffer (descartado)
+        """
+        self.total_samples += len(audio)
+        energies = self.frame_energies_db(audio)
+        speech_mask = energies > self.speech_threshold_db
+
+        # Atualizar o ruído de fundo com os quadros sem fala
+        if len(energies) and not speech_mask.all():
+            self.noise_floor_db = 0.9 * self.noise_floor_db + 0.1 * float(np.mean(energies[~speech_mask]))
+
+        if len(energies) and speech_mask.mean() >= self.min_speech_ratio:
+            self.in_speech = True
+            self.silence_samples = 0
+            return "speech"
+
+        self.skipped_samples += len(audio)
+        if not self.in_speech:
+            return "skip"
+
+        self.silence_samples += len(audio)
+        if self.silence_samples >= self.min_silence_samples:
+            self.reset()
+            return "end"
+        return "silence"
+
+    def find_cut_point(self, audio: np.ndarray, search_from: int) -> Optional[int]:
+        """Procura a pausa mais silenciosa a partir de search_from; None se só houver fala."""
+        energies = self.frame_energies_db(audio[search_from:])
+        if not len(energies):
+            return None
+        quiet = np.where(energies <= self.speech_threshold_db)[0]
+        if not len(quiet):
+            return None
+        frame = quiet[np.argmin(energies[quiet])]
+        return search_from + int(frame) * self.frame_samples + self.frame_samples // 2
+
+    @property
+    def skipped_ratio(self) -> float:
+        return self.skipped_samples / self.total_samples if self.total_samples else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "audio_seconds": round(self.total_samples / SAMPLE_RATE, 2),
+            "skipped_seconds": round(self.skipped_samples / SAMPLE_RATE, 2),
+            "skipped_ratio": round(self.skipped_ratio, 4),
+            "noise_floor_db": round(self.noise_floor_db, 1),
+        }
+
+
+class ChunkTuner:
+    """
+    Perfil de streaming recomendado para todas as sessões do processo, a
+    partir da latência média por chunk (média móvel exponencial) e da
+    profundidade da fila de inferência.
+
+    Sob carga o intervalo dos chunks e a janela crescem: menos inferências
+    por segundo de áudio e atualizações menos frequentes, em troca de não
+    estourar o servidor. Subir é imediato; descer é um perfil por vez, com
+    histerese, para não oscilar.
+    """
+
+    def __init__(self, profiles=CHUNK_PROFILES, enabled: bool = True,
+                 headroom: float = ADAPTIVE_LATENCY_HEADROOM, interval: float = ADAPTIVE_INTERVAL_SECONDS):
+        self.profiles = profiles
+        self.enabled = enabled
+        self.headroom = headroom
+        self.interval = interval
+        self.level = 0
+        self.latency_ms: Optional[float] = None
+        self.queue_depth = 0
+        self.changes = 0
+        self._changed_at = 0.0
+
+    def profile(self, level: Optional[int] = None) -> Dict[str, Any]:
+        level = self.level if level is None else level
+        chunk_ms, window_seconds, overlap_seconds = self.profiles[level]
+        return {
+            "level": level,
+            "chunk_ms": chunk_ms,
+            "window_seconds": window_seconds,
+            "overlap_seconds": overlap_seconds,
+        }
+
+    def observe(self, latency_ms: float, queue_depth: int = 0, batch_size: int = 1) -> bool:
+        """Registra a latência de um chunk; True se o perfil recomendado mudou."""
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += ADAPTIVE_EWMA_ALPHA * (latency_ms - self.latency_ms)
+        self.queue_depth = queue_depth
+        if not self.enabled:
+            return False
+
+        needed = self.latency_ms * self.headroom
+        target = next((i for i, (chunk_ms, _, _) in enumerate(self.profiles) if chunk_ms >= needed),
+                      len(self.profiles) - 1)
+        if queue_depth > batch_size:
+            target = min(target + 1, len(self.profiles) - 1)
+
+        now = time.monotonic()
+        if target > self.level:
+            self.level = target
+        elif (target < self.level and now - self._changed_at >= self.interval
+              and needed < 0.8 * self.profiles[self.level - 1][0]):
+            self.level -= 1
+        else:
+            return False
+        self._changed_at = now
+        self.changes += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.profile(),
+            "enabled": self.enabled,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "queue_depth": self.queue_depth,
+            "changes": self.changes,
+        }
+
+
+class Session:
+    """
+    Estado de transcrição de um cliente, separado da conexão websocket.
+
+    Com um id de sessão (?session=... na URL), o estado sobrevive a quedas de
+    conexão: a reconexão reencontra o buffer de áudio, o contexto do prompt, o
+    idioma e o texto confirmado, e last_seq diz ao cliente a partir de qual
+    chunk reenviar. O decoder de WebM contínuo não entra aqui: cada conexão
+    começa um stream novo.
+
+    Só uma conexão processa mensagens da sessão por vez (lock): numa retomada,
+    a nova espera a antiga terminar a mensagem em andamento, inclusive a
+    inferência que ainda lê o ring buffer.
+    """
+
+    def __init__(self, session_id: Optional[str], use_vad: bool = True, batching: bool = True):
+        self.id = session_id
+        self.lock = asyncio.Lock()
+        self.batching = batching
+        self._allocate()
+        # Áudio pendente de uma sessão suspensa (sem ring buffer)
+        self._suspended_audio: Optional[np.ndarray] = None
+        self.final_transcript = ""
+        self.last_sent_text = ""
+        self.transcript = TranscriptLog()
+        # Prompt da sessão: últimos tokens confirmados, tokenizados uma vez só
+        self.context = TranscriptContext()
+        self.streamer = LocalAgreementStreamer()
+        self.undecoded_samples = 0
+        self.vad = EnergyVAD() if use_vad else None
+        # Idioma selecionado pelo cliente (None = detecção automática)
+        self.selected_language: Optional[str] = None
+        self.language_detector = LanguageDetector()
+        # Modelo escolhido pelo cliente (None = padrão do servidor)
+        self.selected_model: Optional[str] = None
+        # Último chunk recebido: chunks reenviados com seq <= last_seq são duplicados
+        self.last_seq: Optional[int] = None
+        self.websocket = None
+        self.last_seen = time.monotonic()
+
+    def _allocate(self):
+        # Capacidade para a maior janela dos perfis adaptativos
+        window_seconds = max(window for _, window, _ in CHUNK_PROFILES)
+        self.audio_buffer = AudioRingBuffer(SAMPLE_RATE * (window_seconds + RING_BUFFER_HEADROOM_SECONDS))
+        # Log-mel incremental do buffer (só no caminho agrupado, que recebe o espectrograma pronto)
+        self.features = MelFeatureCache(self.audio_buffer) if self.batching else None
+
+    def suspend(self):
+        """Sem conexão: guarda só o áudio pendente e libera o ring buffer e o cache de log-mel."""
+        if self.audio_buffer is None:
+            return
+        self._suspended_audio = self.audio_buffer.view().copy()
+        self.audio_buffer = self.features = None
+
+    def resume(self):
+        if self.audio_buffer is not None:
+            return
+        self._allocate()
+        self.audio_buffer.append(self._suspended_audio)
+        self._suspended_audio = None
+
+    def reset(self):
+        self.audio_buffer.clear()
+        self.final_transcript = ""
+        self.last_sent_text = ""
+        self.transcript.clear()
+        self.context.clear()
+        self.language_detector.reset()
+        self.streamer.reset()
+        self.undecoded_samples = 0
+        self.last_seq = None
+        if self.vad:
+            self.vad.reset()
+
+
+class SessionStore:
+    """
+    Sessões por id, para retomar depois de uma reconexão.
+
+    Sessões desconectadas expiram depois de `ttl` segundos; acima de
+    `max_sessions`, as desconectadas há mais tempo são descartadas antes
+    (ordem LRU do OrderedDict). Clientes sem id ganham uma sessão avulsa,
+    que não é guardada.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def expire(self):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if session.websocket is None and now - session.last_seen > self.ttl:
+                del self.sessions[session_id]
+                self.expired += 1
+        idle = [session_id for session_id, session in self.sessions.items() if session.websocket is None]
+        for session_id in idle[:max(0, len(self.sessions) - self.max_sessions)]:
+            del self.sessions[session_id]
+            self.evicted += 1
+
+    def attach(self, session_id: Optional[str], websocket, **kwargs):
+        """Sessão para esta conexão: (sessão, retomada?, conexão anterior ainda aberta)."""
+        self.expire()
+        if not session_id:
+            session = Session(None, **kwargs)
+            session.websocket = websocket
+            return session, False, None
+        session = self.sessions.get(session_id)
+        resumed = session is not None
+        if session is None:
+            session = self.sessions[session_id] = Session(session_id, **kwargs)
+        else:
+            self.resumed += 1
+        self.sessions.move_to_end(session_id)
+        # Reconexão antes de a conexão antiga cair: a nova assume a sessão
+        previous, session.websocket = session.websocket, websocket
+        session.last_seen = time.monotonic()
+        session.resume()
+        return session, resumed, previous
+
+    def detach(self, session: Session, websocket):
+        if session.websocket is websocket:
+            session.websocket = None
+            session.last_seen = time.monotonic()
+            session.suspend()
+            if session.id in self.sessions:
+                # Ordem LRU pela última atividade: quem acabou de desconectar sai por último
+                self.sessions.move_to_end(session.id)
+        self.expire()
+
+    def stats(self) -> Dict[str, Any]:
+        connected = sum(1 for session in self.sessions.values() if session.websocket is not None)
+        return {
+            "stored": len(self.sessions),
+            "connected": connected,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def session_id_from_path(path: Optional[str]) -> Optional[str]:
+    """Id de sessão do cliente, passado na URL do websocket (?session=...)."""
+    values = parse_qs(urlsplit(path or "/").query).get("session")
+    return values[0][:128] if values and values[0] else None
+
+
+def request_path(websocket) -> str:
+    """Caminho da requisição de handshake (API nova e legada do websockets)."""
+    request = getattr(websocket, "request", None)
+    return getattr(request, "path", None) or getattr(websocket, "path", None) or "/"
+
+
+class TorchBackend:
+    """Backend padrão: openai-whisper em PyTorch (float32 na CPU, GPU se houver)."""
+
+    name = "torch"
+
+    def __init__(self):
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    def load(self, size: str):
+        return whisper.load_model(size, device=self.device)
+
+
+class QuantizedCPUBackend(TorchBackend):
+    """
+    Backend int8 para nós só com CPU: as camadas lineares (atenção e MLP do
+    encoder e do decoder, a maior parte dos pesos) passam por quantização
+    dinâmica do PyTorch; convoluções, embeddings e LayerNorm ficam em float32.
+    A interface do modelo não muda (embed_audio, decode, transcribe).
+    """
+
+    name = "int8"
+
+    def __init__(self):
+        self.device = "cpu"
+
+    def load(self, size: str):
+        model = whisper.load_model(size, device="cpu")
+        self._use_plain_linear(model)
+        if "fbgemm" not in torch.backends.quantized.supported_engines:
+            # CPUs ARM: kernels int8 do qnnpack
+            torch.backends.quantized.engine = "qnnpack"
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @classmethod
+    def _use_plain_linear(cls, module: torch.nn.Module):
+        # whisper.model.Linear é subclasse de nn.Linear, e a quantização dinâmica só
+        # troca o tipo exato; os pesos são compartilhados, nada é copiado
+        for name, child in module.named_children():
+            if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.weight = child.weight
+                linear.bias = child.bias
+                setattr(module, name, linear)
+            else:
+                cls._use_plain_linear(child)
+
+
+# Backends de inferência selecionáveis na inicialização (--backend)
+INFERENCE_BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    QuantizedCPUBackend.name: QuantizedCPUBackend,
+}
+
+
+class ModelRegistry:
+    """
+    Modelos Whisper residentes, um por tamanho (ex.: tiny para parciais, small
+    para janelas finalizadas).
+
+    O carregamento é protegido por um lock por tamanho, então conexões
+    simultâneas nunca disparam duas cargas do mesmo modelo; cada modelo passa
+    por uma inferência de aquecimento antes de ser marcado como pronto.
+    """
+
+    def __init__(self, sizes: List[str], backend: TorchBackend, executor: Optional[ThreadPoolExecutor] = None):
+        self.sizes = list(dict.fromkeys(sizes))
+        self.backend = backend
+        # Carga e aquecimento rodam no pool limitado de inferência (None: executor padrão)
+        self.executor = executor
+        self.device = backend.device
+        self.models: Dict[str, Any] = {}
+        self.tokenizers: Dict[str, Any] = {}
+        self.status: Dict[str, Dict[str, Any]] = {size: {"state": "pending"} for size in self.sizes}
+        self._locks = {size: asyncio.Lock() for size in self.sizes}
+        # Uma inferência por vez em cada modelo: o decoder do Whisper guarda o kv-cache
+        # em hooks nos módulos do próprio modelo, e duas decodificações simultâneas
+        # no mesmo modelo misturariam os caches uma da outra
+        self.inference_locks = {size: threading.Lock() for size in self.sizes}
+
+    def is_ready(self, size: str) -> bool:
+        return self.status.get(size, {}).get("state") == "ready"
+
+    @property
+    def all_ready(self) -> bool:
+        return all(self.is_ready(size) for size in self.sizes)
+
+    def get(self, size: str):
+        return self.models.get(size)
+
+    async def load(self, size: str):
+        async with self._locks[size]:
+            if self.is_ready(size):
+                return
+            loop = asyncio.get_running_loop()
+            self.status[size] = {"state": "loading"}
+            logger.info(f"loading whisper model {size}...")
+
+            started_at = time.perf_counter()
+            model = await loop.run_in_executor(self.executor, self.backend.load, size)
+            load_seconds = time.perf_counter() - started_at
+
+            self.status[size] = {"state": "warming_up", "load_seconds": round(load_seconds, 2)}
+            started_at = time.perf_counter()
+            await loop.run_in_executor(self.executor, self._warm_up, model)
+            warmup_ms = (time.perf_counter() - started_at) * 1000
+
+            self.models[size] = model
+            self.tokenizers[size] = whisper.tokenizer.get_tokenizer(
+                model.is_multilingual,
+                num_languages=model.num_languages,
+                task="transcribe",
+            )
+            self.status[size] = {
+                "state": "ready",
+                "load_seconds": round(load_seconds, 2),
+                "warmup_ms": round(warmup_ms, 1),
+            }
+            logger.info(f"model {size} ready on {self.device}/{self.backend.name} (load {load_seconds:.1f}s, warm-up {warmup_ms:.0f} ms)")
+
+    async def load_all(self):
+        for size in self.sizes:
+            await self.load(size)
+
+    @staticmethod
+    def _warm_up(model):
+        # Ruído baixo: exercita encoder e decoder sem depender de arquivos de teste
+        rng = np.random.default_rng(0)
+        audio = (0.01 * rng.standard_normal(SAMPLE_RATE * WARMUP_SECONDS)).astype(np.float32)
+        model.transcribe(audio, fp16=False, language="en")
+
+
 class AudioProcessor:
-    def __init__(self, model_size: str = "base", ffmpeg_path: str = None):
+    def __init__(self, model_size: str = "base", ffmpeg_path: str = None, model_sizes: Optional[List[str]] = None,
+                 inference_workers: int = INFERENCE_WORKERS, backend: str = "torch", threads: Optional[int] = None):
         self.model_size = model_size
         self.ffmpeg_path = ffmpeg_path or "ffmpeg"
-        self.whisper_model = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.is_initialized = False
+        self.backend = INFERENCE_BACKENDS[backend]()
+        self.device = self.backend.device
+        if threads:
+            # Threads intra-op do PyTorch (por processo, somadas entre os workers de inferência)
+            torch.set_num_threads(threads)
+        self.threads = torch.get_num_threads()
+        sizes = list(dict.fromkeys([model_size] + list(model_sizes or [])))
+        # Pool limitado para todo o trabalho bloqueante com os modelos: carga, aquecimento e inferência
+        self.inference_workers = inference_workers or len(sizes)
+        self.executor = ThreadPoolExecutor(max_workers=self.inference_workers, thread_name_prefix="inference")
+        self.registry = ModelRegistry(sizes, self.backend, self.executor)
+        self.scheduler = None
+        # Tradução dos segmentos confirmados (enable_translation)
+        self.translator = None
+        # Latência por camada: "partial" (hipóteses descartáveis) e "final" (texto confirmado)
+        self.tier_latency_ms = {"partial": deque(maxlen=1000), "final": deque(maxlen=1000)}
+        # Segundos de áudio decodificados por camada (janelas repetidas contam de novo)
+        self.decoded_seconds = {"partial": 0.0, "final": 0.0}
+        # Filtros mel por n_mels (80, ou 128 no large-v3), para o MelFeatureCache
+        self._mel_filters: Dict[int, np.ndarray] = {}
+
+    @property
+    def whisper_model(self):
+        return self.registry.get(self.model_size)
+
+    @property
+    def is_initialized(self) -> bool:
+        return self.registry.is_ready(self.model_size)
+
+    def resolve_model(self, model_size: Optional[str]) -> str:
+        """Tamanho pedido se estiver pronto; senão o modelo padrão."""
+        if model_size and self.registry.is_ready(model_size):
+            return model_size
+        return self.model_size
+
+    def enable_batching(self, max_wait_ms: float = BATCH_WAIT_MS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.scheduler = InferenceScheduler(self, max_wait_ms, max_batch_size)
+
+    def enable_translation(self, target: str = "en"):
+        self.translator = TranslationStage(self, target)
+
+    def shutdown(self):
+        """Encerra os pools de threads (inferência e tradução) ao parar o servidor."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.translator is not None:
+            self.translator.executor.shutdown(wait=False, cancel_futures=True)
 
     async def initialize_models(self):
-        if self.is_initialized: return
-        logger.info("loading whisper model...")
-        loop = asyncio.get_event_loop()
-        self.whisper_model = await loop.run_in_executor(None, whisper.load_model, self.model_size, self.device)
-        self.is_initialized = True
-        logger.info(f"models loaded! whisper: {self.model_size}, device: {self.device}")
+        # Carga com lock no registro: chamadas concorrentes esperam a mesma carga
+        if self.registry.all_ready: return
+        await self.registry.load_all()
+        logger.info(f"models loaded! whisper: {', '.join(self.registry.sizes)}, device: {self.device}, "
+                    f"backend: {self.backend.name}, threads: {self.threads}")
+
+    def mel_filters(self, n_mels: int) -> np.ndarray:
+        if n_mels not in self._mel_filters:
+            self._mel_filters[n_mels] = whisper.audio.mel_filters("cpu", n_mels).numpy()
+        return self._mel_filters[n_mels]
+
+    def log_mel(self, req: InferenceRequest, n_mels: int) -> torch.Tensor:
+        """Log-mel de 30 s da janela: incremental se a conexão tiver cache, senão completo."""
+        if req.features is not None:
+            return torch.from_numpy(req.features.log_mel(req.audio, self.mel_filters(n_mels)))
+        return whisper.log_mel_spectrogram(whisper.pad_or_trim(req.audio), n_mels=n_mels)
+
+    def create_stream_decoder(self) -> StreamingDecoder:
+        return StreamingDecoder(self.ffmpeg_path)
 
     async def decode_chunk(self, audio_bytes: bytes) -> Optional[np.ndarray]:
-        input_path = None
+        """
+        Decodifica um container WebM completo (clientes antigos que reiniciam o
+        MediaRecorder a cada chunk). O áudio vai pelo stdin, sem arquivo temporário.
+        """
         try:
-            with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as temp_file:
-                temp_file.write(audio_bytes)
-                input_path = temp_file.name
-            
             cmd = [
-                self.ffmpeg_path, '-y', '-i', input_path,
+                self.ffmpeg_path, '-hide_banner',
+                '-i', 'pipe:0',
                 '-ar', str(SAMPLE_RATE),
                 '-ac', '1',
                 '-f', 's16le',
@@ -56,10 +1764,11 @@ class AudioProcessor:
 
             proc = await asyncio.create_subprocess_exec(
                 *cmd, 
+                stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE, 
                 stderr=asyncio.subprocess.PIPE
             )
-            stdout, stderr = await proc.communicate()
+            stdout, stderr = await proc.communicate(input=audio_bytes)
 
             if proc.returncode != 0:
                 logger.error(f"ffmpeg failed: {stderr.decode('utf-8', errors='ignore')[:500]}")
@@ -69,17 +1778,146 @@ class AudioProcessor:
                 logger.warning("ffmpeg produced no output.")
                 return None
 
-            audio_np = np.frombuffer(stdout, dtype=np.int16).astype(np.float32) / 32768.0
-            return audio_np
+            return pcm16_to_float32(stdout)
 
         except Exception as e:
             logger.error(f"error during decoding: {e}")
             return None
-        finally:
-            if input_path and os.path.exists(input_path): 
-                os.unlink(input_path)
 
-    async def transcribe_buffer(self, audio_buffer: np.ndarray, language: Optional[str] = None, initial_prompt: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    def transcribe_batch(self, requests: List[InferenceRequest], model_size: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Transcreve várias janelas com um único passe do encoder (roda no executor).
+
+        Cada janela é completada para 30s, os espectrogramas são empilhados e o
+        encoder roda uma vez; o decoder reaproveita as features já calculadas,
+        agrupando as janelas que compartilham idioma, prompt e beam size.
+        """
+        model_size = self.resolve_model(model_size)
+        model = self.registry.get(model_size)
+        with self.registry.inference_locks[model_size]:
+            return self._transcribe_batch_locked(model, model_size, requests)
+
+    def _transcribe_batch_locked(self, model, model_size: str, requests: List[InferenceRequest]) -> List[Optional[Dict[str, Any]]]:
+        tokenizer = self.registry.tokenizers[model_size]
+        encode_started = time.perf_counter()
+        # torch.stack copia: o buffer de saída de cada MelFeatureCache pode ser reaproveitado
+        mel_batch = torch.stack([self.log_mel(req, model.dims.n_mels) for req in requests]).to(model.device)
+
+        with torch.no_grad():
+            audio_features = model.embed_audio(mel_batch)
+        # O encoder é compartilhado: cada janela do lote registra o tempo do passe inteiro
+        encode_ms = (time.perf_counter() - encode_started) * 1000
+        for req in requests:
+            req.timings["encode_ms"] = encode_ms
+
+        # Janelas sem idioma: uma detecção (um passo do decoder) para todas, e a
+        # decodificação já vai com o idioma detectado
+        detected: Dict[int, tuple] = {}
+        auto = [i for i, req in enumerate(requests) if req.language is None]
+        if auto:
+            detect_started = time.perf_counter()
+            if model.is_multilingual:
+                with torch.no_grad():
+                    _, language_probs = model.detect_language(audio_features[auto], tokenizer)
+                for i, probs in zip(auto, language_probs):
+                    code = max(probs, key=probs.get)
+                    detected[i] = (code, probs[code])
+            else:
+                detected = {i: ("en", 1.0) for i in auto}
+            detect_ms = (time.perf_counter() - detect_started) * 1000
+            for i in auto:
+                requests[i].timings["detect_ms"] = detect_ms
+
+        groups: Dict[tuple, List[int]] = {}
+        for i, req in enumerate(requests):
+            prompt = tuple(req.prompt) if isinstance(req.prompt, list) else req.prompt
+            language = detected[i][0] if i in detected else req.language
+            groups.setdefault((language, prompt, req.beam_size), []).append(i)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        for (language, prompt, beam_size), indices in groups.items():
+            # Prompt já tokenizado (TranscriptContext): o decoder não precisa reencodar
+            if isinstance(prompt, tuple):
+                prompt = list(prompt)
+            options = whisper.DecodingOptions(language=language, prompt=prompt, beam_size=beam_size, fp16=False)
+            decode_started = time.perf_counter()
+            decoded = whisper.decode(model, audio_features[indices], options)
+            decode_ms = (time.perf_counter() - decode_started) * 1000
+            for i, result in zip(indices, decoded):
+                # Janela sem fala: mesmo critério do whisper.transcribe
+                is_silence = (result.no_speech_prob > NO_SPEECH_THRESHOLD
+                              and result.avg_logprob < LOGPROB_THRESHOLD)
+                requests[i].timings["decode_ms"] = decode_ms
+                results[i] = {
+                    "text": "" if is_silence else result.text,
+                    "language": result.language,
+                    "language_probability": detected[i][1] if i in detected else None,
+                    "avg_logprob": result.avg_logprob,
+                    "segments": [] if is_silence else segments_from_tokens(result.tokens, tokenizer),
+                }
+
+        return results
+
+    def translate_batch(self, audios: List[np.ndarray], sources: List[str]) -> List[Optional[str]]:
+        """
+        Traduz para inglês o áudio de vários segmentos confirmados (roda no executor
+        da tradução): um passe do encoder para o lote e um decode por idioma de origem.
+        Usa o lock de inferência do modelo padrão, o mesmo da transcrição.
+        """
+        with self.registry.inference_locks[self.model_size]:
+            return self._translate_batch_locked(self.registry.get(self.model_size), audios, sources)
+
+    def _translate_batch_locked(self, model, audios: List[np.ndarray], sources: List[str]) -> List[Optional[str]]:
+        if not model.is_multilingual:
+            # Modelos .en não traduzem
+            return [None] * len(audios)
+        mel_batch = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels) for audio in audios
+        ]).to(model.device)
+        with torch.no_grad():
+            audio_features = model.embed_audio(mel_batch)
+
+        groups: Dict[str, List[int]] = {}
+        for i, source in enumerate(sources):
+            groups.setdefault(source, []).append(i)
+
+        texts: List[Optional[str]] = [None] * len(audios)
+        for source, indices in groups.items():
+            options = whisper.DecodingOptions(task="translate", language=source, without_timestamps=True, fp16=False)
+            for i, result in zip(indices, whisper.decode(model, audio_features[indices], options)):
+                texts[i] = result.text.strip() or None
+        return texts
+
+    def _transcribe_single_locked(self, model_size: str, audio: np.ndarray, transcribe_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        with self.registry.inference_locks[model_size]:
+            return self._transcribe_single(self.registry.get(model_size), audio, transcribe_kwargs)
+
+    @staticmethod
+    def _transcribe_single(model, audio: np.ndarray, transcribe_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """model.transcribe, com a detecção de idioma feita antes para ter a probabilidade."""
+        language_probability = None
+        if "language" not in transcribe_kwargs:
+            if model.is_multilingual:
+                mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels)
+                with torch.no_grad():
+                    _, probs = model.detect_language(mel.to(model.device))
+                code = max(probs, key=probs.get)
+                language_probability = probs[code]
+            else:
+                code, language_probability = "en", 1.0
+            transcribe_kwargs = {**transcribe_kwargs, "language": code}
+
+        result = model.transcribe(audio, **transcribe_kwargs)
+        segments = result.get("segments") or []
+        result["language_probability"] = language_probability
+        result["avg_logprob"] = float(np.mean([seg["avg_logprob"] for seg in segments])) if segments else None
+        return result
+
+    async def transcribe_buffer(self, audio_buffer: np.ndarray, language: Optional[str] = None, initial_prompt: Optional[str] = None,
+                                model_size: Optional[str] = None, tier: str = "final",
+                                timings: Optional[Dict[str, float]] = None,
+                                context: Optional[TranscriptContext] = None,
+                                features: Optional[MelFeatureCache] = None) -> Optional[Dict[str, Any]]:
         """
         Transcreve o buffer de áudio.
         
@@ -89,36 +1927,76 @@ class AudioProcessor:
                      pois evita detecção automática. Ex: "pt", "en", "es"
             initial_prompt: Texto de contexto anterior (opcional). Melhora precisão
                           ao fornecer contexto do que foi dito antes.
+            context: Contexto da sessão já tokenizado (opcional, substitui initial_prompt)
+            features: Cache de log-mel da conexão (opcional); audio_buffer deve começar
+                      no início do buffer dela. Só usado com o scheduler
+            model_size: Modelo do registro a usar (opcional, padrão: model_size do processor)
+            tier: "partial" usa decodificação gulosa sem fallback de temperatura;
+                  "final" usa beam search (FINAL_BEAM_SIZE)
+            timings: Dict opcional que recebe os tempos por etapa em ms: queue_ms,
+                     encode_ms e decode_ms com o scheduler; whisper_ms sem ele
         
         Returns:
-            Dict com text, translatedText, language e language_probs (se disponível)
+            Dict com text, translatedText, language (pt normalizado para pt-BR),
+            language_code (código do Whisper), language_probability (só quando o
+            idioma foi detectado nesta janela), avg_logprob e segments
         """
         try:
             loop = asyncio.get_event_loop()
             
-            # Preparar parâmetros para transcribe
-            transcribe_kwargs = {"fp16": False}
             if language:
                 # Especificar idioma melhora performance e precisão
                 # O modelo não precisa calcular probabilidades para todos os idiomas
-                transcribe_kwargs["language"] = language
                 logger.debug(f"Using specified language: {language} (performance optimized)")
             
+            model_size = self.resolve_model(model_size)
+            beam_size = FINAL_BEAM_SIZE if tier == "final" else None
+
             # Usar texto anterior como contexto para melhorar precisão
-            if initial_prompt:
-                # Limitar o prompt aos últimos 224 tokens (limite do Whisper)
-                # Aproximadamente 200 palavras ou ~1000 caracteres
-                prompt_text = initial_prompt.strip()
-                if len(prompt_text) > 500:
-                    # Pegar apenas as últimas palavras para manter contexto recente
-                    prompt_text = "..." + prompt_text[-500:]
-                transcribe_kwargs["initial_prompt"] = prompt_text
-                logger.debug(f"Using context prompt: {prompt_text[:50]}...")
-            
-            result = await loop.run_in_executor(
-                None, 
-                lambda: self.whisper_model.transcribe(audio_buffer, **transcribe_kwargs)
-            )
+            if context is None and initial_prompt and initial_prompt.strip():
+                context = TranscriptContext()
+                context.append(initial_prompt, self.registry.tokenizers[model_size])
+            prompt_tokens = prompt_text = None
+            if context:
+                # Limitado aos últimos PROMPT_MAX_TOKENS tokens (limite do Whisper), em cache
+                tokenizer = self.registry.tokenizers[model_size]
+                if self.scheduler is not None:
+                    prompt_tokens = context.prompt_tokens(tokenizer)
+                else:
+                    prompt_text = context.prompt_text(tokenizer)
+                logger.debug(f"Using context prompt: {context.token_count} tokens")
+
+            started_at = time.perf_counter()
+            if self.scheduler is not None:
+                # Inferência agrupada com as janelas das outras conexões
+                result = await self.scheduler.submit(audio_buffer, language, prompt_tokens, model_size, beam_size,
+                                                     timings, features)
+            else:
+                transcribe_kwargs = {"fp16": False}
+                if beam_size:
+                    transcribe_kwargs["beam_size"] = beam_size
+                else:
+                    # Parcial: só temperatura 0, sem as decodificações de fallback
+                    transcribe_kwargs["temperature"] = 0.0
+                if language:
+                    transcribe_kwargs["language"] = language
+                if prompt_text:
+                    transcribe_kwargs["initial_prompt"] = prompt_text
+                result = await loop.run_in_executor(
+                    self.executor, 
+                    self._transcribe_single_locked, model_size, audio_buffer, transcribe_kwargs
+                )
+
+            latency_ms = (time.perf_counter() - started_at) * 1000
+            if timings is not None and self.scheduler is None:
+                # model.transcribe não separa encoder e decoder
+                timings["whisper_ms"] = latency_ms
+            self.tier_latency_ms.setdefault(tier, deque(maxlen=1000)).append(latency_ms)
+            self.decoded_seconds[tier] = self.decoded_seconds.get(tier, 0.0) + len(audio_buffer) / SAMPLE_RATE
+            logger.debug(f"{tier} transcription: {latency_ms:.1f} ms (model: {model_size}, beam: {beam_size or 'greedy'})")
+
+            if not result:
+                return None
             
             original_text = result.get("text", "").strip()
             whisper_detected_language = result.get("language", "unknown")
@@ -135,7 +2013,14 @@ class AudioProcessor:
             response = {
                 "text": original_text, 
                 "translatedText": original_text,
-                "language": final_language
+                "language": final_language,
+                "language_code": whisper_detected_language,
+                "language_probability": result.get("language_probability"),
+                "avg_logprob": result.get("avg_logprob"),
+                "segments": [
+                    {"start": seg["start"], "end": seg["end"], "text": seg["text"].strip()}
+                    for seg in result.get("segments", [])
+                ]
             }
             
             return response
@@ -144,144 +2029,1019 @@ class AudioProcessor:
             logger.error(f"error during transcription: {e}")
             return None
 
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_size,
+            "models": self.registry.status,
+            "device": self.device,
+            "backend": self.backend.name,
+            "threads": self.threads,
+            "inference_workers": self.inference_workers,
+            "scheduler": self.scheduler.stats() if self.scheduler else None,
+            "translation": self.translator.stats() if self.translator else None,
+            "tier_latency_ms": {tier: summarize(values) for tier, values in self.tier_latency_ms.items()},
+            "decoded_seconds": {tier: round(seconds, 1) for tier, seconds in self.decoded_seconds.items()},
+        }
+
 
 processor = AudioProcessor(model_size="base")
 
-async def handler(websocket):
+# Latência por etapa de todas as conexões (exposta em /metrics)
+stage_metrics = StageLatencyHistogram()
+
+# Perfil de chunks/janela recomendado conforme a carga (substituído em main() pela linha de comando)
+chunk_tuner = ChunkTuner()
+
+# Sessões retomáveis por id (substituída em main() com o TTL e o limite da linha de comando)
+sessions = SessionStore()
+
+
+def http_ready():
+    ready = processor.registry.all_ready
+    return (200 if ready else 503), {"ready": ready, "models": processor.registry.status}
+
+def http_metrics():
+    """Histogramas por etapa e medidores do scheduler no formato texto do Prometheus."""
+    lines = [stage_metrics.render_prometheus()]
+    lines.append("# HELP whisper_models_ready Models loaded and warmed up.")
+    lines.append("# TYPE whisper_models_ready gauge")
+    lines.append(f"whisper_models_ready {sum(processor.registry.is_ready(s) for s in processor.registry.sizes)}")
+    if processor.scheduler is not None:
+        lines.append("# HELP inference_queue_depth Windows waiting for the inference scheduler.")
+        lines.append("# TYPE inference_queue_depth gauge")
+        lines.append(f"inference_queue_depth {processor.scheduler.queue.qsize()}")
+        lines.append("# HELP inference_batches_total Batches run by the inference scheduler.")
+        lines.append("# TYPE inference_batches_total counter")
+        lines.append(f"inference_batches_total {processor.scheduler.batches_run}")
+    return 200, "\n".join(lines) + "\n"
+
+# Rotas do endpoint HTTP local: caminho -> função que devolve (status, corpo JSON ou texto)
+HTTP_ROUTES = {
+    "/ready": http_ready,
+    "/metrics": http_metrics,
+}
+
+async def handle_http(reader, writer):
+    """HTTP mínimo (GET, uma requisição por conexão) para as rotas em HTTP_ROUTES."""
+    try:
+        request_line = await reader.readline()
+        # Ignorar os cabeçalhos
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+        route = HTTP_ROUTES.get(path)
+        if route is None:
+            status, body = 404, {"error": "not found"}
+        else:
+            status, body = route()
+
+        content_type = "application/json"
+        if isinstance(body, str):
+            payload = body.encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            payload = json.dumps(body).encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}.get(status, "OK")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.error(f"error in http handler: {e}")
+    finally:
+        writer.close()
+
+async def handler(websocket, streaming_mode: str = "window", use_vad: bool = True,
+                  partial_model: Optional[str] = None):
     logger.info(f"client connected: {websocket.remote_address}")
     if not processor.is_initialized:
         await processor.initialize_models()
     
-    max_samples = SAMPLE_RATE * MAX_BUFFER_SECONDS
-    overlap_samples = SAMPLE_RATE * OVERLAP_SECONDS
-    
-    audio_buffer = np.array([], dtype=np.float32)
-    final_transcript = ""
-    last_sent_text = ""
+    # Janela e sobreposição do perfil recomendado (mudam com a carga do servidor).
+    # Só clientes que negociaram stream_config saem do perfil 0: os outros continuam
+    # mandando chunks curtos, e uma janela maior só aumentaria o custo de cada parcial
+    stream_profile = chunk_tuner.profile(0)
+    max_samples = SAMPLE_RATE * stream_profile["window_seconds"]
+    overlap_samples = SAMPLE_RATE * stream_profile["overlap_seconds"]
+    # Cliente que aceita o intervalo de chunks recomendado pelo servidor (stream_config)
+    adaptive_chunks = False
+    # Idioma de destino da tradução pedido pelo cliente (só com o protocolo de deltas)
+    translation_target = None
+    translation_tasks = set()
+
+    async def send_translation(segment: Dict[str, Any], epoch: str, source: str, audio: np.ndarray):
+        """Tradução de um segmento confirmado, enviada depois, sem segurar a transcrição."""
+        try:
+            translated, cached = await processor.translator.translate(segment["text"], source, audio)
+            if not translated:
+                return
+            # Guardada no segmento: um transcript_resync devolve o texto já traduzido
+            segment["translation"] = translated
+            await websocket.send(json.dumps({
+                "type": "translation",
+                "epoch": epoch,
+                "id": segment["id"],
+                "text": translated,
+                "source": source,
+                "target": translation_target,
+                "cached": cached,
+            }))
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"error in translation: {e}")
+
+    def schedule_translation(segment: Optional[Dict[str, Any]], source: Optional[str], audio: np.ndarray):
+        if segment is None or translation_target is None or not delta_transcript:
+            return
+        if not source or source == translation_target:
+            return
+        # Cópia: o buffer da sessão vai ser consumido logo depois
+        task = asyncio.create_task(send_translation(segment, transcript.epoch, source, np.array(audio)))
+        translation_tasks.add(task)
+        task.add_done_callback(translation_tasks.discard)
     
-    # Idioma selecionado pelo cliente (None = detecção automática)
-    selected_language = None  # None significa detecção automática
+    # Estado da sessão: novo, ou o mesmo de antes da queda se o cliente mandou um id conhecido
+    session, resumed, previous = sessions.attach(
+        session_id_from_path(request_path(websocket)), websocket,
+        use_vad=use_vad, batching=processor.scheduler is not None,
+    )
+    if previous is not None:
+        # A conexão antiga ainda não tinha caído: ela para ao ver que perdeu a sessão
+        logger.info(f"session {session.id} taken over by {websocket.remote_address}")
+        asyncio.create_task(previous.close(1000, "session resumed elsewhere"))
+    if resumed:
+        logger.info(f"session {session.id} resumed: {len(session.audio_buffer) / SAMPLE_RATE:.2f}s buffered, "
+                    f"context {session.context.token_count} tokens, last seq {session.last_seq}")
+
+    audio_buffer = session.audio_buffer
+    # Protocolo de deltas (negociado em protocol_config): segmentos confirmados vão
+    # uma vez só, com id, e o texto acumulado não cresce no servidor nem nas mensagens
+    delta_transcript = False
+    transcript = session.transcript
+    context = session.context
+    features = session.features
+
+    # Decoder persistente, criado no primeiro chunk de stream contínuo
+    stream_decoder = None
+
+    # Modo incremental: confirma prefixos estáveis em vez de retranscrever a janela inteira
+    incremental = streaming_mode == "incremental"
+    streamer = session.streamer
+    min_step_samples = int(SAMPLE_RATE * INCREMENTAL_MIN_STEP_SECONDS)
+
+    # VAD: pula trechos sem fala e usa as pausas como ponto de corte das janelas
+    vad = session.vad
+
+    # Detecção automática: fixa o idioma depois das primeiras janelas com fala
+    language_detector = session.language_detector
+
+    # As mensagens são lidas por uma tarefa separada e processadas aqui em ordem.
+    # Assim o servidor sabe quando já há chunks mais novos esperando: a inferência
+    # parcial do chunk atual fica obsoleta e é pulada (coalescência), e cada
+    # cliente tem no máximo uma inferência em andamento.
+    inbox = asyncio.Queue()
+    pending_audio = 0
+    coalesced_chunks = 0
+    backpressure_active = False
+
+    async def receive_messages():
+        nonlocal pending_audio
+        try:
+            async for raw_message in websocket:
+                received_at = time.perf_counter()
+                if isinstance(raw_message, bytes):
+                    message, json_ms = raw_message, 0.0
+                else:
+                    # O parse do JSON (com o base64 dentro) conta em parse_ms, não em inbox_ms
+                    try:
+                        message = json.loads(raw_message)
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"skipping malformed json message: {e}")
+                        await websocket.send(json.dumps({"type": "error", "error": "malformed json"}))
+                        continue
+                    json_ms = (time.perf_counter() - received_at) * 1000
+                    if not isinstance(message, dict):
+                        logger.warning(f"skipping json message that is not an object: {type(message).__name__}")
+                        await websocket.send(json.dumps({"type": "error", "error": "message must be a json object"}))
+                        continue
+                if isinstance(message, bytes) or message.get("type") == "audio_chunk":
+                    pending_audio += 1
+                await inbox.put((message, received_at, json_ms))
+        except websockets.ConnectionClosed:
+            logger.info(f"client disconnected: {websocket.remote_address}")
+        except Exception as e:
+            logger.error(f"error in handler: {e}")
+        finally:
+            await inbox.put(None)
+
+    receiver = asyncio.create_task(receive_messages())
 
     try:
-        async for message in websocket:
-            data = json.loads(message)
-            
-            # Processar configuração de idioma
-            if data.get("type") == "language_config":
-                lang = data.get("language", "auto")
-                if lang == "auto":
-                    selected_language = None
-                    logger.info("Language set to: AUTO DETECTION (slower)")
+        while True:
+            item = await inbox.get()
+            if item is None:
+                break
+            # Uma mensagem por vez na sessão: numa retomada, a conexão nova espera a
+            # antiga terminar a mensagem em andamento (e a inferência que lê o buffer)
+            async with session.lock:
+                if session.websocket is not websocket:
+                    # Outra conexão retomou esta sessão
+                    break
+                message, received_at, json_ms = item
+                parse_started = time.perf_counter()
+
+                # Frames binários: áudio com cabeçalho (seq, timestamp, codec), sem base64
+                if isinstance(message, bytes):
+                    pending_audio -= 1
+                    frame = parse_audio_frame(message)
+                    if frame is None:
+                        logger.warning("skipping invalid binary audio frame.")
+                        continue
+                    audio_bytes = frame["audio"]
+                    codec = frame["codec"]
+                    seq = frame["seq"]
                 else:
-                    selected_language = lang
-                    logger.info(f"Language set to: {lang.upper()} (optimized)")
-                continue
+                    data = message
+                
+                    # Processar configuração de idioma
+                    if data.get("type") == "language_config":
+                        lang = data.get("language", "auto")
+                        if lang == "auto":
+                            # Sessão retomada já em modo automático: manter o idioma fixado
+                            if session.selected_language is not None or not resumed:
+                                language_detector.reset()
+                            session.selected_language = None
+                            logger.info("Language set to: AUTO DETECTION (slower)")
+                        else:
+                            session.selected_language = lang
+                            logger.info(f"Language set to: {lang.upper()} (optimized)")
+                        continue
             
-            # Processar reset de contexto
-            if data.get("type") == "reset_context":
-                audio_buffer = np.array([], dtype=np.float32)
-                final_transcript = ""
-                last_sent_text = ""
-                logger.info("Context reset - buffer and transcript cleared")
-                continue
+                    # Escolha do tamanho de modelo entre os residentes no registro
+                    if data.get("type") == "model_config":
+                        model = data.get("model")
+                        if model in processor.registry.sizes:
+                            session.selected_model = model
+                            logger.info(f"Model set to: {model}")
+                        await websocket.send(json.dumps({
+                            "type": "model_ack",
+                            "model": session.selected_model or processor.model_size,
+                            "ready": processor.registry.is_ready(session.selected_model or processor.model_size),
+                            "available": processor.registry.sizes,
+                        }))
+                        continue
+
+                    # Métricas do servidor (fila de inferência, tamanho dos lotes, espera)
+                    if data.get("type") == "get_server_stats":
+                        await websocket.send(json.dumps({
+                            "type": "server_stats",
+                            **processor.stats(),
+                            "session": {
+                            "vad": vad.stats() if vad else None,
+                            "coalesced_chunks": coalesced_chunks,
+                            "backpressure": backpressure_active,
+                            "mel_cache": features.stats() if features else None,
+                            "language": language_detector.stats() if session.selected_language is None else None,
+                            "id": session.id,
+                            "resumed": resumed,
+                            "stream_profile": stream_profile["level"],
+                        },
+                            "sessions": sessions.stats(),
+                            "stages": stage_metrics.summary(),
+                            "stream": chunk_tuner.stats(),
+                        }))
+                        continue
+
+                    # Processar reset de contexto
+                    if data.get("type") == "reset_context":
+                        session.reset()
+                        logger.info("Context reset - buffer and transcript cleared")
+                        continue
             
-            if data.get("type") == "audio_chunk":
-                base64_audio = data.get("audio", "")
-                
-                if base64_audio.startswith('data:'):
-                    base64_audio = base64_audio.split(',', 1)[1]
-                
-                missing_padding = len(base64_audio) % 4
-                if missing_padding: base64_audio += '=' * (4 - missing_padding)
-                
-                audio_bytes = base64.b64decode(base64_audio)
-                
+                    # Negociação do formato de áudio: clientes novos passam a mandar frames binários
+                    if data.get("type") == "protocol_config":
+                        binary = data.get("audio_frames") == "binary"
+                        delta_transcript = data.get("transcript") == "delta"
+                        adaptive_chunks = bool(data.get("stream_config"))
+                        requested = data.get("translation")
+                        translation_target = (requested if processor.translator is not None
+                                              and requested == processor.translator.target else None)
+                        await websocket.send(json.dumps({
+                            "type": "protocol_ack",
+                            "audio_frames": "binary" if binary else "json",
+                            "version": AUDIO_FRAME_VERSION,
+                            "codecs": list(AUDIO_FRAME_CODECS.values()),
+                            "transcript": "delta" if delta_transcript else "full",
+                            "epoch": transcript.epoch,
+                            # Retomada: o cliente reenvia os chunks com seq maior que last_seq
+                            "session_id": session.id,
+                            "resumed": resumed,
+                            "last_seq": session.last_seq,
+                            "stream_config": adaptive_chunks,
+                            "translation": translation_target,
+                        }))
+                        stream_profile = chunk_tuner.profile(None if adaptive_chunks else 0)
+                        max_samples = SAMPLE_RATE * stream_profile["window_seconds"]
+                        overlap_samples = SAMPLE_RATE * stream_profile["overlap_seconds"]
+                        if adaptive_chunks:
+                            await websocket.send(json.dumps({"type": "stream_config", **stream_profile}))
+                        logger.info(f"audio frames: {'binary' if binary else 'json'}, "
+                                    f"transcript: {'delta' if delta_transcript else 'full'}")
+                        continue
+
+                    # Cliente reconectado: reenviar os segmentos confirmados que ele não tem
+                    if data.get("type") == "transcript_resync":
+                        sync = transcript.since(data.get("epoch"), int(data.get("last_id") or 0))
+                        await websocket.send(json.dumps({"type": "transcript_sync", **sync}))
+                        logger.info(f"transcript resync: {len(sync['segments'])} segments "
+                                    f"(reset: {sync['reset']}, truncated: {sync['truncated']})")
+                        continue
+
+                    if data.get("type") != "audio_chunk":
+                        continue
+                    pending_audio -= 1
+
+                    # Formato antigo: JSON com data URL em base64
+                    audio_bytes = decode_data_url(data.get("audio", ""))
+                    codec = data.get("codec")
+                    seq = data.get("seq")
+
+                # Chunk reenviado depois de uma reconexão que já tinha chegado antes da queda
+                if seq is not None and session.last_seq is not None and seq <= session.last_seq:
+                    logger.debug(f"skipping replayed chunk {seq} (last seq {session.last_seq})")
+                    continue
+                if seq is not None:
+                    session.last_seq = seq
+
+                # Tempos por etapa deste chunk (ms), devolvidos junto com a transcrição
                 start_time = time.perf_counter()
-                
-                decoded_np = await processor.decode_chunk(audio_bytes)
-                if decoded_np is None:
-                    logger.warning("skipping chunk, decoding failed.")
+                timings = {
+                    "inbox_ms": (parse_started - received_at) * 1000 - json_ms,
+                    "parse_ms": json_ms + (start_time - parse_started) * 1000,
+                }
+            
+                # "pcm-s16le": Int16 mono 16 kHz vindo do AudioWorklet, vai direto para o buffer
+                # "webm-stream": fragmentos de um único WebM contínuo (decoder persistente)
+                # sem codec: container WebM completo por chunk (clientes antigos)
+                if codec == "pcm-s16le":
+                    usable = len(audio_bytes) - (len(audio_bytes) % 2)
+                    if usable == 0:
+                        continue
+                    decoded_np = pcm16_to_float32(audio_bytes[:usable])
+                elif codec == "webm-stream":
+                    if stream_decoder is None:
+                        stream_decoder = processor.create_stream_decoder()
+                    decoded_np = await stream_decoder.decode(audio_bytes)
+                    if stream_decoder.failed:
+                        # Os próximos fragmentos não têm cabeçalho: fechar a conexão. O cliente
+                        # reconecta, retoma a sessão e reinicia o MediaRecorder com um stream novo
+                        logger.error(f"closing {websocket.remote_address}: streaming decoder failed")
+                        await websocket.close(code=1011, reason="audio decoder failed")
+                        break
+                    if decoded_np is None:
+                        logger.debug("no pcm available yet from streaming decoder.")
+                        continue
+                else:
+                    decoded_np = await processor.decode_chunk(audio_bytes)
+                    if decoded_np is None:
+                        logger.warning("skipping chunk, decoding failed.")
+                        continue
+                timings["audio_decode_ms"] = (time.perf_counter() - start_time) * 1000
+                stage_metrics.observe_all(timings)
+
+                vad_state = vad.update(decoded_np) if vad else "speech"
+                if vad_state == "skip":
+                    # Nada de fala pendente: não vale a pena nem guardar no buffer
                     continue
 
-                audio_buffer = np.concatenate([audio_buffer, decoded_np])
-                
+                audio_buffer.append(decoded_np)
+                if session.selected_language is None:
+                    language_detector.add_audio(len(decoded_np) / SAMPLE_RATE)
+
+                if vad_state == "silence":
+                    # Pausa curta: o texto não muda, esperar a fala continuar ou terminar
+                    continue
+                end_of_speech = vad_state == "end"
+
+                # Já chegou áudio mais novo: a inferência parcial deste chunk seria
+                # descartada logo em seguida, então só o próximo chunk é transcrito.
+                # Fim de frase e janela cheia nunca são pulados (mudam o texto final).
+                if pending_audio > 0 and not end_of_speech and len(audio_buffer) < max_samples:
+                    coalesced_chunks += 1
+                    if incremental:
+                        session.undecoded_samples += len(decoded_np)
+                    continue
+            
                 current_window_text = ""
                 detected_lang = None
+                # Segmentos confirmados neste chunk (protocolo de deltas)
+                commits = []
+                # Idioma escolhido, o fixado pela detecção automática, ou None (detectar nesta janela)
+                request_language = session.selected_language or language_detector.language_for_request()
+
+                if incremental:
+                    session.undecoded_samples += len(decoded_np)
+                    if session.undecoded_samples < min_step_samples and not end_of_speech:
+                        continue
+                    session.undecoded_samples = 0
 
-                if len(audio_buffer) >= max_samples:
-                    logger.info(f"--- JANELA DE {MAX_BUFFER_SECONDS}s CHEIA ---")
-                    
+                    # Hipóteses ainda não confirmadas: tier parcial (guloso, modelo de parciais).
+                    # O prompt só tem o texto cujo áudio já saiu do buffer
+                    result = await processor.transcribe_buffer(
+                        audio_buffer.view(),
+                        language=request_language,
+                        context=context,
+                        features=features,
+                        model_size=partial_model or session.selected_model,
+                        tier="partial",
+                        timings=timings
+                    )
+                    detected_lang = result.get("language", "unknown") if result else "unknown"
+
+                    # Limite do buffer antes de um corte forçado: a janela do perfil da sessão
+                    finalized_text, trim_samples, forced = streamer.process(
+                        result, len(audio_buffer), end_of_speech=end_of_speech, max_buffer_samples=max_samples
+                    )
+                    if finalized_text and forced:
+                        # Confirmado sem concordância entre hipóteses (fim de frase ou buffer
+                        # cheio): só esse trecho passa pelo tier final (beam search)
+                        final = await processor.transcribe_buffer(
+                            audio_buffer.view(0, trim_samples or len(audio_buffer)),
+                            language=request_language,
+                            context=context,
+                            features=features,
+                            model_size=session.selected_model,
+                            tier="final"
+                        )
+                        if final and final.get("text"):
+                            finalized_text = final["text"]
+                    if finalized_text:
+                        if not delta_transcript:
+                            session.final_transcript += finalized_text + " "
+                        segment = transcript.commit(finalized_text)
+                        if segment:
+                            commits.append(segment)
+                        schedule_translation(segment, request_language or (result or {}).get("language_code"),
+                                             audio_buffer.view(0, trim_samples or len(audio_buffer)))
+                        context.append(finalized_text, processor.registry.tokenizers[processor.resolve_model(session.selected_model)])
+                        logger.info(f"Texto finalizado: {finalized_text} (lang: {detected_lang}, context: {context.token_count} tokens)")
+                    if trim_samples:
+                        audio_buffer.consume(trim_samples)
+
+                    current_window_text = streamer.text
+
+                elif end_of_speech or len(audio_buffer) >= max_samples:
+                    if end_of_speech:
+                        # Fim de frase: finalizar tudo, sem sobreposição
+                        logger.info("--- FIM DE FALA ---")
+                        window_end = keep_from = len(audio_buffer)
+                    else:
+                        logger.info(f"--- JANELA DE {stream_profile['window_seconds']}s CHEIA ---")
+                        # Cortar numa pausa dentro da região de sobreposição, se houver;
+                        # senão manter o corte fixo com a sobreposição do perfil
+                        cut = vad.find_cut_point(audio_buffer.view(), max_samples - overlap_samples) if vad else None
+                        if cut:
+                            window_end = keep_from = cut
+                        else:
+                            window_end = len(audio_buffer)
+                            keep_from = max_samples - overlap_samples
+                
                     # Usar texto finalizado como contexto para melhorar precisão
-                    # Passar o final_transcript como initial_prompt
+                    # Passar o contexto da sessão (tokens já confirmados) como prompt
                     result = await processor.transcribe_buffer(
-                        audio_buffer, 
-                        language=selected_language,
-                        initial_prompt=final_transcript.strip() if final_transcript.strip() else None
+                        audio_buffer.view(0, window_end), 
+                        language=request_language,
+                        context=context,
+                        features=features,
+                        model_size=session.selected_model,
+                        timings=timings
                     )
                     text_to_finalize = result.get("text", "") if result else ""
                     detected_lang = result.get("language", "unknown") if result else "unknown"
-                    
-                    final_transcript += text_to_finalize + " "
-                    logger.info(f"Texto finalizado: {text_to_finalize} (lang: {detected_lang}, context: {len(final_transcript)} chars)")
-
-                    audio_buffer = audio_buffer[max_samples - overlap_samples:]
                 
+                    if not delta_transcript:
+                        session.final_transcript += text_to_finalize + " "
+                    segment = transcript.commit(text_to_finalize)
+                    if segment:
+                        commits.append(segment)
+                    schedule_translation(segment, request_language or (result or {}).get("language_code"),
+                                         audio_buffer.view(0, window_end))
+                    context.append(text_to_finalize, processor.registry.tokenizers[processor.resolve_model(session.selected_model)])
+                    logger.info(f"Texto finalizado: {text_to_finalize} (lang: {detected_lang}, context: {context.token_count} tokens)")
+
+                    audio_buffer.consume(keep_from)
+            
                 else:
                     # Usar texto finalizado como contexto mesmo para janela parcial
                     # Isso ajuda na continuidade da transcrição
+                    # Parcial é descartado no próximo chunk: modelo rápido e decodificação gulosa
                     result = await processor.transcribe_buffer(
-                        audio_buffer, 
-                        language=selected_language,
-                        initial_prompt=final_transcript.strip() if final_transcript.strip() else None
+                        audio_buffer.view(), 
+                        language=request_language,
+                        context=context,
+                        features=features,
+                        model_size=partial_model or session.selected_model,
+                        tier="partial",
+                        timings=timings
                     )
                     current_window_text = result.get("text", "") if result else ""
                     detected_lang = result.get("language", "unknown") if result else "unknown"
 
 
+                if session.selected_language is None and language_detector.update(result):
+                    logger.info(f"language locked: {language_detector.language} "
+                                f"(p={language_detector.probability:.2f}, {websocket.remote_address})")
+                    await websocket.send(json.dumps({
+                        "type": "language_detected",
+                        "language": "pt-BR" if language_detector.language == "pt" else language_detector.language,
+                        "probability": round(language_detector.probability, 3),
+                        "locked": True,
+                    }))
+
                 end_time = time.perf_counter()
                 processing_ms = (end_time - start_time) * 1000
+                # Só as etapas de inferência: parse e decodificação já foram registradas
+                stage_metrics.observe_all({k: v for k, v in timings.items()
+                                           if k in ("queue_ms", "encode_ms", "detect_ms", "decode_ms", "whisper_ms")})
+                timings["server_ms"] = (end_time - received_at) * 1000
+                stage_metrics.observe("server", timings["server_ms"])
+
+                # Backpressure: atraso desde que o chunk chegou até a transcrição ficar pronta
+                lag_ms = (end_time - received_at) * 1000
+
+                # Perfil adaptativo: a latência deste chunk entra na média do processo
+                scheduler = processor.scheduler
+                chunk_tuner.observe(lag_ms, scheduler.queue.qsize() if scheduler else 0,
+                                    scheduler.max_batch_size if scheduler else 1)
+                if adaptive_chunks and chunk_tuner.level != stream_profile["level"]:
+                    stream_profile = chunk_tuner.profile()
+                    max_samples = SAMPLE_RATE * stream_profile["window_seconds"]
+                    overlap_samples = SAMPLE_RATE * stream_profile["overlap_seconds"]
+                    logger.info(f"stream profile {stream_profile['level']} for {websocket.remote_address}: "
+                                f"{stream_profile['chunk_ms']} ms chunks, {stream_profile['window_seconds']}s window "
+                                f"(latency {chunk_tuner.latency_ms:.0f} ms)")
+                    await websocket.send(json.dumps({"type": "stream_config", **stream_profile}))
+                if not backpressure_active and lag_ms > BACKPRESSURE_LATENCY_MS:
+                    backpressure_active = True
+                    logger.warning(f"backpressure ON for {websocket.remote_address}: lag {lag_ms:.0f} ms")
+                    await websocket.send(json.dumps({
+                        "type": "backpressure",
+                        "action": "slow_down",
+                        "lag_ms": round(lag_ms),
+                        "recommended_chunk_ms": max(BACKPRESSURE_CHUNK_MS, stream_profile["chunk_ms"]),
+                    }))
+                elif backpressure_active and lag_ms < BACKPRESSURE_LATENCY_MS / 2:
+                    backpressure_active = False
+                    logger.info(f"backpressure OFF for {websocket.remote_address}: lag {lag_ms:.0f} ms")
+                    await websocket.send(json.dumps({
+                        "type": "backpressure",
+                        "action": "resume",
+                        "lag_ms": round(lag_ms),
+                    }))
 
-                full_text_to_send = final_transcript + current_window_text
+                # Usar idioma detectado do resultado, ou o selecionado como fallback
+                response_lang = detected_lang if detected_lang else (session.selected_language or "unknown")
 
-                if full_text_to_send and full_text_to_send != last_sent_text:
-                    last_sent_text = full_text_to_send
-                    
-                    # Usar idioma detectado do resultado, ou o selecionado como fallback
-                    response_lang = detected_lang if detected_lang else (selected_language or "unknown")
-                    
+                if delta_transcript:
+                    # Só o que mudou: segmentos novos (uma vez) e o trecho mutável atual
+                    tail = current_window_text.strip()
+                    if not commits and tail == transcript.tail:
+                        continue
+                    transcript.tail = tail
+                    response = {
+                        "type": "transcript_delta",
+                        "epoch": transcript.epoch,
+                        "commit": commits,
+                        "tail": tail,
+                        "timestamp": int(time.time() * 1000),
+                        "language": response_lang,
+                        "seq": seq,
+                        "timings": {stage: round(ms, 2) for stage, ms in timings.items()},
+                    }
+                    if session.selected_language is None and language_detector.locked:
+                        response["language_probability"] = round(language_detector.probability, 3)
+                    if incremental:
+                        response["unstable"] = streamer.unstable_text
+
+                    send_started = time.perf_counter()
+                    await websocket.send(json.dumps(response))
+                    stage_metrics.observe("send", (time.perf_counter() - send_started) * 1000)
+                    logger.info(f"transcript delta SENT: {len(commits)} segments, tail '{tail}' "
+                                f"(buffer: {len(audio_buffer)/SAMPLE_RATE:.2f}s, time: {processing_ms:.2f} ms, "
+                                f"language: {response_lang})")
+                    continue
+
+                full_text_to_send = session.final_transcript + current_window_text
+
+                if full_text_to_send and full_text_to_send != session.last_sent_text:
+                    session.last_sent_text = full_text_to_send
+                
                     response = {
                         "type": "transcription", 
                         "text": full_text_to_send, 
                         "translatedText": full_text_to_send,
                         "timestamp": int(time.time() * 1000),
-                        "language": response_lang
+                        "language": response_lang,
+                        # Chunk que gerou esta transcrição e o tempo gasto em cada etapa
+                        "seq": seq,
+                        "timings": {stage: round(ms, 2) for stage, ms in timings.items()},
                     }
-                    
+                    if session.selected_language is None and language_detector.locked:
+                        response["language_probability"] = round(language_detector.probability, 3)
+
+                    if incremental:
+                        stable_text = session.final_transcript + streamer.stable_text
+                        response["stable"] = stable_text.strip()
+                        response["unstable"] = streamer.unstable_text
+                
+                    send_started = time.perf_counter()
                     await websocket.send(json.dumps(response))
-                    
-                    logger.info(f"transcription SENT: '{full_text_to_send}' (buffer: {len(audio_buffer)/SAMPLE_RATE:.2f}s, time: {processing_ms:.2f} ms, language: {response_lang})")
+                    stage_metrics.observe("send", (time.perf_counter() - send_started) * 1000)
                 
+                    logger.info(f"transcription SENT: '{full_text_to_send}' (buffer: {len(audio_buffer)/SAMPLE_RATE:.2f}s, time: {processing_ms:.2f} ms, language: {response_lang})")
+            
                 elif full_text_to_send:
                     logger.info(f"transcription SKIPPED (redundant). (buffer: {len(audio_buffer)/SAMPLE_RATE:.2f}s)")
-                    
+
     except websockets.ConnectionClosed:
         logger.info(f"client disconnected: {websocket.remote_address}")
     except Exception as e:
         logger.error(f"error in handler: {e}")
+    finally:
+        receiver.cancel()
+        for task in translation_tasks:
+            task.cancel()
+        async with session.lock:
+            sessions.detach(session, websocket)
+        if stream_decoder is not None:
+            await stream_decoder.close()
+        if vad is not None:
+            logger.info(f"session vad: skipped {vad.skipped_ratio:.1%} of "
+                        f"{vad.total_samples / SAMPLE_RATE:.1f}s of audio ({websocket.remote_address})")
+
+async def http_get(host: str, port: int, path: str, timeout: float = 2.0):
+    """GET mínimo para as rotas locais de um worker; devolve (status, corpo JSON)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    return status, json.loads(body) if body else None
+
+
+class WorkerProcess:
+    """Um processo servidor completo (modelo, threads e conexões próprios) atrás do supervisor."""
+
+    def __init__(self, index: int, port: int, http_port: int, cpus: List[int], command: List[str]):
+        self.index = index
+        self.port = port
+        self.http_port = http_port
+        self.cpus = cpus
+        self.command = command
+        self.proc = None
+        self.state = "stopped"
+        self.sessions = 0
+        self.total_sessions = 0
+        self.failures = 0
+        self.restarts = 0
+        self.last_check = None
+        self.models = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(*self.command)
+        self.state = "starting"
+        self.failures = 0
+        logger.info(f"worker {self.index} started (pid {self.proc.pid}, port {self.port}, "
+                    f"cpus {','.join(map(str, self.cpus)) or 'all'})")
+
+    async def check(self):
+        if self.proc is None:
+            return
+        if self.proc.returncode is not None:
+            logger.error(f"worker {self.index} exited with code {self.proc.returncode}, restarting")
+            self.state = "dead"
+            self.restarts += 1
+            await self.start()
+            return
+        try:
+            status, body = await http_get("127.0.0.1", self.http_port, "/ready")
+            self.failures = 0
+            self.models = body.get("models") if body else None
+            self.state = "ready" if status == 200 else "loading"
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            self.failures += 1
+            # Ainda subindo (porta HTTP fechada) não conta como falha de um worker pronto
+            if self.state != "starting" and self.failures >= WORKER_MAX_FAILURES:
+                if self.state != "unhealthy":
+                    logger.warning(f"worker {self.index} unhealthy ({self.failures} failed checks)")
+                self.state = "unhealthy"
+        self.last_check = time.time()
+
+    async def stop(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.terminate()
+            try:
+                await asyncio.wait_for(self.proc.wait(), 5)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "pid": self.proc.pid if self.proc else None,
+            "port": self.port,
+            "cpus": self.cpus,
+            "state": self.state,
+            "sessions": self.sessions,
+            "total_sessions": self.total_sessions,
+            "restarts": self.restarts,
+            "failed_checks": self.failures,
+            "last_check": self.last_check,
+            "models": self.models,
+        }
+
+
+class Supervisor:
+    """
+    Modo multiprocesso: N workers, cada um com o próprio modelo e threads
+    fixadas num subconjunto dos núcleos, atrás de um listener único.
+
+    Cada conexão nova vai para o worker pronto com menos sessões ativas e
+    fica nele até fechar (o estado da sessão vive no worker); o supervisor só
+    repassa as mensagens nos dois sentidos, sem decodificar nada. Conexões
+    com id de sessão (?session=...) voltam para o mesmo worker, onde a
+    sessão pode ser retomada.
+    """
 
-async def main():
-    host = "localhost"
-    port = 8080
+    def __init__(self, args):
+        self.workers: List[WorkerProcess] = []
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        per_worker = max(1, len(cpus) // args.workers) if cpus else 0
+        for i in range(args.workers):
+            worker_cpus = cpus[i * per_worker:(i + 1) * per_worker] if len(cpus) >= args.workers else []
+            port = args.worker_port_base + 2 * i
+            command = self.worker_command(args, port, port + 1, worker_cpus)
+            self.workers.append(WorkerProcess(i, port, port + 1, worker_cpus, command))
+        # id de sessão -> worker, em ordem LRU (mesmo limite de sessões dos workers)
+        self.affinity: "OrderedDict[str, WorkerProcess]" = OrderedDict()
+        self.max_affinity = args.max_sessions * args.workers
+
+    @staticmethod
+    def worker_command(args, port: int, http_port: int, cpus: List[int]) -> List[str]:
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            "--host", "127.0.0.1", "--port", str(port), "--http-port", str(http_port),
+            "--model", args.model,
+            "--batch-wait-ms", str(args.batch_wait_ms),
+            "--max-batch-size", str(args.max_batch_size),
+            "--streaming-mode", args.streaming_mode,
+            "--backend", args.backend,
+            "--session-ttl", str(args.session_ttl),
+            "--max-sessions", str(args.max_sessions),
+        ]
+        if args.inference_workers:
+            command += ["--inference-workers", str(args.inference_workers)]
+        if args.no_adaptive_chunks:
+            command.append("--no-adaptive-chunks")
+        if args.no_translation:
+            command.append("--no-translation")
+        if args.extra_models:
+            command += ["--extra-models", *args.extra_models]
+        if args.partial_model:
+            command += ["--partial-model", args.partial_model]
+        if args.no_batching:
+            command.append("--no-batching")
+        if args.no_vad:
+            command.append("--no-vad")
+        if cpus:
+            command += ["--cpus", ",".join(map(str, cpus))]
+        threads = args.threads or len(cpus)
+        if threads:
+            command += ["--threads", str(threads)]
+        return command
+
+    def pick(self) -> Optional[WorkerProcess]:
+        ready = [w for w in self.workers if w.state == "ready"]
+        return min(ready, key=lambda w: (w.sessions, w.total_sessions)) if ready else None
+
+    def route(self, session_id: Optional[str]) -> Optional[WorkerProcess]:
+        """Worker da sessão, se ainda estiver pronto; senão o menos carregado."""
+        if session_id is None:
+            return self.pick()
+        worker = self.affinity.get(session_id)
+        if worker is None or worker.state != "ready":
+            # Worker reiniciado: a sessão se perdeu com ele e recomeça em outro
+            worker = self.pick()
+            if worker is None:
+                return None
+            self.affinity[session_id] = worker
+        self.affinity.move_to_end(session_id)
+        while len(self.affinity) > self.max_affinity:
+            self.affinity.popitem(last=False)
+        return worker
+
+    async def start(self):
+        for worker in self.workers:
+            await worker.start()
+        asyncio.create_task(self.monitor())
+
+    async def monitor(self):
+        while True:
+            await asyncio.gather(*(worker.check() for worker in self.workers))
+            await asyncio.sleep(WORKER_HEALTH_INTERVAL)
+
+    async def stop(self):
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    async def proxy(self, websocket):
+        path = request_path(websocket)
+        worker = self.route(session_id_from_path(path))
+        if worker is None:
+            logger.warning(f"no ready worker for {websocket.remote_address}")
+            await websocket.close(1013, "no ready worker")
+            return
+
+        worker.sessions += 1
+        worker.total_sessions += 1
+        logger.info(f"client {websocket.remote_address} -> worker {worker.index} ({worker.sessions} sessions)")
+        try:
+            # Relay de frames, não handoff: o cliente só alcança a porta pública (túnel/TLS na
+            # frente) e navegadores não seguem redirect em websocket. O trecho até o worker é
+            # local, então vai sem compressão (permessage-deflate custaria CPU nos dois lados)
+            async with websockets.connect(worker.url + path, max_size=None, compression=None) as upstream:
+                async def pump(source, destination):
+                    try:
+                        async for message in source:
+                            await destination.send(message)
+                    except websockets.ConnectionClosed:
+                        pass
+
+                tasks = [asyncio.create_task(pump(websocket, upstream)),
+                         asyncio.create_task(pump(upstream, websocket))]
+                # Um lado fechou: encerrar o outro
+                _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+        except (OSError, websockets.WebSocketException) as e:
+            logger.error(f"proxy to worker {worker.index} failed: {e}")
+        finally:
+            worker.sessions -= 1
+
+    def http_ready(self):
+        ready = any(w.state == "ready" for w in self.workers)
+        return (200 if ready else 503), {"ready": ready, "workers": [w.state for w in self.workers]}
+
+    def http_workers(self):
+        return 200, {"workers": [w.stats() for w in self.workers]}
+
+
+async def run_supervisor(args):
+    supervisor = Supervisor(args)
+    logger.info("=============================================")
+    logger.info(f"supervisor: {args.workers} workers, ws://{args.host}:{args.port}")
+    logger.info("=============================================")
+
+    HTTP_ROUTES["/ready"] = supervisor.http_ready
+    HTTP_ROUTES["/workers"] = supervisor.http_workers
+    HTTP_ROUTES.pop("/metrics", None)
+    if args.http_port:
+        await asyncio.start_server(handle_http, args.host, args.http_port)
+        logger.info(f"http endpoint: http://{args.host}:{args.http_port}/workers")
+
+    await supervisor.start()
+    try:
+        async with websockets.serve(supervisor.proxy, args.host, args.port, max_size=None):
+            await asyncio.Future()
+    finally:
+        await supervisor.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Real-time transcription websocket server')
+    parser.add_argument('--host', default="localhost", help='Host to bind (default: localhost)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to bind (default: 8080)')
+    parser.add_argument('--http-port', type=int, default=8081,
+                        help='Port of the local HTTP endpoint with /ready (default: 8081, 0 disables)')
+    parser.add_argument('--model', default="base", help='Default whisper model size (default: base)')
+    parser.add_argument('--extra-models', nargs='*', default=[],
+                        help='Additional model sizes kept resident, selectable by clients (e.g. tiny small)')
+    parser.add_argument('--inference-workers', type=int, default=INFERENCE_WORKERS,
+                        help='Threads in the bounded pool for model loading, warm-up and inference; each '
+                             'model runs one inference at a time, so more threads than resident models add '
+                             'no parallelism (default: one per resident model)')
+    parser.add_argument('--partial-model',
+                        help='Model size for partial-window hypotheses (e.g. tiny); finalized text keeps '
+                             'the default/selected model with beam search (default: same model, greedy)')
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_WAIT_MS,
+                        help=f'How long the scheduler waits to fill a batch (default: {BATCH_WAIT_MS})')
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE,
+                        help=f'Maximum windows per batched inference (default: {MAX_BATCH_SIZE})')
+    parser.add_argument('--no-batching', action='store_true',
+                        help='Call whisper.transcribe per request instead of batching across clients')
+    parser.add_argument('--streaming-mode', choices=['window', 'incremental'], default='window',
+                        help='window: re-transcribe the whole window on every chunk; '
+                             'incremental: commit stable prefixes (local agreement) and decode only '
+                             'unconfirmed audio (default: window)')
+    parser.add_argument('--no-vad', action='store_true',
+                        help='Transcribe every chunk, including silence (disables voice-activity gating)')
+    parser.add_argument('--backend', choices=sorted(INFERENCE_BACKENDS), default='torch',
+                        help='torch: openai-whisper as is (float32 on CPU); '
+                             'int8: dynamic-quantized linear layers, CPU only (default: torch)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='PyTorch intra-op threads (default: PyTorch default, one per core; '
+                             'with --workers: the cores of each worker)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes, each with its own model and cores; >1 runs a supervisor '
+                             'that routes each connection to the least loaded worker (default: 1)')
+    parser.add_argument('--worker-port-base', type=int, default=WORKER_PORT_BASE,
+                        help=f'First local port used by the workers (default: {WORKER_PORT_BASE})')
+    parser.add_argument('--no-adaptive-chunks', action='store_true',
+                        help=f'Keep the {MAX_BUFFER_SECONDS}s window and do not recommend longer chunk '
+                             f'intervals under load')
+    parser.add_argument('--no-translation', action='store_true',
+                        help='Do not offer translation of the committed segments to clients')
+    parser.add_argument('--session-ttl', type=float, default=SESSION_TTL_SECONDS,
+                        help=f'Seconds a disconnected session waits to be resumed (default: {SESSION_TTL_SECONDS})')
+    parser.add_argument('--max-sessions', type=int, default=SESSION_MAX_SESSIONS,
+                        help=f'Resumable sessions kept per process; the least recently used disconnected '
+                             f'ones are dropped first (default: {SESSION_MAX_SESSIONS})')
+    parser.add_argument('--cpus', help='Pin this process to these CPUs (comma separated; set by the supervisor)')
+    return parser.parse_args()
+
+async def main(args):
+    global processor, sessions, chunk_tuner
+    if args.workers > 1:
+        await run_supervisor(args)
+        return
+    if args.cpus:
+        os.sched_setaffinity(0, [int(cpu) for cpu in args.cpus.split(",")])
+
+    host = args.host
+    port = args.port
+    extra_models = args.extra_models + ([args.partial_model] if args.partial_model else [])
+    processor = AudioProcessor(model_size=args.model, model_sizes=extra_models,
+                               inference_workers=args.inference_workers,
+                               backend=args.backend, threads=args.threads)
+    if not args.no_batching:
+        processor.enable_batching(args.batch_wait_ms, args.max_batch_size)
+    if not args.no_translation:
+        processor.enable_translation(TRANSLATION_TARGETS[0])
+    sessions = SessionStore(args.session_ttl, args.max_sessions)
+    chunk_tuner = ChunkTuner(enabled=not args.no_adaptive_chunks)
     logger.info("=============================================")
     logger.info("in-memory audio processing server started")
     logger.info(f"address: ws://{host}:{port}")
-    logger.info(f"buffer size: {MAX_BUFFER_SECONDS}s window, {OVERLAP_SECONDS}s overlap")
+    logger.info(f"buffer size: {MAX_BUFFER_SECONDS}s window, {OVERLAP_SECONDS}s overlap"
+                f"{'' if args.no_adaptive_chunks else f' (adaptive up to {CHUNK_PROFILES[-1][1]}s window, {CHUNK_PROFILES[-1][0]} ms chunks)'}")
+    logger.info(f"streaming mode: {args.streaming_mode}, vad: {'off' if args.no_vad else 'energy'}")
+    logger.info(f"sessions: resumable for {args.session_ttl:.0f}s, up to {args.max_sessions}")
+    if processor.scheduler:
+        logger.info(f"batching: up to {args.max_batch_size} windows, {args.batch_wait_ms} ms wait")
+    else:
+        logger.info("batching: disabled")
+    if processor.translator:
+        logger.info(f"translation: committed segments to {processor.translator.target}, "
+                    f"up to {TRANSLATION_MAX_BATCH_SIZE} per batch, {TRANSLATION_BATCH_WAIT_MS} ms wait")
+    else:
+        logger.info("translation: disabled")
+    logger.info(f"backend: {processor.backend.name} on {processor.device}, {processor.threads} threads")
+    logger.info(f"models: {', '.join(processor.registry.sizes)} (default: {args.model}, "
+                f"partials: {args.partial_model or args.model} greedy, finals: beam {FINAL_BEAM_SIZE})")
     logger.info("=============================================")
-    async with websockets.serve(handler, host, port):
-        await asyncio.Future()
+
+    if args.http_port:
+        await asyncio.start_server(handle_http, host, args.http_port)
+        logger.info(f"http endpoint: http://{host}:{args.http_port}/ready")
+
+    # Carga antecipada (com aquecimento) antes de aceitar conexões
+    await processor.initialize_models()
+
+    session_handler = functools.partial(
+        handler,
+        streaming_mode=args.streaming_mode,
+        use_vad=not args.no_vad,
+        partial_model=args.partial_model,
+    )
+    try:
+        async with websockets.serve(session_handler, host, port):
+            await asyncio.Future()
+    finally:
+        processor.shutdown()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
-        logger.info("server shut down.")
\ No newline at end of file
+        logger.info("server shut down.")